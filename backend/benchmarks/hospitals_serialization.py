@@ -0,0 +1,124 @@
+"""
+Benchmark de la serialización de /hospitals (costo por fila).
+
+Compara, sobre db/hospitals.csv cargado en SQLite con las columnas de volumen
+en REAL (como init.sql):
+- antes: lo que hace FastAPI con response_model, validar cada fila con
+  HospitalResponse (from_attributes), volcarla a JSON y json.dumps;
+- después: la vía rápida de routes.py (_hospitals_select + orjson).
+También mide los endpoints completos con TestClient.
+
+Uso (desde backend/):
+
+    python -m benchmarks.hospitals_serialization [--repeat 30]
+"""
+import argparse
+import os
+import statistics
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List
+
+import pandas as pd
+
+# database.py se configura contra PostgreSQL al importarse salvo bajo pytest;
+# el benchmark usa la misma marca y configura SQLite en memoria en main()
+os.environ.setdefault("PYTEST_CURRENT_TEST", "benchmarks.hospitals_serialization")
+
+CSV_PATH = Path(__file__).resolve().parents[2] / "db" / "hospitals.csv"
+SQLITE_URL = "sqlite:///:memory:?check_same_thread=false"
+
+
+def _median_seconds(fn, repeat: int) -> float:
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def _load_hospitals(engine):
+    """Carga el CSV en hospitals; pandas crea las columnas de volumen como REAL."""
+    from sqlalchemy import text
+
+    from routes import HOSPITAL_RESPONSE_FIELDS
+
+    df = pd.read_csv(CSV_PATH)
+    for col in HOSPITAL_RESPONSE_FIELDS:
+        if col not in df:
+            df[col] = None
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS hospitals"))
+    df.to_sql("hospitals", engine, index=False)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE UNIQUE INDEX idx_hospitals_año_hospital_id ON hospitals (año, hospital_id)"))
+
+
+def bench_serialization(repeat: int):
+    """Solo la serialización: validación de response_model vs tuplas a orjson."""
+    import orjson
+    from fastapi.responses import JSONResponse
+    from pydantic import TypeAdapter
+
+    import routes
+    from database import database, schemas
+
+    with database.engine.connect() as conn:
+        rows = conn.execute(routes._hospitals_select()).all()
+    objects = [SimpleNamespace(**dict(zip(routes.HOSPITAL_RESPONSE_FIELDS, row))) for row in rows]
+    adapter = TypeAdapter(List[schemas.HospitalResponse])
+
+    def antes():
+        validated = adapter.validate_python(objects, from_attributes=True)
+        return JSONResponse(adapter.dump_python(validated, mode="json")).body
+
+    def despues():
+        return orjson.dumps([routes._record(row) for row in rows])
+
+    for fn in (antes, despues):
+        seconds = _median_seconds(fn, repeat)
+        print(f"serialización {fn.__name__:8s} {seconds * 1e3:8.2f} ms  "
+              f"{seconds / len(rows) * 1e6:6.2f} us/fila ({len(rows)} filas)")
+
+
+def bench_endpoints(repeat: int):
+    """Endpoints completos (consulta + serialización + ETag) con TestClient."""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from database import versioning
+    from routes import app as routes_app
+
+    versioning.POLL_SECONDS = 3600
+    app = FastAPI()
+    app.include_router(routes_app)
+    client = TestClient(app)
+    for url in ("/hospitals?year=2014", "/hospitals", "/hospitals?limit=5000", "/hospitals/101100"):
+        response = client.get(url)
+        response.raise_for_status()
+        data = response.json()
+        n_rows = len(data) if isinstance(data, list) else 1
+        seconds = _median_seconds(lambda: client.get(url), repeat)
+        print(f"GET {url:24s} {n_rows:5d} filas  {seconds * 1e3:8.2f} ms  {seconds / n_rows * 1e6:7.1f} us/fila")
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de la serialización de /hospitals")
+    parser.add_argument("--repeat", type=int, default=30, help="Repeticiones por medición (mediana)")
+    args = parser.parse_args(argv)
+
+    from database import database
+
+    database.load_database_config(database_url=SQLITE_URL)
+    database.create_tables()
+    _load_hospitals(database.engine)
+    bench_serialization(args.repeat)
+    bench_endpoints(args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,3 +1,4 @@
+import logging
 import os
 import sys
 from sqlalchemy import create_engine, MetaData
@@ -67,6 +68,32 @@ def create_tables():
         raise RuntimeError("Database not configured. Call load_database_config() first.")
     Base.metadata.create_all(bind=engine)
 
+def ensure_hospital_key():
+    """
+    Bases creadas con versiones anteriores de init.sql tienen
+    idx_hospitals_año_hospital_id sin UNIQUE (create_all no toca índices de
+    tablas existentes); en PostgreSQL se recrea como único.
+    """
+    if engine is None:
+        raise RuntimeError("Database not configured. Call load_database_config() first.")
+    if engine.dialect.name != "postgresql":
+        return False
+    from sqlalchemy import text
+    from sqlalchemy.exc import SQLAlchemyError
+    try:
+        with engine.begin() as conn:
+            unique = conn.execute(text(
+                "SELECT i.indisunique FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                "WHERE c.relname = 'idx_hospitals_año_hospital_id'")).scalar()
+            if unique is False:
+                conn.execute(text("DROP INDEX idx_hospitals_año_hospital_id"))
+                conn.execute(text("CREATE UNIQUE INDEX idx_hospitals_año_hospital_id ON hospitals (año, hospital_id)"))
+                return True
+    except SQLAlchemyError as e:
+        # p. ej. (hospital_id, año) duplicados: se deja el índice como estaba
+        logging.getLogger(__name__).warning(f"No se pudo crear el índice único de hospitals: {e}")
+    return False
+
 def drop_tables():
     """Elimina todas las tablas de la base de datos (útil para tests)."""
     if engine is None:
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Numeric
+from sqlalchemy import Column, Integer, String, Float, Numeric, Text, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 from .database import Base # Importar Base desde el database.py local
 
@@ -7,6 +7,8 @@ from .database import Base # Importar Base desde el database.py local
 
 class Hospital(Base):
     __tablename__ = "hospitals"
+    # Un registro por hospital y año (clave de la paginación por cursor y de la ingesta)
+    __table_args__ = (Index("idx_hospitals_año_hospital_id", "año", "hospital_id", unique=True),)
 
     hospital_id = Column(Integer, primary_key=True, index=True)
     region_id = Column(Integer)
@@ -30,3 +32,40 @@ class Hospital(Base):
     letalidad = Column(Float)
     egresosfallecidos = Column(Float)
     region = Column(String)
+
+
+class EfficiencyRun(Base):
+    """Una especificación canónica (método, inputs, outputs) calculada para un año."""
+    __tablename__ = "efficiency_runs"
+
+    spec_hash = Column(String(40), primary_key=True)
+    año = Column(Integer, primary_key=True)
+    method = Column(String(8))
+    spec = Column(Text)                 # JSON de la especificación
+    data_hash = Column(String(40))      # huella de los datos con que se calculó
+    metrics = Column(Text)              # JSON con las métricas del cálculo
+    computed_at = Column(DateTime)
+
+
+class EfficiencyResult(Base):
+    """Puntaje precalculado de un hospital para una especificación y año."""
+    __tablename__ = "efficiency_results"
+    __table_args__ = (Index("idx_efficiency_results_spec", "spec_hash", "año"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    año = Column(Integer)
+    method = Column(String(8))
+    spec_hash = Column(String(40))
+    hospital_id = Column(Integer)
+    score = Column(Float)
+    percentil = Column(Integer)
+    slacks = Column(Text, nullable=True)  # JSON input → slack (solo DEA)
+
+
+class AppMetadata(Base):
+    """Pares clave-valor de la aplicación (p. ej. la versión de los datos)."""
+    __tablename__ = "app_metadata"
+
+    key = Column(String(64), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime)
@@ -0,0 +1,202 @@
+"""
+Versión de los datos de hospitales (tabla app_metadata, clave 'data_version').
+
+Entero monótono que se incrementa cada vez que cambian los datos; permite
+invalidar cachés y resultados precalculados sin comparar el contenido de la
+tabla. En PostgreSQL lo incrementa un trigger por sentencia sobre hospitals
+(install_trigger), una sola vez por transacción (marca local
+app.data_version_bumped), que además publica el nuevo valor con NOTIFY en el
+canal 'data_version'; sin el trigger (SQLite, bases antiguas) lo incrementa la
+ingesta masiva.
+
+El backend mantiene la versión vigente en memoria (current_data_version): un
+hilo escucha el canal con LISTEN y, si no hay escucha activa, se relee de la
+base como mucho cada DATA_VERSION_POLL_SECONDS.
+"""
+import logging
+import os
+import select
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+DATA_VERSION_KEY = "data_version"
+DATA_VERSION_CHANNEL = "data_version"
+POLL_SECONDS = float(os.getenv("DATA_VERSION_POLL_SECONDS", "5"))
+LISTEN_RETRY_SECONDS = 5.0
+
+# Trigger de PostgreSQL (mismo DDL que db/init.sql)
+TRIGGER_SQL = f"""
+CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+DECLARE
+    v INTEGER;
+BEGIN
+    -- Una vez por transacción: INSERT ... ON CONFLICT DO UPDATE dispara los
+    -- triggers de INSERT y de UPDATE, y una ingesta no debe contar doble
+    IF current_setting('app.data_version_bumped', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    PERFORM set_config('app.data_version_bumped', 'on', true);
+    INSERT INTO app_metadata (key, value, updated_at) VALUES ('{DATA_VERSION_KEY}', 1, now())
+    ON CONFLICT (key) DO UPDATE SET value = app_metadata.value + 1, updated_at = now()
+    RETURNING value INTO v;
+    PERFORM pg_notify('{DATA_VERSION_CHANNEL}', v::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS hospitals_data_version ON hospitals;
+CREATE TRIGGER hospitals_data_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON hospitals
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+"""
+
+_LOCK = threading.Lock()
+_cached = {"value": None, "checked": 0.0, "listening": False}
+_stop = threading.Event()
+_listener: threading.Thread | None = None
+
+
+def get_data_version(db: Session) -> int:
+    """Versión actual (0 si nunca se registró un cambio)."""
+    row = db.get(models.AppMetadata, DATA_VERSION_KEY, populate_existing=True)
+    return int(row.value) if row is not None else 0
+
+
+def trigger_installed(db: Session) -> bool:
+    """True si la base tiene el trigger de versión (solo PostgreSQL)."""
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return db.execute(text("SELECT 1 FROM pg_trigger WHERE tgname = 'hospitals_data_version'")).first() is not None
+
+
+def bump_data_version(db: Session) -> int:
+    """
+    Incrementa la versión dentro de la transacción del llamador (no hace
+    commit) y devuelve el nuevo valor. En PostgreSQL también lo notifica
+    (NOTIFY se entrega al confirmar la transacción).
+    """
+    row = db.get(models.AppMetadata, DATA_VERSION_KEY, with_for_update=True, populate_existing=True)
+    if row is None:
+        row = models.AppMetadata(key=DATA_VERSION_KEY, value=0)
+        db.add(row)
+    row.value = int(row.value) + 1
+    row.updated_at = datetime.utcnow()
+    db.flush()
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_notify(:channel, :value)"),
+                   {"channel": DATA_VERSION_CHANNEL, "value": str(row.value)})
+    return row.value
+
+
+def remember(version: int):
+    """Registra una versión conocida (notificación o commit propio) si es más nueva que la cacheada."""
+    with _LOCK:
+        if _cached["value"] is None or version > _cached["value"]:
+            _cached["value"] = int(version)
+        _cached["checked"] = time.monotonic()
+
+
+def current_data_version(db: Session | None = None) -> int:
+    """
+    Versión vigente para cachés HTTP y en memoria. Con el hilo LISTEN activo
+    no toca la base; sin él, la relee como mucho cada POLL_SECONDS. Si la
+    lectura falla devuelve la última conocida (o 0).
+    """
+    with _LOCK:
+        value, checked, listening = _cached["value"], _cached["checked"], _cached["listening"]
+    if value is not None and (listening or time.monotonic() - checked < POLL_SECONDS):
+        return value
+
+    from . import database
+
+    session = db if db is not None else database.SessionLocal()
+    try:
+        value = get_data_version(session)
+    except SQLAlchemyError as e:
+        session.rollback()
+        logger.warning(f"No se pudo leer la versión de datos: {e}")
+        return value or 0
+    finally:
+        if db is None:
+            session.close()
+    with _LOCK:
+        _cached["value"], _cached["checked"] = value, time.monotonic()
+    return value
+
+
+def install_trigger(engine) -> bool:
+    """Crea (o reemplaza) el trigger de versión en PostgreSQL; en otros motores no hace nada."""
+    if engine.dialect.name != "postgresql":
+        return False
+    try:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(TRIGGER_SQL)
+        return True
+    except SQLAlchemyError as e:
+        logger.warning(f"No se pudo instalar el trigger de versión de datos: {e}")
+        return False
+
+
+def _listen_loop(engine):
+    """Mantiene una conexión dedicada con LISTEN; se reconecta tras errores."""
+    while not _stop.is_set():
+        fairy = None
+        try:
+            fairy = engine.raw_connection()
+            fairy.detach()                        # conexión propia, fuera del pool
+            conn = fairy.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {DATA_VERSION_CHANNEL}")
+                cur.execute("SELECT value FROM app_metadata WHERE key = %s", (DATA_VERSION_KEY,))
+                row = cur.fetchone()
+            with _LOCK:
+                _cached["value"], _cached["checked"] = (int(row[0]) if row else 0), time.monotonic()
+                _cached["listening"] = True
+            logger.info(f"Escuchando cambios de datos en el canal '{DATA_VERSION_CHANNEL}'")
+            while not _stop.is_set():
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    remember(int(conn.notifies.pop(0).payload))
+        except Exception as e:
+            logger.warning(f"Escucha de versión de datos interrumpida: {e}")
+            _stop.wait(LISTEN_RETRY_SECONDS)
+        finally:
+            with _LOCK:
+                _cached["listening"] = False
+            if fairy is not None:
+                try:
+                    fairy.close()
+                except Exception:
+                    pass
+
+
+def start_listener(engine) -> bool:
+    """Inicia el hilo LISTEN en PostgreSQL (en otros motores se usa solo el sondeo)."""
+    global _listener
+    if engine.dialect.name != "postgresql" or (_listener is not None and _listener.is_alive()):
+        return False
+    _stop.clear()
+    _listener = threading.Thread(target=_listen_loop, args=(engine,), name="data-version-listen", daemon=True)
+    _listener.start()
+    return True
+
+
+def stop_listener():
+    """Detiene el hilo LISTEN (al apagar la aplicación)."""
+    global _listener
+    _stop.set()
+    if _listener is not None:
+        _listener.join(timeout=LISTEN_RETRY_SECONDS)
+        _listener = None
@@ -1,7 +1,9 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from database.database import load_database_config, create_tables
-from database import models
+from database import database, models, versioning
+from utils import pool, jobs, precompute
+from utils.compression import CompressionMiddleware
 import logging
 import os
 from dotenv import load_dotenv
@@ -26,8 +28,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Link"],
 )
 
+# Compresión gzip/brotli de respuestas grandes (los cuerpos repetidos se comprimen una vez)
+if os.getenv("COMPRESSION_ENABLED", "true").lower() not in ("0", "false", "no"):
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024")),
+        gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+        brotli_quality=int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5")),
+        cache_bytes=int(float(os.getenv("COMPRESSION_CACHE_MB", "64")) * 1024 * 1024),
+    )
+
 # Importar y registrar las rutas
 from routes import app as routes_app
 app.include_router(routes_app)
@@ -35,8 +48,25 @@ app.include_router(routes_app)
 # Evento de startup para inicializar la base de datos
 @app.on_event("startup")
 async def startup_event():
-    """Inicializar base de datos al iniciar la aplicación."""
+    """Inicializar base de datos y pool de workers al iniciar la aplicación."""
     create_tables()
+    database.ensure_hospital_key()
+    # Versión de datos: trigger sobre hospitals + escucha LISTEN/NOTIFY (solo PostgreSQL)
+    versioning.install_trigger(database.engine)
+    versioning.start_listener(database.engine)
+    precompute.upgrade_schema(database.engine)
+    # Pool persistente y precalentado para DEA/Malmquist/SFA (tamaño = cuota de CPU)
+    pool.start_pool()
+    # Resultados precalculados de las especificaciones canónicas (solo años con datos nuevos)
+    if os.getenv("PRECOMPUTE_ON_STARTUP", "true").lower() not in ("0", "false", "no"):
+        jobs.submit("recalculo-eficiencia", precompute.recompute_all)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Detener los trabajos en segundo plano, la escucha de versión y el pool de workers al apagar la aplicación."""
+    jobs.shutdown()
+    versioning.stop_listener()
+    pool.shutdown_pool()
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,13 +1,21 @@
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from typing import List
+from sqlalchemy import BigInteger, cast, select, text, tuple_
+from typing import List, get_args
+from operator import itemgetter
+import base64
 import logging
 import numpy as np
+import orjson
 import pandas as pd
 import utils.functions as utils
+from utils import http_cache, ingest, jobs, precompute
 import os
+import tempfile
+from urllib.parse import urlencode
 
 # --- Utilidad para limpiar NaN/inf de respuestas JSON ---
 def clean_floats_for_json(obj):
@@ -24,7 +32,7 @@ def clean_floats_for_json(obj):
         return obj
 
 from database.database import get_db
-from database import models, schemas
+from database import models, schemas, versioning
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -78,17 +86,137 @@ def check_db_status(db: Session = Depends(get_db)):
         return {
             "status": "connected", 
             "message": "Base de datos PostgreSQL conectada correctamente",
-            "result": result[0] if result else None
+            "result": result[0] if result else None,
+            "data_version": versioning.get_data_version(db)
         }
     except Exception as e:
         logger.error(f"Error connecting to database: {e}")
         return {"status": "error", "message": str(e)}
 
-@app.get("/hospitals", response_model=List[schemas.HospitalResponse])
+HOSPITALS_MAX_LIMIT = 5000
+NDJSON_BATCH_ROWS = 1000
+
+def _hospitals_conditions(year: int | None, region_id: int | None, complejidad: int | None) -> list:
+    """Filtros de /hospitals sobre la tabla (SQL directo: varias filas por hospital_id)."""
+    table = models.Hospital.__table__
+    conditions = []
+    if year is not None:
+        conditions.append(table.c.año == year)
+    if region_id is not None:
+        conditions.append(table.c.region_id == region_id)
+    if complejidad is not None:
+        conditions.append(table.c.complejidad == complejidad)
+    return conditions
+
+def _hospitals_not_found(year: int | None, region_id: int | None, complejidad: int | None) -> HTTPException:
+    """404 con mensaje descriptivo según los filtros aplicados."""
+    filters_applied = []
+    if year is not None:
+        filters_applied.append(f"año {year}")
+    if region_id is not None:
+        filters_applied.append(f"región {region_id}")
+    if complejidad is not None:
+        filters_applied.append(f"complejidad {complejidad}")
+
+    if filters_applied:
+        filter_message = " y ".join(filters_applied)
+        return HTTPException(
+            status_code=404, 
+            detail=f"No se encontraron hospitales para los filtros: {filter_message}."
+        )
+    return HTTPException(status_code=404, detail="No se encontraron hospitales.")
+
+def _encode_cursor(año: int, hospital_id: int) -> str:
+    """Cursor opaco con la última clave (año, hospital_id) entregada."""
+    return base64.urlsafe_b64encode(f"{año}:{hospital_id}".encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        año, hospital_id = raw.split(":")
+        return int(año), int(hospital_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido.")
+
+# Campos de HospitalResponse, en el orden del esquema: la vía rápida serializa
+# estas columnas sin pasar cada fila por Pydantic
+HOSPITAL_RESPONSE_FIELDS = list(schemas.HospitalResponse.model_fields)
+# Campos obligatorios del esquema: una fila con NULL en alguno no lo cumple
+_required_values = itemgetter(*(i for i, name in enumerate(HOSPITAL_RESPONSE_FIELDS)
+                                if schemas.HospitalResponse.model_fields[name].is_required()))
+
+def _schema_type(name: str):
+    """Tipo del campo en HospitalResponse, sin Optional."""
+    annotation = schemas.HospitalResponse.model_fields[name].annotation
+    args = [a for a in get_args(annotation) if a is not type(None)]
+    return args[0] if args else annotation
+
+def _hospitals_select():
+    """
+    Columnas de HospitalResponse con el tipo del esquema: los campos int se
+    castean en SQL porque init.sql declara consultas, remuneraciones, etc.
+    como REAL (sin el cast saldrían como 184208.0).
+    """
+    table = models.Hospital.__table__
+    return select(*(cast(table.c[name], BigInteger).label(name) if _schema_type(name) is int else table.c[name]
+                    for name in HOSPITAL_RESPONSE_FIELDS))
+
+def _record(row) -> dict:
+    """Fila como dict del esquema; si le falta un campo obligatorio la valida HospitalResponse (ValidationError)."""
+    if None in _required_values(row):
+        return schemas.HospitalResponse.model_validate(dict(zip(HOSPITAL_RESPONSE_FIELDS, row))).model_dump()
+    return dict(zip(HOSPITAL_RESPONSE_FIELDS, row))
+
+def _json_rows(rows, response: Response, single: bool = False) -> Response:
+    """
+    Tuplas de SQL directo a bytes JSON con orjson (NaN/inf → null), sin
+    validar fila por fila: los tipos ya vienen del SELECT (_hospitals_select)
+    y solo las filas con NULL en un campo obligatorio pasan por Pydantic.
+    Devolver un Response evita la validación de response_model, que sigue
+    documentando el esquema en OpenAPI; los encabezados de las dependencias
+    (ETag) se copian.
+    """
+    records = [_record(row) for row in rows]
+    content = orjson.dumps(records[0] if single else records)
+    return Response(content=content, media_type="application/json", headers=dict(response.headers))
+
+def _keyset_query(conditions: list, cursor: str | None, limit: int | None):
+    """SELECT ordenado por (año, hospital_id) que continúa después del cursor (índice idx_hospitals_año_hospital_id)."""
+    table = models.Hospital.__table__
+    query = _hospitals_select().where(*conditions).order_by(table.c.año, table.c.hospital_id)
+    if cursor is not None:
+        query = query.where(tuple_(table.c.año, table.c.hospital_id) > _decode_cursor(cursor))
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+def _stream_hospitals_ndjson(query):
+    """
+    Una línea JSON por registro, en bloques de NDJSON_BATCH_ROWS. Usa su propia
+    sesión (la de get_db se cierra antes de enviar el cuerpo) y un cursor del
+    lado del servidor (stream_results), así que la memoria no depende del
+    tamaño de la tabla.
+    """
+    from database import database
+
+    db = database.SessionLocal()
+    try:
+        result = db.execute(query.execution_options(stream_results=True, yield_per=NDJSON_BATCH_ROWS))
+        for rows in result.partitions():
+            yield b"".join(orjson.dumps(_record(row)) + b"\n" for row in rows)
+    finally:
+        db.close()
+
+@app.get("/hospitals", response_model=List[schemas.HospitalResponse], dependencies=[Depends(http_cache.data_etag)])
 def get_all_hospitals_data(
+    response: Response,
     year: int = None, 
     region_id: int = None, 
     complejidad: int = None,
+    limit: int = Query(default=None, ge=1, le=HOSPITALS_MAX_LIMIT,
+                       description="Tamaño de página (paginación por (año, hospital_id))"),
+    cursor: str = Query(default=None, description="Cursor de la página anterior (encabezado X-Next-Cursor)"),
+    format: str = Query(default="json", description="json o ndjson (streaming, un registro por línea)"),
     db: Session = Depends(get_db)
 ):
     """
@@ -101,6 +229,12 @@ def get_all_hospitals_data(
         year: Año de los datos hospitalarios (ej: 2014, 2015, 2016)
         region_id: ID de región administrativa de Chile (1-15)
         complejidad: Nivel de complejidad hospitalaria (1=Baja, 2=Media, 3=Alta)
+        limit: Con limit o cursor se pagina por la clave (año, hospital_id); si
+            quedan registros, X-Next-Cursor y Link (rel="next") apuntan a la
+            página siguiente
+        cursor: Cursor devuelto por la página anterior
+        format: ndjson transmite los registros (ordenados por año y hospital)
+            con un cursor del lado del servidor; admite limit y cursor
     
     Returns:
         Lista de hospitales con datos de:
@@ -114,44 +248,43 @@ def get_all_hospitals_data(
         - GET /hospitals?year=2014 -> Hospitales con datos del año 2014
         - GET /hospitals?year=2014&region_id=15 -> Hospitales 2014 en Región de Arica
         - GET /hospitals?complejidad=3 -> Solo hospitales de alta complejidad
+        - GET /hospitals?limit=500 -> Primera página; la siguiente con ?limit=500&cursor=...
+        - GET /hospitals?format=ndjson -> Todos los registros en streaming
     """
     try:
-        # Crear la consulta base
-        query = db.query(models.Hospital)
-        
-        # Aplicar filtros si se proporcionan
-        if year is not None:
-            query = query.filter(models.Hospital.año == year)
-            
-        if region_id is not None:
-            query = query.filter(models.Hospital.region_id == region_id)
-            
-        if complejidad is not None:
-            query = query.filter(models.Hospital.complejidad == complejidad)
-        
-        # Ejecutar la consulta
-        hospitals = query.all()
+        if format not in ("json", "ndjson"):
+            raise HTTPException(status_code=400, detail="format debe ser 'json' o 'ndjson'.")
+        conditions = _hospitals_conditions(year, region_id, complejidad)
+
+        if format == "ndjson":
+            query = _keyset_query(conditions, cursor, limit)
+            if cursor is None and db.execute(query.limit(1)).first() is None:
+                raise _hospitals_not_found(year, region_id, complejidad)
+            return StreamingResponse(_stream_hospitals_ndjson(query), media_type="application/x-ndjson",
+                                     headers=dict(response.headers))
+
+        if limit is not None or cursor is not None:
+            page_size = limit or HOSPITALS_MAX_LIMIT
+            rows = db.execute(_keyset_query(conditions, cursor, page_size + 1)).all()
+            if not rows and cursor is None:
+                raise _hospitals_not_found(year, region_id, complejidad)
+            if len(rows) > page_size:
+                rows = rows[:page_size]
+                last = dict(zip(HOSPITAL_RESPONSE_FIELDS, rows[-1]))
+                next_cursor = _encode_cursor(last["año"], last["hospital_id"])
+                params = {k: v for k, v in {"year": year, "region_id": region_id, "complejidad": complejidad,
+                                            "limit": page_size, "cursor": next_cursor}.items() if v is not None}
+                response.headers["X-Next-Cursor"] = next_cursor
+                response.headers["Link"] = f'</hospitals?{urlencode(params)}>; rel="next"'
+            return _json_rows(rows, response)
+
+        # Consulta completa con los filtros aplicados (un registro por hospital y año)
+        hospitals = db.execute(_keyset_query(conditions, None, None)).all()
         
         if not hospitals:
-            # Crear mensaje de error descriptivo basado en los filtros aplicados
-            filters_applied = []
-            if year is not None:
-                filters_applied.append(f"año {year}")
-            if region_id is not None:
-                filters_applied.append(f"región {region_id}")
-            if complejidad is not None:
-                filters_applied.append(f"complejidad {complejidad}")
-            
-            if filters_applied:
-                filter_message = " y ".join(filters_applied)
-                raise HTTPException(
-                    status_code=404, 
-                    detail=f"No se encontraron hospitales para los filtros: {filter_message}."
-                )
-            else:
-                raise HTTPException(status_code=404, detail="No se encontraron hospitales.")
+            raise _hospitals_not_found(year, region_id, complejidad)
             
-        return hospitals
+        return _json_rows(hospitals, response)
         
     except HTTPException:
         raise  # Re-lanzar HTTPExceptions
@@ -162,8 +295,8 @@ def get_all_hospitals_data(
             detail="Error interno del servidor al procesar la solicitud."
         )
 
-@app.get("/hospitals/{hospital_id}", response_model=schemas.HospitalResponse)
-def get_hospital_by_id(hospital_id: int, db: Session = Depends(get_db)):
+@app.get("/hospitals/{hospital_id}", response_model=schemas.HospitalResponse, dependencies=[Depends(http_cache.data_etag)])
+def get_hospital_by_id(hospital_id: int, response: Response, db: Session = Depends(get_db)):
     """
     Obtiene un hospital específico por su ID.
     
@@ -174,7 +307,9 @@ def get_hospital_by_id(hospital_id: int, db: Session = Depends(get_db)):
         Datos completos del hospital solicitado
     """
     try:
-        hospital = db.query(models.Hospital).filter(models.Hospital.hospital_id == hospital_id).first()
+        table = models.Hospital.__table__
+        hospital = db.execute(_hospitals_select().where(table.c.hospital_id == hospital_id)
+                              .order_by(table.c.año).limit(1)).first()
         
         if not hospital:
             raise HTTPException(
@@ -182,20 +317,72 @@ def get_hospital_by_id(hospital_id: int, db: Session = Depends(get_db)):
                 detail=f"Hospital con ID {hospital_id} no encontrado."
             )
             
-        return hospital
+        return _json_rows([hospital], response, single=True)
         
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error al obtener hospital con ID {hospital_id}: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor.")
-    
+
+INGEST_SPOOL_BYTES = 16 * 1024 * 1024
+
+@app.post("/hospitals/ingest")
+async def ingestar_hospitales(
+    request: Request,
+    format: str | None = Query(default=None, description="csv o parquet (por defecto, según Content-Type)"),
+    chunksize: int = Query(default=ingest.DEFAULT_CHUNKSIZE, ge=100, le=100000,
+                           description="Filas por bloque de validación y copia"),
+    dry_run: bool = Query(default=False, description="Solo validar, sin escribir"),
+    recompute: bool = Query(default=True, description="Encolar el recálculo de eficiencias precalculadas"),
+    db: Session = Depends(get_db)
+):
+    """
+    Carga masiva de datos de hospitales. El cuerpo es el archivo CSV o Parquet
+    completo (no multipart); se valida por bloques y se fusiona por
+    (hospital_id, año): actualiza los registros existentes e inserta los nuevos
+    en una sola transacción. Si alguna fila es inválida no se escribe nada y se
+    responde 400 con los errores por fila. Si cambian datos se incrementa la
+    versión de datos y se encola el recálculo de resultados precalculados.
+    """
+    fmt = format
+    if fmt is None:
+        content_type = request.headers.get("content-type", "")
+        fmt = "parquet" if "parquet" in content_type or "octet-stream" in content_type else "csv"
+    if fmt not in ingest.INGEST_FORMATS:
+        raise HTTPException(status_code=400,
+                            detail=f"Formato no soportado: {fmt}. Use uno de {list(ingest.INGEST_FORMATS)}")
+
+    try:
+        # El cuerpo se copia a un archivo temporal (en memoria hasta INGEST_SPOOL_BYTES)
+        with tempfile.SpooledTemporaryFile(max_size=INGEST_SPOOL_BYTES) as spool:
+            async for block in request.stream():
+                spool.write(block)
+            spool.seek(0)
+            summary = await run_in_threadpool(ingest.ingest_file, db, spool, fmt, chunksize, dry_run)
+
+        if summary["total_errores"]:
+            raise HTTPException(status_code=400, detail=clean_floats_for_json(summary))
+        if recompute and not dry_run and (summary["actualizadas"] or summary["insertadas"]):
+            job = jobs.submit("recalculo-eficiencia", precompute.recompute_all)
+            summary["job_recalculo"] = job.id
+        return summary
+
+    except HTTPException:
+        raise
+    except ingest.IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error en la ingesta de hospitales: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor al ingerir los datos.")
+
 # usar funcion sf calculate_sfa_metrics de utls/functions.py con hospitales filtrados 2014
-@app.get("/sfa")
+@app.get("/sfa", dependencies=[Depends(http_cache.data_etag)])
 def run_sfa(
     year: int = 2014,
     input_cols: str = Query(default='bienesyservicios,remuneraciones,diascamadisponibles'),
     output_cols: str = Query(default='consultas'),
+    n_starts: int = Query(default=1, ge=1, le=16),
     db: Session = Depends(get_db)
 ):
     """
@@ -209,10 +396,14 @@ def run_sfa(
         year: Año de análisis de hospitales (por defecto 2014)
         input_cols: Inputs hospitalarios separados por comas (recursos)
         output_cols: Outputs hospitalarios separados por comas (productos)
+        n_starts: Nº de valores iniciales de lambda optimizados en paralelo
+                  (evita óptimos degenerados con lambda≈0 en años con pocos datos)
     
     Returns:
         - results: Datos de hospitales con eficiencia técnica SFA calculada
         - metrics: Métricas del análisis (ET promedio, % críticos, variable clave)
+          y diagnósticos de convergencia del optimizador en `convergencia`;
+          `precalculado` indica si se leyó de efficiency_results
     
     Inputs típicos:
         - bienesyservicios: Gasto en bienes y servicios
@@ -252,8 +443,16 @@ def run_sfa(
                 detail=f"Columnas no encontradas. Inputs faltantes: {missing_inputs}, Outputs faltantes: {missing_outputs}"
             )
 
-        # Ejecutar SFA
-        df_out, metrics = utils.calculate_sfa_metrics(df, input_cols_list, output_cols_list)
+        # Resultados precalculados si la especificación es canónica y los datos no cambiaron
+        spec = precompute.make_spec("SFA", input_cols_list, output_cols_list, n_starts=n_starts)
+        cached = precompute.load(db, year, spec, df)
+        if cached is not None:
+            df_out, metrics = cached
+        else:
+            # Ejecutar SFA
+            df_out, metrics = utils.calculate_sfa_metrics(df, input_cols_list, output_cols_list,
+                                                          n_starts=n_starts, n_jobs=-1)
+        metrics['precalculado'] = cached is not None
 
         # Convertir resultados a lista de diccionarios para respuesta JSON
         results = df_out.to_dict(orient='records')
@@ -272,7 +471,7 @@ def run_sfa(
         logger.error(f"Error al ejecutar SFA: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor al procesar el análisis SFA.")
     
-@app.get("/dea")
+@app.get("/dea", dependencies=[Depends(http_cache.data_etag)])
 def run_dea(
     year: int = 2014,
     input_cols: str = Query(default='bienesyservicios,remuneraciones,diascamadisponibles'),
@@ -293,7 +492,8 @@ def run_dea(
     
     Returns:
         - results: Datos de hospitales con eficiencia técnica DEA calculada
-        - metrics: Métricas del análisis (ET promedio, % críticos, variable slack clave)
+        - metrics: Métricas del análisis (ET promedio, % críticos, variable slack clave);
+          `precalculado` indica si se leyó de efficiency_results
     
     Ventajas del DEA:
         - No requiere forma funcional específica
@@ -329,8 +529,15 @@ def run_dea(
                 detail=f"Columnas no encontradas. Inputs faltantes: {missing_inputs}, Outputs faltantes: {missing_outputs}"
             )
         
-        # Ejecutar DEA
-        df_out, metrics = utils.calculate_dea_metrics(df, input_cols_list, output_cols_list)
+        # Resultados precalculados si la especificación es canónica y los datos no cambiaron
+        spec = precompute.make_spec("DEA", input_cols_list, output_cols_list)
+        cached = precompute.load(db, year, spec, df)
+        if cached is not None:
+            df_out, metrics = cached
+        else:
+            # Ejecutar DEA
+            df_out, metrics = utils.calculate_dea_metrics(df, input_cols_list, output_cols_list)
+        metrics['precalculado'] = cached is not None
 
         # Convertir resultados a lista de diccionarios para respuesta JSON
         results = df_out.to_dict(orient='records')
@@ -349,7 +556,86 @@ def run_dea(
         logger.error(f"Error al ejecutar DEA: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor al procesar el análisis DEA.")
 
-@app.get("/pca-clustering")
+@app.post("/efficiency-results/recompute", status_code=202)
+def recalcular_eficiencias(
+    force: bool = Query(default=False, description="Recalcular aunque los datos no hayan cambiado")
+):
+    """
+    Encola el pipeline que recalcula las especificaciones canónicas de DEA y
+    SFA para todos los años y las guarda en efficiency_results. Por defecto
+    solo recalcula los años cuyos datos cambiaron. El avance se consulta en
+    GET /jobs/{job_id}.
+    """
+    job = jobs.submit("recalculo-eficiencia", precompute.recompute_all, force=force)
+    logger.info(f"Recálculo de eficiencias encolado: job {job.id}")
+    return job.to_dict()
+
+
+PANEL_CHUNK_ROWS = 500
+
+def _run_pca_clustering_panel(db: Session, feature_cols_list: List[str], n_components: int,
+                              k: int, k_max: int, scale: bool, random_state: int,
+                              criterion: str):
+    """PCA + clustering de todas las observaciones hospital-año (modo years=all de /pca-clustering)."""
+    valid_cols = set(models.Hospital.__table__.columns.keys())
+    missing = [col for col in feature_cols_list if col not in valid_cols]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Columnas no encontradas: {missing}")
+
+    sql = text(f"""
+        SELECT hospital_id, año, {', '.join(feature_cols_list)}
+        FROM hospitals
+        ORDER BY año, hospital_id
+    """)
+
+    def chunk_source():
+        # Cursor del lado del servidor: la tabla se lee por bloques en cada etapa
+        conn = db.connection().execution_options(stream_results=True)
+        return pd.read_sql_query(sql, conn, chunksize=PANEL_CHUNK_ROWS)
+
+    try:
+        df_out, meta = utils.pca_kmeans_panel(
+            chunk_source, feature_cols_list,
+            n_components=n_components, k=k, k_max=k_max, scale=scale,
+            random_state=random_state, criterion=criterion
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    names = dict(db.execute(text("SELECT DISTINCT hospital_id, hospital_name FROM hospitals")).fetchall())
+    df_out['hospital_name'] = df_out['hospital_id'].map(names)
+
+    labels = list(range(meta['k']))
+    sizes = meta['cluster_sizes_by_year']
+    return {
+        "results": df_out.to_dict(orient='records'),
+        "metrics": {
+            'mode': 'panel',
+            'years': meta['years'],
+            'feature_cols': feature_cols_list,
+            'n_components': n_components,
+            'k_clusters': meta['k'],
+            'criterion': criterion,
+            'k_scores': meta['k_scores'],
+            'explained_variance_ratio': meta['explained_variance_ratio'],
+            'total_variance_explained': sum(meta['explained_variance_ratio']),
+            'scale_applied': scale,
+            'random_state': random_state,
+            'n_observations': meta['n_observations'],
+            'n_transitions': meta['n_transitions']
+        },
+        "components_matrix": meta['components'].to_dict(orient='index'),
+        "cluster_centers": meta['cluster_centers'].to_dict(orient='index'),
+        "cluster_sizes_by_year": {int(year): {int(c): int(n) for c, n in row.items()}
+                                  for year, row in sizes.iterrows()},
+        "transition_matrix": {
+            "labels": labels,
+            "counts": meta['transition_counts'].tolist(),
+            "probabilities": meta['transition_matrix'].tolist()
+        }
+    }
+
+@app.get("/pca-clustering", dependencies=[Depends(http_cache.data_etag)])
 def run_pca_clustering(
     year: int = 2014,
     input_cols: str = Query(default='bienesyservicios,remuneraciones,diascamadisponibles'),
@@ -360,6 +646,12 @@ def run_pca_clustering(
     k_max: int = Query(default=10, ge=2, le=20),
     scale: bool = Query(default=True),
     random_state: int = Query(default=42),
+    criterion: str = Query(default='silhouette', description="Criterio para elegir k: 'silhouette', 'calinski_harabasz', 'davies_bouldin' o 'gap'"),
+    years: str = Query(default=None, description="'all' ⇒ todas las observaciones hospital-año del panel"),
+    stability: int = Query(default=0, ge=0, le=1000, description="Nº de remuestreos para estabilidad (0 ⇒ no se calcula)"),
+    stability_mode: str = Query(default='bootstrap', description="'bootstrap', 'seeds' o 'both'"),
+    algorithm: str = Query(default='kmeans', description="'kmeans' o 'ward' (jerárquico con árbol cacheado)"),
+    dendrogram: bool = Query(default=False, description="Con algorithm='ward', incluir la matriz de enlace"),
     db: Session = Depends(get_db)
 ):
     """
@@ -391,6 +683,19 @@ def run_pca_clustering(
         k_max: Máximo número de clusters para auto-selección
         scale: Estandarización previa al PCA
         random_state: Semilla de reproducibilidad
+        criterion: Criterio de selección de k; 'calinski_harabasz' y
+            'davies_bouldin' son O(n·k), útiles para paneles grandes
+        years: 'all' agrupa cada hospital-año de toda la tabla (ignora year y
+            method) con PCA incremental y MiniBatchKMeans por bloques, y
+            devuelve la matriz de transición entre clusters de años consecutivos
+        stability: Nº de reajustes para medir la estabilidad de los clusters
+            (en el pool de workers); agrega a cada hospital 'stability',
+            'consensus_cluster' y 'coassignment'
+        stability_mode: 'bootstrap' (remuestreo de hospitales), 'seeds'
+            (distintas semillas de K-means) o 'both'
+        algorithm: 'kmeans' o 'ward'; con Ward el árbol se calcula una vez
+            por año, variables, escala y n_components, y otro k solo lo recorta
+        dendrogram: devolver el dendrograma cacheado (matriz de enlace de scipy)
     
     Returns:
         - results: Hospitales con asignación de clusters y componentes principales
@@ -401,9 +706,41 @@ def run_pca_clustering(
         # Convertir strings separados por comas a listas
         input_cols_list = [col.strip() for col in input_cols.split(',')]
         output_cols_list = [col.strip() for col in output_cols.split(',')]
+
+        if criterion not in utils.CLUSTER_CRITERIA:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Criterio no válido: {criterion}. Use uno de {list(utils.CLUSTER_CRITERIA)}."
+            )
         
         # Crear feature_cols_list como la unión de inputs y outputs
         feature_cols_list = input_cols_list + output_cols_list
+
+        if stability_mode not in utils.STABILITY_MODES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"stability_mode no válido: {stability_mode}. Use uno de {list(utils.STABILITY_MODES)}."
+            )
+
+        if algorithm not in utils.CLUSTER_ALGORITHMS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Algoritmo no válido: {algorithm}. Use uno de {list(utils.CLUSTER_ALGORITHMS)}."
+            )
+        if algorithm != 'kmeans' and (stability or years is not None):
+            raise HTTPException(
+                status_code=400,
+                detail="La estabilidad y years='all' solo están disponibles con algorithm='kmeans'."
+            )
+
+        if years is not None:
+            if years != 'all':
+                raise HTTPException(status_code=400, detail="years solo admite el valor 'all'.")
+            if stability:
+                raise HTTPException(status_code=400, detail="El análisis de estabilidad no está disponible con years='all'.")
+            return clean_floats_for_json(_run_pca_clustering_panel(
+                db, feature_cols_list, n_components, k, k_max, scale, random_state, criterion
+            ))
         
         # Obtener hospitales del año especificado
         hospitals = db.query(models.Hospital).filter(models.Hospital.año == year).all()
@@ -479,16 +816,33 @@ def run_pca_clustering(
                 detail=f"Método no válido: {method}. Use 'DEA' o 'SFA'."
             )
         
-        # Ejecutar PCA + K-means (solo con las variables de entrada, no incluir eficiencia en PCA)
-        df_out, cluster_meta = utils.pca_kmeans(
+        # Ejecutar PCA + K-means o Ward (solo con las variables de entrada, no incluir eficiencia en PCA)
+        cluster_fn = utils.pca_ward if algorithm == 'ward' else utils.pca_kmeans
+        df_out, cluster_meta = cluster_fn(
             df=df_with_efficiency,
             feature_cols=feature_cols_list,
             n_components=n_components,
             k=k,
             k_max=min(k_max, len(df_with_efficiency)),  # Asegurar que k_max no exceda el número de hospitales
             scale=scale,
-            random_state=random_state
+            random_state=random_state,
+            criterion=criterion
         )
+
+        # Estabilidad de la segmentación (remuestreos en el pool de workers)
+        stability_meta = None
+        if stability:
+            df_stab, stability_meta = utils.cluster_stability(
+                df=df_with_efficiency,
+                feature_cols=feature_cols_list,
+                labels=df_out['cluster'].to_numpy(),
+                n_components=n_components,
+                scale=scale,
+                random_state=random_state,
+                n_resamples=stability,
+                mode=stability_mode
+            )
+            df_out = df_out.join(df_stab)
         
         # Convertir resultados a lista de diccionarios para respuesta JSON
         results = df_out.to_dict(orient='records')
@@ -503,6 +857,9 @@ def run_pca_clustering(
             'n_components': n_components,
             'k_clusters': cluster_meta['k'],
             'silhouette_score': cluster_meta['silhouette'],
+            'algorithm': algorithm,
+            'criterion': criterion,
+            'k_scores': cluster_meta['k_scores'],  # curvas de todos los criterios por k
             'explained_variance_ratio': cluster_meta['explained_variance_ratio'],
             'total_variance_explained': sum(cluster_meta['explained_variance_ratio']),
             'scale_applied': scale,
@@ -510,6 +867,14 @@ def run_pca_clustering(
             'n_hospitals': len(df_out),
             'efficiency_metrics': efficiency_metrics
         }
+        if stability_meta is not None:
+            metrics['stability'] = {
+                'n_resamples': stability_meta['n_resamples'],
+                'mode': stability_meta['mode'],
+                'mean_stability': stability_meta['mean_stability'],
+                'cluster_stability': stability_meta['cluster_stability'],
+                'reference_agreement': stability_meta['reference_agreement']
+            }
         
         # Convertir matriz de componentes a formato serializable
         components_matrix = cluster_meta['components'].to_dict(orient='index')
@@ -530,13 +895,19 @@ def run_pca_clustering(
         logger.info(f"PCA + Clustering ejecutado para {year}: {cluster_meta['k']} clusters, "
                    f"silhouette={cluster_meta['silhouette']:.3f}, método={method}")
         
-        return clean_floats_for_json({
+        response = {
             "results": results,
             "metrics": metrics,
             "components_matrix": components_matrix,
             "cluster_centers": cluster_centers,
             "cluster_summary": cluster_summary
-        })
+        }
+        if algorithm == 'ward' and dendrogram:
+            response["dendrogram"] = {
+                "linkage": cluster_meta['linkage'].tolist(),
+                "hospital_ids": df_out['hospital_id'].tolist()
+            }
+        return clean_floats_for_json(response)
         
     except HTTPException:
         raise
@@ -544,12 +915,15 @@ def run_pca_clustering(
         logger.error(f"Error al ejecutar PCA + Clustering: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor al procesar el análisis PCA + Clustering: {str(e)}")
 
-@app.get("/pca")
+@app.get("/pca", dependencies=[Depends(http_cache.data_etag)])
 def run_pca(
     year: int = 2014,
     feature_cols: str = Query(default='bienesyservicios,remuneraciones,diascamadisponibles,consultas'),
     n_components: int = Query(default=2, ge=1, le=10),
     scale: bool = Query(default=True),
+    basis_year: int = Query(default=None, description="Año cuya base de componentes se usa para proyectar `year`"),
+    solver: str = Query(default='auto', description="'auto', 'exact' o 'randomized' (SVD truncada)"),
+    float32: bool = Query(default=False, description="Calcular en precisión simple"),
     db: Session = Depends(get_db)
 ):
     """
@@ -569,6 +943,12 @@ def run_pca(
         feature_cols: Variables hospitalarias para análisis PCA
         n_components: Número de componentes principales a extraer
         scale: Estandarización previa (recomendado para variables heterogéneas)
+        basis_year: Si se indica, escalado y componentes se ajustan sobre ese
+            año y los hospitales de `year` se proyectan en la misma base,
+            comparable entre años (la varianza explicada es la del año base)
+        solver: 'auto' usa SVD truncada aleatorizada para matrices anchas o
+            grandes con pocas componentes y SVD exacta en el resto
+        float32: Precisión simple (mitad de memoria)
     
     Returns:
         - results: Datos originales con componentes principales agregados
@@ -583,6 +963,12 @@ def run_pca(
     try:
         # Convertir string separado por comas a lista
         feature_cols_list = [col.strip() for col in feature_cols.split(',')]
+
+        if solver not in utils.PCA_SOLVERS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Solver no válido: {solver}. Use uno de {list(utils.PCA_SOLVERS)}."
+            )
         
         # Obtener hospitales del año especificado
         hospitals = db.query(models.Hospital).filter(models.Hospital.año == year).all()
@@ -606,12 +992,30 @@ def run_pca(
                 detail=f"Columnas no encontradas para PCA: {missing_features}. Columnas disponibles: {list(df.columns)}"
             )
         
-        # Ejecutar PCA
+        # Base común de otro año (opcional) para comparar entre años
+        basis_df = None
+        if basis_year is not None and basis_year != year:
+            # SQL directo: el mapa de identidad del ORM confundiría registros del
+            # mismo hospital_id en años distintos dentro de la sesión
+            basis_df = pd.read_sql_query(
+                text("SELECT * FROM hospitals WHERE año = :year"),
+                db.connection(), params={"year": basis_year}
+            )
+            if basis_df.empty:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"No se encontraron hospitales para el año base {basis_year}."
+                )
+
+        # Ejecutar PCA (la base ajustada queda cacheada; llamadas repetidas solo proyectan)
         df_pca, pca_meta = utils.run_pca(
             df=df,
             feature_cols=feature_cols_list,
             n_components=n_components,
-            scale=scale
+            scale=scale,
+            basis_df=basis_df,
+            solver=solver,
+            float32=float32
         )
         
         # Combinar datos originales con componentes principales
@@ -628,6 +1032,9 @@ def run_pca(
             'explained_variance_ratio': pca_meta['explained_variance_ratio'],
             'total_variance_explained': sum(pca_meta['explained_variance_ratio']),
             'scale_applied': scale,
+            'basis_year': basis_year if basis_year is not None else year,
+            'solver': pca_meta['solver'],
+            'float32': float32,
             'n_hospitals': len(df_combined)
         }
         
@@ -649,13 +1056,102 @@ def run_pca(
         logger.error(f"Error al ejecutar PCA: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor al procesar el análisis PCA: {str(e)}")
     
-@app.get("/malmquist")
+def _fetch_malmquist_panel(db: Session) -> pd.DataFrame:
+    """Panel completo (todos los años) para las tecnologías global y secuencial."""
+    result = db.execute(text("""
+        SELECT hospital_id, año, consultas, grdxegresos, bienesyservicios,
+               remuneraciones, diascamadisponibles, consultasurgencias,
+               examenes, quirofanos
+        FROM hospitals
+    """))
+    df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+    num_cols = df.columns.drop(['hospital_id', 'año'])
+    df[num_cols] = df[num_cols].apply(pd.to_numeric, errors='coerce')
+    return df
+
+def _run_malmquist_chain(db: Session, year_start: int, year_end: int,
+                         input_cols_list: List[str], output_cols_list: List[str],
+                         top_input_col: str, technology: str = 'contemporaneous',
+                         df_panel: pd.DataFrame = None, decomposition: str = 'basic'):
+    """Malmquist encadenado entre year_start y year_end (modo 'chain' de /malmquist)."""
+    result = db.execute(text("""
+        SELECT hospital_id, region_id, hospital_name, hospital_alternative_name,
+               latitud, longitud, consultas, grdxegresos, bienesyservicios,
+               remuneraciones, diascamadisponibles, consultasurgencias,
+               examenes, quirofanos, año, complejidad
+        FROM hospitals
+        WHERE año BETWEEN :year_start AND :year_end
+    """), {"year_start": year_start, "year_end": year_end})
+    df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+    years = sorted(df['año'].unique().tolist()) if not df.empty else []
+    if len(years) < 2:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Se necesitan datos de al menos dos años entre {year_start} y {year_end}."
+        )
+
+    df_chain, summary = utils.calculate_dea_malmquist_chain(
+        df, input_cols_list, output_cols_list,
+        years=years, rts='CRS', orientation='in',
+        top_input_col=top_input_col or None, top_n=30,
+        technology=technology, df_panel=df_panel, decomposition=decomposition
+    )
+
+    # Una fila por hospital: índice acumulado + trayectoria por período
+    hospital_info = (df[df['año'] == years[0]]
+                     .set_index('hospital_id')
+                     [['hospital_name', 'hospital_alternative_name', 'latitud',
+                       'longitud', 'region_id', 'complejidad']]
+                     .to_dict(orient='index'))
+    results = []
+    for hospital_id, g in df_chain.groupby('hospital_id', sort=True):
+        last = g.iloc[-1]
+        results.append({
+            'hospital_id': int(hospital_id),
+            **hospital_info.get(hospital_id, {'hospital_name': f"Hospital {hospital_id}"}),
+            'Malmquist_acum': float(last['Malmquist_acum']),
+            '%ΔProd_acum': float(last['%ΔProd_acum']),
+            'trayectoria': g.drop(columns=['hospital_id']).to_dict(orient='records')
+        })
+
+    acum = df_chain.groupby('hospital_id')['Malmquist_acum'].last().values
+    metrics = {
+        'delta_prod_acum_promedio': float(np.mean((acum - 1) * 100)),
+        'malmquist_acum_mean': float(np.mean(acum)),
+        'malmquist_acum_median': float(np.median(acum)),
+        'pct_hosp_mejorados': float((acum > 1).mean() * 100),
+        'productivity_improved': int((acum > 1).sum()),
+        'productivity_declined': int((acum < 1).sum()),
+        'n_periodos': len(years) - 1,
+        'n_hospitals': len(results)
+    }
+
+    return {
+        "results": results,
+        "metrics": metrics,
+        "analysis_info": {
+            "mode": "chain",
+            "technology": technology,
+            "decomposition": decomposition,
+            "years": summary['years'],
+            "input_columns": input_cols_list,
+            "output_columns": output_cols_list,
+            "top_input_column": top_input_col
+        },
+        "summary": summary
+    }
+
+@app.get("/malmquist", dependencies=[Depends(http_cache.data_etag)])
 def run_malmquist(
     year_t: int = 2014,
     year_t1: int = 2016,
     input_cols: str = Query(default='bienesyservicios,remuneraciones'),
     output_cols: str = Query(default='consultas'),
     top_input_col: str = Query(default='remuneraciones'),
+    mode: str = Query(default='pair', description="'pair' (year_t→year_t1) o 'chain' (todos los pares consecutivos)"),
+    technology: str = Query(default='contemporaneous', description="Tecnología de referencia: 'contemporaneous', 'global' o 'sequential'"),
+    decomposition: str = Query(default='basic', description="'basic' (EFFCH, TECH) o 'full' (además PEFFCH y SECH)"),
     db: Session = Depends(get_db)
 ):
     """
@@ -678,9 +1174,19 @@ def run_malmquist(
         input_cols: Recursos hospitalarios (remuneraciones, bienes, camas)
         output_cols: Productos hospitalarios (consultas, egresos, urgencias)
         top_input_col: Variable para seleccionar hospitales representativos
+        mode: 'pair' compara solo year_t y year_t1; 'chain' encadena todos los
+              años consecutivos entre ambos (2014→2015→…) reutilizando cada
+              frontera anual y devuelve la productividad acumulada por hospital
+        technology: 'contemporaneous' (fronteras de cada año), 'global'
+              (frontera agrupada de todos los años, índice circular) o
+              'sequential' (frontera acumulada hasta cada año, sin retroceso técnico)
+        decomposition: 'basic' devuelve EFFCH y TECH; 'full' separa además el
+              cambio de eficiencia en eficiencia pura (PEFFCH, VRS) y de escala
+              (SECH), resolviendo CRS y VRS en el mismo lote de LPs
     
     Returns:
         - results: Índices Malmquist por hospital con geolocalización
+          (en modo 'chain', acumulados y con la trayectoria por período)
         - metrics: Estadísticas agregadas de cambio en productividad
         - analysis_info: Metadata del análisis temporal
     """
@@ -703,6 +1209,35 @@ def run_malmquist(
                 detail=f"top_input_col '{top_input_col}' debe estar en input_cols: {input_cols_list}",
                 headers={"X-Error": "Invalid top_input_col"}
             )
+
+        if mode not in ('pair', 'chain'):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Modo no válido: {mode}. Use 'pair' o 'chain'."
+            )
+
+        if technology not in utils.MALMQUIST_TECHNOLOGIES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Tecnología no válida: {technology}. Use una de {list(utils.MALMQUIST_TECHNOLOGIES)}."
+            )
+
+        if decomposition not in utils.MALMQUIST_DECOMPOSITIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Descomposición no válida: {decomposition}. Use 'basic' o 'full'."
+            )
+
+        # Las tecnologías global y secuencial usan el panel de todos los años
+        df_panel = _fetch_malmquist_panel(db) if technology != 'contemporaneous' else None
+
+        if mode == 'chain':
+            return clean_floats_for_json(_run_malmquist_chain(
+                db, min(year_t, year_t1), max(year_t, year_t1),
+                input_cols_list, output_cols_list, top_input_col,
+                technology=technology, df_panel=df_panel,
+                decomposition=decomposition
+            ))
         
         # Obtener hospitales para ambos años usando consultas SQL directas
         # (Evita problemas de cache de SQLAlchemy con múltiples consultas por año)
@@ -787,7 +1322,9 @@ def run_malmquist(
             top_input_col=top_input_col,
             rts='CRS', orientation='in', 
             use_cross=True,
-            top_n=30, max_dmus=None, n_jobs=4
+            top_n=30, max_dmus=None,
+            technology=technology, df_panel=df_panel,
+            decomposition=decomposition
         )
         
         # Crear diccionarios de mapeo para hospital_id -> información del hospital
@@ -837,6 +1374,9 @@ def run_malmquist(
             'productivity_unchanged': int((malmquist_values == 1).sum()),
             'n_hospitals': len(results)
         }
+        if decomposition == 'full':
+            metrics['delta_eficiencia_pura_promedio'] = float(np.mean(df_malmquist['PEFFCH'].values))
+            metrics['delta_escala_promedio'] = float(np.mean(df_malmquist['SECH'].values))
         
         return clean_floats_for_json({
             "results": results,  # Cambiar de detailed_results a results para consistencia
@@ -844,6 +1384,8 @@ def run_malmquist(
             "analysis_info": {
                 "year_t": year_t,
                 "year_t1": year_t1,
+                "technology": technology,
+                "decomposition": decomposition,
                 "hospitals_t_count": len(hospitals_t),
                 "hospitals_t1_count": len(hospitals_t1),
                 "input_columns": input_cols_list,
@@ -859,7 +1401,246 @@ def run_malmquist(
         logger.error(f"Error al ejecutar análisis Malmquist: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor al procesar el análisis Malmquist: {str(e)}")
 
-@app.get("/determinantes-efficiency")
+@app.get("/luenberger", dependencies=[Depends(http_cache.data_etag)])
+def run_luenberger(
+    year_t: int = 2014,
+    year_t1: int = 2016,
+    input_cols: str = Query(default='bienesyservicios,remuneraciones'),
+    output_cols: str = Query(default='consultas'),
+    rts: str = Query(default='CRS', description="'CRS' o 'VRS'"),
+    direction: str = Query(default='both', description="'both' (g = (x, y)), 'in' o 'out'"),
+    top_input_col: str = Query(default=None, description="Si se indica, solo los 30 hospitales con mayor valor en year_t"),
+    db: Session = Depends(get_db)
+):
+    """
+    Indicador de productividad de Luenberger entre dos años, basado en
+    funciones de distancia direccional.
+
+    A diferencia del índice Malmquist es aditivo (diferencias, no razones):
+    no explota cuando una eficiencia se acerca a cero, por lo que entrega un
+    cambio de productividad estable para todos los hospitales presentes en
+    ambos años.
+
+    Args:
+        year_t: Año inicial
+        year_t1: Año final
+        input_cols / output_cols: Variables del modelo
+        rts: Retornos a escala ('CRS' o 'VRS')
+        direction: Vector de dirección de la distancia direccional
+        top_input_col: Filtro opcional de hospitales representativos
+
+    Returns:
+        - results: LEFFCH, LTECH y Luenberger por hospital (> 0 = mejora)
+        - metrics: Promedios y conteos de mejora
+        - analysis_info: Metadata del análisis
+    """
+    try:
+        input_cols_list = [col.strip() for col in input_cols.split(',')]
+        output_cols_list = [col.strip() for col in output_cols.split(',')]
+
+        if year_t == year_t1:
+            raise HTTPException(
+                status_code=400,
+                detail="Los años deben ser diferentes para el indicador de Luenberger."
+            )
+        if rts not in ('CRS', 'VRS'):
+            raise HTTPException(status_code=400, detail=f"rts no válido: {rts}. Use 'CRS' o 'VRS'.")
+        if direction not in utils.LUENBERGER_DIRECTIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Dirección no válida: {direction}. Use una de {list(utils.LUENBERGER_DIRECTIONS)}."
+            )
+        if top_input_col and top_input_col not in input_cols_list:
+            raise HTTPException(
+                status_code=400,
+                detail=f"top_input_col '{top_input_col}' debe estar en input_cols: {input_cols_list}"
+            )
+
+        result = db.execute(text("""
+            SELECT hospital_id, region_id, hospital_name, hospital_alternative_name,
+                   latitud, longitud, consultas, grdxegresos, bienesyservicios,
+                   remuneraciones, diascamadisponibles, consultasurgencias,
+                   examenes, quirofanos, año, complejidad
+            FROM hospitals
+            WHERE año IN (:year_t, :year_t1)
+        """), {"year_t": year_t, "year_t1": year_t1})
+        df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+        for year in (year_t, year_t1):
+            if df.empty or not (df['año'] == year).any():
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"No se encontraron hospitales para el año {year}."
+                )
+
+        df_luen, summary = utils.calculate_luenberger(
+            df[df['año'] == year_t], df[df['año'] == year_t1],
+            input_cols_list, output_cols_list,
+            rts=rts, direction=direction,
+            top_input_col=top_input_col or None, top_n=30
+        )
+
+        hospital_info = (df[df['año'] == year_t]
+                         .set_index('hospital_id')
+                         [['hospital_name', 'hospital_alternative_name', 'latitud',
+                           'longitud', 'region_id', 'complejidad']]
+                         .to_dict(orient='index'))
+        results = [
+            {**row, **hospital_info.get(row['hospital_id'], {'hospital_name': f"Hospital {row['hospital_id']}"})}
+            for row in df_luen.reset_index().to_dict(orient='records')
+        ]
+
+        values = df_luen['Luenberger'].values
+        metrics = {
+            'luenberger_mean': float(np.nanmean(values)),
+            'luenberger_median': float(np.nanmedian(values)),
+            'delta_eficiencia_promedio': summary['LEFFCH_mean'],
+            'delta_tecnologia_promedio': summary['LTECH_mean'],
+            'pct_hosp_mejorados': float((values > 0).mean() * 100),
+            'productivity_improved': summary['n_improved'],
+            'productivity_declined': summary['n_declined'],
+            'n_hospitals': summary['n_hospitals']
+        }
+
+        return clean_floats_for_json({
+            "results": results,
+            "metrics": metrics,
+            "analysis_info": {
+                "year_t": year_t,
+                "year_t1": year_t1,
+                "rts": rts,
+                "direction": direction,
+                "input_columns": input_cols_list,
+                "output_columns": output_cols_list,
+                "top_input_column": top_input_col
+            },
+            "summary": summary
+        })
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error al ejecutar indicador de Luenberger: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor al procesar el indicador de Luenberger: {str(e)}")
+
+def _fetch_determinantes_df(db: Session, year: int | None) -> pd.DataFrame:
+    """
+    Hospitales (de un año o todos) con las columnas usadas en el análisis de
+    determinantes. SQL directo: hospital_id no es único entre años y el ORM
+    fusionaría los registros de un mismo hospital (identity map).
+    """
+    query = """
+        SELECT hospital_id, hospital_name, region_id, latitud, longitud,
+               consultas, grdxegresos, bienesyservicios, remuneraciones,
+               diascamadisponibles, consultasurgencias, examenes, quirofanos,
+               año, complejidad, indiceocupacional, indicerotacion,
+               promediodiasestadia, letalidad, egresosfallecidos, region
+        FROM hospitals
+    """
+    params = {}
+    # Aplicar filtros si se proporcionan
+    if year is not None:
+        query += " WHERE año = :year"
+        params["year"] = year
+    result = db.execute(text(query), params)
+    df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+    
+    if df.empty:
+        raise HTTPException(status_code=404, detail="No se encontraron hospitales con los filtros especificados")
+    
+    num_cols = df.columns.drop(['hospital_name', 'region'])
+    df[num_cols] = df[num_cols].apply(pd.to_numeric, errors='coerce')
+    return df
+
+
+def _validar_columnas_determinantes(df: pd.DataFrame, input_cols_list: List[str],
+                                    output_cols_list: List[str], independent_vars_list: List[str]):
+    """400 si alguna columna de inputs, outputs o variables independientes no existe."""
+    all_columns = set(df.columns)
+    missing_inputs = [col for col in input_cols_list if col not in all_columns]
+    missing_outputs = [col for col in output_cols_list if col not in all_columns]
+    missing_independents = [col for col in independent_vars_list if col not in all_columns]
+    
+    if missing_inputs:
+        raise HTTPException(status_code=400, detail=f"Columnas de input no encontradas: {missing_inputs}")
+    if missing_outputs:
+        raise HTTPException(status_code=400, detail=f"Columnas de output no encontradas: {missing_outputs}")
+    if missing_independents:
+        raise HTTPException(status_code=400, detail=f"Variables independientes no encontradas: {missing_independents}")
+
+
+def _respuesta_determinantes(coef_table: pd.DataFrame, meta: dict, independent_vars_list: List[str],
+                             input_cols_list: List[str], output_cols_list: List[str],
+                             efficiency_method: str, ols_backend: str) -> dict:
+    """Respuesta JSON de un análisis de determinantes (coeficientes, ajuste y extras por regresión)."""
+    # Formatear respuesta (columnas completas, sin recorrer filas)
+    # Los valores no finitos (inf, -inf, nan) no son JSON serializables
+    p_raw = coef_table['P>|t|'].to_numpy()
+    finite = lambda col, fill: np.where(np.isfinite(coef_table[col]), coef_table[col], fill).tolist()
+    coeficientes = [
+        {
+            "variable": var,
+            "coeficiente": coef_val,
+            "error_estandar": stderr_val,
+            "t_value": t_val,
+            "p_value": p_val,
+            "significativo": bool(sig)
+        }
+        for var, coef_val, stderr_val, t_val, p_val, sig in zip(
+            coef_table['variable'].tolist(),
+            finite('Coef.', 0.0), finite('Std.Err.', 0.0), finite('t', 0.0),
+            finite('P>|t|', 1.0), np.isfinite(p_raw) & (p_raw < 0.05)
+        )
+    ]
+    
+    respuesta = {
+        "variable_dependiente": meta['dependent_variable'],
+        "variables_independientes": independent_vars_list,
+        "metodo_eficiencia": meta['method'],
+        "input_cols": input_cols_list,
+        "output_cols": output_cols_list,
+        "coeficientes": coeficientes,
+        "variables_clave": meta['top_vars'],
+        "r_cuadrado": float(meta['r2']) if np.isfinite(meta['r2']) else 0.0,
+        "r_cuadrado_ajustado": float(meta['r2_adj']) if np.isfinite(meta['r2_adj']) else 0.0,
+        "observaciones": meta['n_observations'],
+        "aic": meta['aic'],
+        "bic": meta['bic'],
+        "ols_backend": ols_backend,
+        "regresion": meta['regression'],
+        "panel": meta['panel'],
+        "mensaje": f"Análisis de determinantes completado usando {efficiency_method}. {len(coeficientes)} coeficientes calculados."
+    }
+    if 'diagnostics' in meta:
+        respuesta["diagnosticos"] = meta['diagnostics']
+    if meta['regression'] != "ols":
+        respuesta.update(
+            log_verosimilitud=meta['log_likelihood'],
+            sigma=meta['sigma'],
+            observaciones_censuradas=meta['n_censored'],
+            convergencia=meta['converged']
+        )
+    if meta['panel'] != "pooled":
+        respuesta.update(
+            efectos_fijos={"hospitales": meta['n_entities'], "años": meta['n_periods']},
+            errores_estandar="cluster_hospital",
+            variables_omitidas=meta['dropped_vars']
+        )
+    if meta['regression'] == "simar_wilson":
+        # Intervalos percentil del segundo bucle bootstrap
+        for c, lo, hi in zip(coeficientes, finite('[0.025', 0.0), finite('0.975]', 0.0)):
+            c.update(ic_inferior=lo, ic_superior=hi)
+        corregida = meta['bias_corrected']
+        respuesta.update(
+            replicas_bootstrap=list(meta['bootstrap_reps']),
+            sesgo_medio=meta['mean_bias'],
+            eficiencias_corregidas=[{"hospital_id": int(h), "eficiencia_corregida": float(v)}
+                                    for h, v in zip(corregida.index, corregida.to_numpy())]
+        )
+    return respuesta
+
+
+@app.get("/determinantes-efficiency", dependencies=[Depends(http_cache.data_etag)])
 def analisis_determinantes_eficiencia(
     efficiency_method: str = Query(default="DEA", description="Método de eficiencia: 'SFA' o 'DEA'"),
     independent_vars: str = Query(..., description="Variables independientes separadas por comas"),
@@ -867,6 +1648,9 @@ def analisis_determinantes_eficiencia(
     output_cols: str = Query(..., description="Columnas de outputs separadas por comas"),
     year: int = Query(default=None, description="Año para filtrar datos"),
     top_n: int = Query(default=5, description="Número de determinantes clave"),
+    ols_backend: str = Query(default="numpy", description="'numpy' (QR directo) o 'statsmodels' (con diagnósticos)"),
+    regression: str = Query(default="ols", description="'ols', 'tobit' (censurado en 1) o 'truncated' (truncado en 1)"),
+    panel: str = Query(default="pooled", description="'pooled', 'within' (efectos fijos por hospital) o 'twoway' (hospital y año); sin year"),
     db: Session = Depends(get_db)
 ):
     """
@@ -894,6 +1678,16 @@ def analisis_determinantes_eficiencia(
         output_cols: Outputs para cálculo de eficiencia
         year: Año específico de análisis
         top_n: Número de determinantes principales a reportar
+        ols_backend: 'numpy' resuelve OLS por QR sin statsmodels; 'statsmodels'
+            agrega diagnósticos (F, número de condición, Durbin-Watson, Jarque-Bera)
+        regression: 'ols', 'tobit' (eficiencias censuradas en 1) o 'truncated'
+            (solo hospitales ineficientes, truncado en 1); ambos por máxima
+            verosimilitud y sin los hospitales inválidos (eficiencia 0). El
+            doble bootstrap de Simar-Wilson va por POST /determinantes-bootstrap
+        panel: sin year, 'pooled' agrupa todos los años en un OLS; 'within'
+            agrega efectos fijos por hospital y 'twoway' por hospital y año
+            (demeaning por grupo, sin matriz de dummies), con errores
+            estándar robustos por cluster de hospital
     
     Returns:
         - coeficientes: Resultados de regresión con significancia estadística
@@ -905,57 +1699,24 @@ def analisis_determinantes_eficiencia(
         independent_vars_list = [v.strip() for v in independent_vars.split(',')]
         input_cols_list = [v.strip() for v in input_cols.split(',')]
         output_cols_list = [v.strip() for v in output_cols.split(',')]
+
+        if ols_backend not in utils.OLS_BACKENDS:
+            raise HTTPException(status_code=400, detail=f"ols_backend no válido: {ols_backend}. Use uno de {list(utils.OLS_BACKENDS)}.")
+        if regression not in utils.REGRESSION_MODELS:
+            raise HTTPException(status_code=400, detail=f"Regresión no válida: {regression}. Use uno de {list(utils.REGRESSION_MODELS)}.")
+        if panel not in utils.PANEL_ESTIMATORS:
+            raise HTTPException(status_code=400, detail=f"Estimador de panel no válido: {panel}. Use uno de {list(utils.PANEL_ESTIMATORS)}.")
+        if panel != "pooled" and year is not None:
+            raise HTTPException(status_code=400, detail="Los efectos fijos de panel usan todos los años: omita el parámetro year.")
+        if panel != "pooled" and (regression != "ols" or ols_backend != "numpy"):
+            raise HTTPException(status_code=400, detail="Los efectos fijos de panel solo admiten regression='ols' y ols_backend='numpy'.")
+        if regression == "simar_wilson":
+            raise HTTPException(status_code=400, detail="simar_wilson se ejecuta como trabajo en segundo plano: use POST /determinantes-bootstrap.")
         
         logger.info(f"Análisis determinantes eficiencia: {efficiency_method} con inputs: {input_cols_list}, outputs: {output_cols_list}")
         
-        # Obtener datos de hospitales
-        query = db.query(models.Hospital)
-        
-        # Aplicar filtros si se proporcionan
-        if year is not None:
-            query = query.filter(models.Hospital.año == year)
-        hospitales = query.all()
-        
-        if not hospitales:
-            raise HTTPException(status_code=404, detail="No se encontraron hospitales con los filtros especificados")
-        
-        # Convertir a DataFrame
-        df = pd.DataFrame([{
-            'hospital_id': h.hospital_id,
-            'hospital_name': h.hospital_name,
-            'region_id': h.region_id,
-            'latitud': h.latitud,
-            'longitud': h.longitud,
-            'consultas': h.consultas,
-            'grdxegresos': h.grdxegresos,
-            'bienesyservicios': h.bienesyservicios,
-            'remuneraciones': h.remuneraciones,
-            'diascamadisponibles': h.diascamadisponibles,
-            'consultasurgencias': h.consultasurgencias,
-            'examenes': h.examenes,
-            'quirofanos': h.quirofanos,
-            'año': h.año,
-            'complejidad': h.complejidad,
-            'indiceocupacional': h.indiceocupacional,
-            'indicerotacion': h.indicerotacion,
-            'promediodiasestadia': h.promediodiasestadia,
-            'letalidad': h.letalidad,
-            'egresosfallecidos': h.egresosfallecidos,
-            'region': h.region
-        } for h in hospitales])
-        
-        # Verificar que las columnas existen
-        all_columns = set(df.columns)
-        missing_inputs = [col for col in input_cols_list if col not in all_columns]
-        missing_outputs = [col for col in output_cols_list if col not in all_columns]
-        missing_independents = [col for col in independent_vars_list if col not in all_columns]
-        
-        if missing_inputs:
-            raise HTTPException(status_code=400, detail=f"Columnas de input no encontradas: {missing_inputs}")
-        if missing_outputs:
-            raise HTTPException(status_code=400, detail=f"Columnas de output no encontradas: {missing_outputs}")
-        if missing_independents:
-            raise HTTPException(status_code=400, detail=f"Variables independientes no encontradas: {missing_independents}")
+        df = _fetch_determinantes_df(db, year)
+        _validar_columnas_determinantes(df, input_cols_list, output_cols_list, independent_vars_list)
         
         # Ejecutar análisis de determinantes con cálculo automático de eficiencia
         coef_table, meta = utils.determinant_analysis(
@@ -966,47 +1727,220 @@ def analisis_determinantes_eficiencia(
             input_cols=input_cols_list,
             output_cols=output_cols_list,
             top_n=top_n,
-            add_constant=True
+            add_constant=True,
+            ols_backend=ols_backend,
+            regression=regression,
+            panel=panel
         )
         
-        # Formatear respuesta
-        coeficientes = []
-        for _, row in coef_table.iterrows():
-            # Manejar valores no finitos (inf, -inf, nan) que no son JSON serializables
-            coef_val = float(row['Coef.']) if np.isfinite(row['Coef.']) else 0.0
-            stderr_val = float(row['Std.Err.']) if np.isfinite(row['Std.Err.']) else 0.0
-            t_val = float(row['t']) if np.isfinite(row['t']) else 0.0
-            p_val = float(row['P>|t|']) if np.isfinite(row['P>|t|']) else 1.0
-            
-            coef = {
-                "variable": row['variable'],
-                "coeficiente": coef_val,
-                "error_estandar": stderr_val,
-                "t_value": t_val,
-                "p_value": p_val,
-                "significativo": bool(p_val < 0.05 and np.isfinite(row['P>|t|']))
-            }
-            coeficientes.append(coef)
+        respuesta = _respuesta_determinantes(coef_table, meta, independent_vars_list,
+                                             input_cols_list, output_cols_list, efficiency_method, ols_backend)
+        
+        logger.info(f"Análisis determinantes eficiencia completado. R² = {meta['r2']:.3f}, método = {efficiency_method}")
+        return clean_floats_for_json(respuesta)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error en análisis determinantes eficiencia: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+
+def _job_simar_wilson(df: pd.DataFrame, independent_vars_list: List[str], input_cols_list: List[str],
+                      output_cols_list: List[str], top_n: int, reps: tuple, seed: int, progress=None) -> dict:
+    """Cuerpo del trabajo de /determinantes-bootstrap (corre fuera de la petición)."""
+    coef_table, meta = utils.determinant_analysis(
+        df=df,
+        dependent="eficiencia",
+        independents=independent_vars_list,
+        efficiency_method="DEA",
+        input_cols=input_cols_list,
+        output_cols=output_cols_list,
+        top_n=top_n,
+        regression="simar_wilson",
+        bootstrap_reps=reps,
+        random_state=seed,
+        progress=progress
+    )
+    respuesta = _respuesta_determinantes(coef_table, meta, independent_vars_list,
+                                         input_cols_list, output_cols_list, "DEA", "numpy")
+    return clean_floats_for_json(respuesta)
+
+
+@app.post("/determinantes-bootstrap", status_code=202)
+def determinantes_bootstrap(
+    independent_vars: str = Query(..., description="Variables independientes separadas por comas"),
+    input_cols: str = Query(..., description="Columnas de inputs separadas por comas"),
+    output_cols: str = Query(..., description="Columnas de outputs separadas por comas"),
+    year: int = Query(default=None, description="Año para filtrar datos"),
+    top_n: int = Query(default=5, description="Número de determinantes clave"),
+    n_boot1: int = Query(default=utils.SIMAR_WILSON_REPS[0], ge=2, le=2000, description="Réplicas del primer bucle (sesgo DEA)"),
+    n_boot2: int = Query(default=utils.SIMAR_WILSON_REPS[1], ge=2, le=5000, description="Réplicas del segundo bucle (intervalos)"),
+    seed: int = Query(default=42, description="Semilla del bootstrap"),
+    db: Session = Depends(get_db)
+):
+    """
+    Determinantes de eficiencia DEA con el doble bootstrap de Simar y Wilson.
+    
+    La regresión de puntajes DEA por OLS está sesgada (puntajes acotados en 1 y
+    correlacionados entre sí). El algoritmo 2 de Simar y Wilson corrige el
+    sesgo de cada puntaje con un primer bootstrap de DEA y obtiene intervalos
+    de confianza de la regresión truncada con un segundo bootstrap.
+    
+    Requiere miles de LP y regresiones, así que se ejecuta como trabajo en
+    segundo plano repartido en el pool de procesos: responde 202 con un
+    job_id y el avance (y luego el resultado) se consulta en GET /jobs/{job_id}.
+    
+    Args:
+        independent_vars: Variables explicativas
+        input_cols: Inputs del DEA (orientación a insumos, CRS)
+        output_cols: Outputs del DEA
+        year: Año específico de análisis
+        top_n: Número de determinantes principales a reportar
+        n_boot1: Réplicas del primer bucle (corrección de sesgo de los puntajes)
+        n_boot2: Réplicas del segundo bucle (intervalos de confianza)
+        seed: Semilla del bootstrap (resultados reproducibles)
+    
+    Returns:
+        Estado del trabajo; al completarse, "resultado" tiene la misma forma que
+        /determinantes-efficiency con ic_inferior/ic_superior por coeficiente,
+        el sesgo medio y las eficiencias corregidas por hospital
+    """
+    try:
+        independent_vars_list = [v.strip() for v in independent_vars.split(',')]
+        input_cols_list = [v.strip() for v in input_cols.split(',')]
+        output_cols_list = [v.strip() for v in output_cols.split(',')]
+        
+        # Datos leídos en la petición: el trabajo no usa la sesión de BD
+        df = _fetch_determinantes_df(db, year)
+        _validar_columnas_determinantes(df, input_cols_list, output_cols_list, independent_vars_list)
+        
+        job = jobs.submit("determinantes-bootstrap", _job_simar_wilson, df, independent_vars_list,
+                          input_cols_list, output_cols_list, top_n, (n_boot1, n_boot2), seed)
+        logger.info(f"Bootstrap Simar-Wilson encolado: job {job.id} ({n_boot1}x{n_boot2} réplicas)")
+        return job.to_dict()
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error al encolar bootstrap de determinantes: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+
+@app.get("/jobs/{job_id}")
+def estado_trabajo(job_id: str):
+    """
+    Estado de un trabajo en segundo plano: 'pendiente', 'en_curso',
+    'completado' (con "resultado") o 'error' (con "error"), más el avance
+    (0..1) y la etapa actual.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo {job_id} no encontrado")
+    return job.to_dict()
+
+
+@app.get("/determinantes-search", dependencies=[Depends(http_cache.data_etag)])
+def busqueda_determinantes(
+    efficiency_method: str = Query(default="DEA", description="Método de eficiencia: 'SFA' o 'DEA'"),
+    candidate_vars: str = Query(..., description="Variables candidatas separadas por comas"),
+    input_cols: str = Query(..., description="Columnas de inputs separadas por comas"),
+    output_cols: str = Query(..., description="Columnas de outputs separadas por comas"),
+    year: int = Query(default=None, description="Año para filtrar datos"),
+    method: str = Query(default="exhaustive", description="'exhaustive' o 'stepwise'"),
+    criterion: str = Query(default="aic", description="'aic', 'bic' o 'r2_adj'"),
+    max_vars: int = Query(default=None, ge=1, description="Máximo de variables por modelo"),
+    top_n: int = Query(default=10, ge=1, le=100, description="Número de modelos a devolver"),
+    db: Session = Depends(get_db)
+):
+    """
+    Búsqueda de modelos de determinantes de eficiencia.
+    
+    Calcula la eficiencia (SFA/DEA) una sola vez y evalúa todos los
+    subconjuntos de las variables candidatas (o una selección hacia adelante),
+    cada uno con una actualización incremental de Cholesky en lugar de un
+    reajuste completo.
+    
+    Args:
+        efficiency_method: Método de cálculo de eficiencia ('SFA' o 'DEA')
+        candidate_vars: Variables explicativas candidatas
+        input_cols: Inputs para cálculo de eficiencia
+        output_cols: Outputs para cálculo de eficiencia
+        year: Año específico de análisis
+        method: 'exhaustive' (todos los subconjuntos, hasta 15 candidatos) o
+            'stepwise' (agrega la variable que más mejora el criterio)
+        criterion: Criterio de orden ('aic', 'bic' o 'r2_adj')
+        max_vars: Tamaño máximo de los modelos
+        top_n: Número de modelos a devolver
+    
+    Returns:
+        - modelos: Mejores modelos con R², R² ajustado, AIC y BIC
+        - mejor_modelo: Coeficientes del mejor modelo
+        - modelos_evaluados: Número de modelos evaluados
+    """
+    try:
+        candidate_vars_list = [v.strip() for v in candidate_vars.split(',')]
+        input_cols_list = [v.strip() for v in input_cols.split(',')]
+        output_cols_list = [v.strip() for v in output_cols.split(',')]
+
+        if method not in utils.SEARCH_METHODS:
+            raise HTTPException(status_code=400, detail=f"Método de búsqueda no válido: {method}. Use uno de {list(utils.SEARCH_METHODS)}.")
+        if criterion not in utils.SEARCH_CRITERIA:
+            raise HTTPException(status_code=400, detail=f"Criterio no válido: {criterion}. Use uno de {list(utils.SEARCH_CRITERIA)}.")
+        if method == "exhaustive" and len(candidate_vars_list) > utils.EXHAUSTIVE_MAX_CANDIDATES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"La búsqueda exhaustiva admite a lo más {utils.EXHAUSTIVE_MAX_CANDIDATES} candidatos; use method='stepwise'."
+            )
+
+        df = _fetch_determinantes_df(db, year)
+
+        all_columns = set(df.columns)
+        missing = [col for col in input_cols_list + output_cols_list + candidate_vars_list
+                   if col not in all_columns]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Columnas no encontradas: {missing}")
+
+        try:
+            models_df, meta = utils.determinant_search(
+                df=df,
+                dependent="eficiencia",
+                candidates=candidate_vars_list,
+                efficiency_method=efficiency_method,
+                input_cols=input_cols_list,
+                output_cols=output_cols_list,
+                method=method,
+                criterion=criterion,
+                max_vars=max_vars,
+                top_n=top_n
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        best = meta['best_coefficients']
         respuesta = {
             "variable_dependiente": meta['dependent_variable'],
-            "variables_independientes": independent_vars_list,
-            "metodo_eficiencia": meta['method'],
-            "input_cols": input_cols_list,
-            "output_cols": output_cols_list,
-            "coeficientes": coeficientes,
-            "variables_clave": meta['top_vars'],
-            "r_cuadrado": float(meta['r2']) if np.isfinite(meta['r2']) else 0.0,
-            "r_cuadrado_ajustado": float(meta['r2_adj']) if np.isfinite(meta['r2_adj']) else 0.0,
+            "metodo_eficiencia": meta['efficiency_method'],
+            "metodo_busqueda": method,
+            "criterio": criterion,
+            "variables_candidatas": candidate_vars_list,
+            "modelos_evaluados": meta['n_models_evaluated'],
             "observaciones": meta['n_observations'],
-            "mensaje": f"Análisis de determinantes completado usando {efficiency_method}. {len(coeficientes)} coeficientes calculados."
+            "modelos": models_df.to_dict(orient='records'),
+            "mejor_modelo": [
+                {"variable": var, "coeficiente": coef, "error_estandar": se,
+                 "t_value": t_val, "p_value": p_val}
+                for var, coef, se, t_val, p_val in zip(
+                    best['variable'], best['Coef.'], best['Std.Err.'], best['t'], best['P>|t|'])
+            ]
         }
-        
-        logger.info(f"Análisis determinantes eficiencia completado. R² = {meta['r2']:.3f}, método = {efficiency_method}")
+
+        logger.info(f"Búsqueda de determinantes ({method}, {criterion}): "
+                    f"{meta['n_models_evaluated']} modelos evaluados")
         return clean_floats_for_json(respuesta)
-        
+
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error en análisis determinantes eficiencia: {e}")
-        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
\ No newline at end of file
+        logger.error(f"Error en búsqueda de determinantes: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
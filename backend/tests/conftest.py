@@ -132,3 +132,62 @@ def client(test_db, test_app):
     
     # Limpiar las sobrescrituras de dependencias
     test_app.dependency_overrides.clear()
+
+
+@pytest.fixture(scope="function")
+def crear_panel(test_db):
+    """
+    Devuelve una función crear_panel(years, n_hospitals=5) que recrea la tabla
+    hospitals sin PK única (como en producción, un registro por hospital y año)
+    e inserta un panel balanceado con crecimiento distinto por hospital y año.
+    """
+    from sqlalchemy import text
+
+    def _crear(years, n_hospitals: int = 5):
+        test_db.execute(text("DROP TABLE IF EXISTS hospitals"))
+        test_db.execute(text("""
+            CREATE TABLE hospitals (
+                hospital_id INTEGER, region_id INTEGER, hospital_name TEXT,
+                hospital_alternative_name TEXT, latitud REAL, longitud REAL,
+                consultas INTEGER, grdxegresos REAL, bienesyservicios INTEGER,
+                remuneraciones INTEGER, diascamadisponibles INTEGER,
+                consultasurgencias INTEGER, examenes REAL, quirofanos REAL,
+                año INTEGER, complejidad INTEGER, indiceocupacional REAL,
+                indicerotacion REAL, promediodiasestadia REAL, letalidad REAL,
+                egresosfallecidos REAL, region TEXT
+            )
+        """))
+        test_db.execute(text(
+            "CREATE UNIQUE INDEX idx_hospitals_año_hospital_id ON hospitals (año, hospital_id)"))
+        for t, year in enumerate(years):
+            for i in range(n_hospitals):
+                test_db.execute(text("""
+                    INSERT INTO hospitals
+                    (hospital_id, region_id, hospital_name, hospital_alternative_name,
+                     latitud, longitud, consultas, grdxegresos, bienesyservicios,
+                     remuneraciones, diascamadisponibles, consultasurgencias,
+                     examenes, quirofanos, año, complejidad)
+                    VALUES (:hospital_id, 1, :hospital_name, NULL, -33.0, -70.0,
+                            :consultas, :grdxegresos, :bienesyservicios, :remuneraciones,
+                            50000, 20000, 100000.0, 10.0, :año, 2)
+                """), {
+                    "hospital_id": 300 + i,
+                    "hospital_name": f"Hospital Panel {i}",
+                    "consultas": 80000 + 9000 * i + 4000 * t * (i % 3),
+                    "grdxegresos": 5000.0 + 400.0 * i + 150.0 * t * (i % 2),
+                    "bienesyservicios": 8000000 + 700000 * i + 250000 * t,
+                    "remuneraciones": 4000000 + 500000 * ((i * 7) % 5) + 100000 * t,
+                    "año": year
+                })
+        test_db.commit()
+
+    return _crear
+
+
+@pytest.fixture(scope="function")
+def version_cache(monkeypatch):
+    """Caché de versión de datos vacía y sin intervalo de sondeo (lee la base en cada llamada)."""
+    from database import versioning
+
+    monkeypatch.setattr(versioning, "_cached", {"value": None, "checked": 0.0, "listening": False})
+    monkeypatch.setattr(versioning, "POLL_SECONDS", 0.0)
@@ -111,3 +111,16 @@ def test_api_endpoint(client):
     
     # Verificar que la respuesta es exitosa
     assert response.status_code == 200
+
+
+def test_hospital_year_unique(test_db: Session, crear_panel):
+    """(hospital_id, año) es único: un segundo registro del mismo hospital y año se rechaza."""
+    from sqlalchemy import text
+    from sqlalchemy.exc import IntegrityError
+
+    indexes = {ix.name: ix for ix in Hospital.__table__.indexes}
+    assert indexes["idx_hospitals_año_hospital_id"].unique
+    crear_panel([2014, 2015], n_hospitals=1)
+    with pytest.raises(IntegrityError):
+        test_db.execute(text("INSERT INTO hospitals (hospital_id, año, hospital_name) VALUES (300, 2014, 'Otro')"))
+    test_db.rollback()
@@ -0,0 +1,81 @@
+"""
+Tests de la versión de datos (database/versioning.py) y de los ETag que deriva
+(utils/http_cache.py).
+"""
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from database import versioning
+
+
+def test_bump_and_current_version(test_db: Session, version_cache):
+    assert versioning.get_data_version(test_db) == 0
+    assert versioning.bump_data_version(test_db) == 1
+    assert versioning.bump_data_version(test_db) == 2
+    test_db.commit()
+    assert versioning.current_data_version() == 2
+
+    # Una notificación más nueva se recuerda; una vieja no retrocede la versión
+    versioning.remember(5)
+    versioning.remember(3)
+    assert versioning._cached["value"] == 5
+
+
+def test_current_version_polls_at_most_every_interval(test_db: Session, version_cache, monkeypatch):
+    monkeypatch.setattr(versioning, "POLL_SECONDS", 3600.0)
+    assert versioning.current_data_version() == 0
+    versioning.bump_data_version(test_db)
+    test_db.commit()
+    # Dentro del intervalo se sirve la versión cacheada
+    assert versioning.current_data_version() == 0
+    monkeypatch.setattr(versioning, "POLL_SECONDS", 0.0)
+    assert versioning.current_data_version() == 1
+
+
+def test_etag_from_version_and_params(client: TestClient, test_db: Session, crear_panel, version_cache):
+    crear_panel([2014], n_hospitals=6)
+    first = client.get("/dea", params={"year": 2014})
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('"v0-')
+
+    # Parámetros por defecto explícitos o con espacios → misma respuesta, mismo ETag
+    same = client.get("/dea", params={"year": "2014",
+                                      "input_cols": "bienesyservicios, remuneraciones,diascamadisponibles"})
+    assert same.headers["etag"] == etag
+    assert client.get("/dea", params={"year": 2014, "output_cols": "grdxegresos"}).headers["etag"] != etag
+    assert client.get("/sfa", params={"year": 2014}).headers["etag"] != etag
+
+    # Un cambio de datos cambia la versión y por lo tanto el ETag
+    versioning.bump_data_version(test_db)
+    test_db.commit()
+    etag_v1 = client.get("/dea", params={"year": 2014}).headers["etag"]
+    assert etag_v1.startswith('"v1-')
+
+
+def test_etag_changes_with_build_version(client: TestClient, crear_panel, version_cache, monkeypatch):
+    """Un release nuevo invalida los ETag aunque los datos no cambien."""
+    from utils import http_cache
+
+    crear_panel([2014], n_hospitals=3)
+    etag = client.get("/hospitals", params={"year": 2014}).headers["etag"]
+    monkeypatch.setattr(http_cache, "BUILD_VERSION", "otro-release")
+    nuevo = client.get("/hospitals", params={"year": 2014}, headers={"If-None-Match": etag})
+    assert nuevo.status_code == 200
+    assert nuevo.headers["etag"] != etag
+
+
+def test_trigger_sql_matches_init_sql():
+    """El trigger que instala el backend es el mismo de db/init.sql e incrementa una vez por transacción."""
+    import re
+    from pathlib import Path
+
+    def _function(sql: str) -> str:
+        start = sql.index("CREATE OR REPLACE FUNCTION bump_data_version()")
+        end = sql.index("EXECUTE FUNCTION bump_data_version();", start)
+        return " ".join(sql[start:end].split())
+
+    init_sql = (Path(__file__).resolve().parents[3] / "db" / "init.sql").read_text(encoding="utf-8")
+    assert _function(versioning.TRIGGER_SQL) == _function(init_sql)
+    assert re.search(r"IF current_setting\('app.data_version_bumped', true\) = 'on' THEN\s+RETURN NULL;",
+                     versioning.TRIGGER_SQL)
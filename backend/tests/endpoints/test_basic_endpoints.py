@@ -9,6 +9,8 @@ Cubre los endpoints de utilidad y gestión básica:
 - /hospitals/{hospital_id}: Obtener hospital específico por ID
 """
 
+import json
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
@@ -62,6 +64,7 @@ def test_db_status_success(client: TestClient, test_db: Session):
     assert data["status"] == "connected"
     assert "PostgreSQL conectada correctamente" in data["message"]
     assert data["result"] == 1  # Resultado de SELECT 1
+    assert data["data_version"] == 0  # Sin cambios registrados
 
 
 def test_get_all_hospitals_without_filters(client: TestClient, test_db: Session):
@@ -450,3 +453,119 @@ def test_get_hospital_by_id_invalid_format(client: TestClient):
     assert "detail" in data
     # Verificar que es un error de validación de tipo
     assert any("type" in error and "int_parsing" in error.get("type", "") for error in data["detail"])
+
+
+def test_get_hospitals_keyset_pagination(client: TestClient, crear_panel):
+    """Paginación por (año, hospital_id): recorre el panel completo sin repetir ni saltar registros."""
+    crear_panel([2014, 2015, 2016], n_hospitals=5)
+
+    keys, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 4} if cursor is None else {"limit": 4, "cursor": cursor}
+        response = client.get("/hospitals", params=params)
+        assert response.status_code == 200
+        keys += [(h["año"], h["hospital_id"]) for h in response.json()]
+        pages += 1
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            assert "link" not in response.headers
+            break
+        assert 'rel="next"' in response.headers["link"]
+
+    assert pages == 4
+    assert keys == sorted((año, 300 + i) for año in (2014, 2015, 2016) for i in range(5))
+
+    # Filtros junto con la paginación
+    response = client.get("/hospitals", params={"year": 2015, "limit": 10})
+    assert [h["año"] for h in response.json()] == [2015] * 5
+    assert "x-next-cursor" not in response.headers
+    assert client.get("/hospitals", params={"cursor": "no-es-un-cursor"}).status_code == 400
+
+
+def test_get_hospitals_ndjson_stream(client: TestClient, crear_panel):
+    """format=ndjson transmite un registro por línea, ordenado por año y hospital."""
+    crear_panel([2014, 2015], n_hospitals=3)
+    with client.stream("GET", "/hospitals", params={"format": "ndjson"}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert response.headers["etag"]
+        rows = [json.loads(line) for line in response.iter_lines() if line]
+    assert [(r["año"], r["hospital_id"]) for r in rows] == [(a, 300 + i) for a in (2014, 2015) for i in range(3)]
+    assert rows[0]["hospital_name"] == "Hospital Panel 0"
+
+    assert client.get("/hospitals", params={"format": "ndjson", "year": 2030}).status_code == 404
+    assert client.get("/hospitals", params={"format": "xml"}).status_code == 400
+
+
+def test_hospitals_fast_path_keeps_schema(client: TestClient, test_app, crear_panel, test_db: Session):
+    """La vía rápida (sin validar fila por fila) conserva el esquema documentado y todos los años."""
+    from sqlalchemy import text
+
+    crear_panel([2014, 2015], n_hospitals=3)
+    test_db.execute(text("UPDATE hospitals SET letalidad = NULL WHERE hospital_id = 300 AND año = 2015"))
+    test_db.commit()
+
+    response = client.get("/hospitals")
+    assert response.status_code == 200
+    data = response.json()
+    # Un registro por hospital y año, con exactamente los campos de HospitalResponse
+    assert len(data) == 6
+    assert set(data[0]) == set(models.Hospital.__table__.columns.keys())
+    assert [h["letalidad"] for h in data if h["hospital_id"] == 300] == [None, None]
+    assert isinstance(data[0]["consultas"], int) and isinstance(data[0]["examenes"], float)
+
+    detalle = client.get("/hospitals/301").json()
+    assert detalle["hospital_id"] == 301 and detalle["año"] == 2014
+
+    spec = test_app.openapi()["paths"]
+    for path in ("/hospitals", "/hospitals/{hospital_id}"):
+        schema = spec[path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+        assert "HospitalResponse" in json.dumps(schema)
+
+
+def test_hospitals_fast_path_casts_real_columns(client: TestClient, test_db: Session):
+    """Con las columnas de volumen en REAL (como en init.sql) los campos int del esquema salen como enteros."""
+    from sqlalchemy import text
+
+    test_db.execute(text("DROP TABLE IF EXISTS hospitals"))
+    test_db.execute(text("""
+        CREATE TABLE hospitals (
+            hospital_id INTEGER, region_id INTEGER, hospital_name TEXT,
+            hospital_alternative_name TEXT, latitud REAL, longitud REAL,
+            consultas REAL, grdxegresos REAL, bienesyservicios REAL,
+            remuneraciones REAL, diascamadisponibles REAL,
+            consultasurgencias REAL, examenes REAL, quirofanos REAL,
+            año INTEGER, complejidad INTEGER, indiceocupacional REAL,
+            indicerotacion REAL, promediodiasestadia REAL, letalidad REAL,
+            egresosfallecidos REAL, region TEXT
+        )
+    """))
+    test_db.execute(text("""
+        INSERT INTO hospitals (hospital_id, region_id, hospital_name, latitud, longitud, consultas,
+                               grdxegresos, bienesyservicios, remuneraciones, diascamadisponibles,
+                               consultasurgencias, examenes, quirofanos, año, complejidad)
+        VALUES (101100, 15, 'Hospital Real', -18.48, -70.31, 184208.0, 11953.83, 19779704.0,
+                10982608.0, 113311.0, 139557.0, 898535.0, 178.0, 2014, 3)
+    """))
+    test_db.commit()
+
+    bodies = [client.get("/hospitals").content, client.get("/hospitals/101100").content,
+              client.get("/hospitals", params={"limit": 10}).content,
+              client.get("/hospitals", params={"format": "ndjson"}).content]
+    for body in bodies:
+        assert b'"consultas":184208,' in body and b'"bienesyservicios":19779704,' in body
+        assert b'"diascamadisponibles":113311,' in body and b'"consultasurgencias":139557,' in body
+        assert b'"remuneraciones":10982608,' in body and b'"examenes":898535.0' in body
+
+
+def test_hospitals_fast_path_rejects_null_required(client: TestClient, crear_panel, test_db: Session):
+    """Un NULL en un campo obligatorio del esquema no se emite como null: la fila se valida y falla."""
+    from sqlalchemy import text
+
+    crear_panel([2014], n_hospitals=2)
+    test_db.execute(text("UPDATE hospitals SET latitud = NULL WHERE hospital_id = 301"))
+    test_db.commit()
+
+    assert client.get("/hospitals/300").status_code == 200
+    assert client.get("/hospitals/301").status_code == 500
+    assert client.get("/hospitals").status_code == 500
@@ -5,8 +5,11 @@ Tests que cubren:
 - Funcionalidad básica con parámetros predeterminados
 - Manejo de casos sin hospitales para el año especificado
 - Validación de parámetros personalizados de entrada y salida
+- Lectura de resultados precalculados (efficiency_results)
 """
 
+import json
+
 import pytest
 from fastapi.testclient import TestClient
 from database.models import Hospital
@@ -260,3 +263,47 @@ class TestDEAEndpoint:
         assert "top_slack_promedio" in metrics
         assert isinstance(metrics["et_promedio"], (int, float))
         assert isinstance(metrics["pct_criticos"], (int, float))
+
+
+class TestDEAPrecalculado:
+    """Lectura de resultados precalculados (efficiency_results) en /dea y /sfa."""
+
+    def test_precalculated_matches_live(self, client: TestClient, test_db: Session, crear_panel, monkeypatch):
+        """El pipeline guarda las especificaciones canónicas; /dea y /sfa las leen mientras los datos no cambien."""
+        from sqlalchemy import text
+        from utils import precompute
+        import utils.functions as utils
+
+        crear_panel([2014, 2015], n_hospitals=12)
+        test_db.execute(text("UPDATE hospitals SET diascamadisponibles = 40000 + 1700 * (hospital_id % 7)"))
+        test_db.commit()
+
+        vivo = {m: client.get(f"/{m}", params={"year": 2014}).json() for m in ("dea", "sfa")}
+        assert not vivo["dea"]["metrics"]["precalculado"]
+
+        resumen = precompute.recompute_all(db=test_db)
+        assert resumen == {"calculados": 4, "vigentes": 0, "errores": []}
+        # Sin cambios en los datos no se recalcula nada
+        assert precompute.recompute_all(db=test_db)["vigentes"] == 4
+
+        for m in ("dea", "sfa"):
+            data = client.get(f"/{m}", params={"year": 2014}).json()
+            assert data["metrics"]["precalculado"]
+            assert data["results"] == vivo[m]["results"]
+            assert data["metrics"]["et_promedio"] == pytest.approx(vivo[m]["metrics"]["et_promedio"])
+
+        # Holguras guardadas por input para DEA
+        slacks = test_db.execute(text("SELECT slacks FROM efficiency_results WHERE method = 'DEA' LIMIT 1")).scalar()
+        assert set(json.loads(slacks)) == {"bienesyservicios", "remuneraciones", "diascamadisponibles"}
+
+        # Otra especificación o datos modificados → cálculo en vivo
+        otra = client.get("/dea", params={"year": 2014, "output_cols": "consultas,grdxegresos"}).json()
+        assert not otra["metrics"]["precalculado"]
+        test_db.execute(text("UPDATE hospitals SET consultas = consultas + 1 WHERE hospital_id = 300 AND año = 2014"))
+        test_db.commit()
+        assert not client.get("/dea", params={"year": 2014}).json()["metrics"]["precalculado"]
+        assert client.get("/dea", params={"year": 2015}).json()["metrics"]["precalculado"]
+
+        # Una nueva versión del algoritmo cambia la especificación → cálculo en vivo
+        monkeypatch.setitem(precompute.ALGORITHM_VERSIONS, "DEA", utils.DEA_ALGORITHM_VERSION + 1)
+        assert not client.get("/dea", params={"year": 2015}).json()["metrics"]["precalculado"]
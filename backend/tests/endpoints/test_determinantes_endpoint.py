@@ -291,6 +291,26 @@ class TestDeterminantesEndpoint:
 
         print(f"✓ Test DEA exitoso - R² = {data['r_cuadrado']:.3f}, observaciones = {data['observaciones']}")
 
+        # Backend statsmodels: mismos coeficientes y diagnósticos adicionales
+        params = {
+            "efficiency_method": "DEA",
+            "independent_vars": "complejidad,region_id",
+            "input_cols": "bienesyservicios,remuneraciones",
+            "output_cols": "consultas",
+            "year": 2014,
+            "top_n": 3
+        }
+        response = client.get("/determinantes-efficiency", params={**params, "ols_backend": "statsmodels"})
+        assert response.status_code == 200
+        data_sm = response.json()
+        assert "durbin_watson" in data_sm["diagnosticos"]
+        for c_np, c_sm in zip(data["coeficientes"], data_sm["coeficientes"]):
+            assert c_np["coeficiente"] == pytest.approx(c_sm["coeficiente"])
+        assert data["aic"] == pytest.approx(data_sm["aic"])
+
+        response = client.get("/determinantes-efficiency", params={**params, "ols_backend": "otro"})
+        assert response.status_code == 400
+
     def test_determinantes_sfa_success_basic(self, client: TestClient, test_db: Session):
         """
         Test básico del endpoint determinantes con método SFA.
@@ -808,5 +828,134 @@ class TestDeterminantesEndpoint:
 
         print("✓ Test parámetros por defecto exitoso")
 
+
+class TestDeterminantesSearchEndpoint:
+    """Tests para el endpoint /determinantes-search"""
+
+    PARAMS = {
+        "efficiency_method": "DEA",
+        "candidate_vars": "consultas,grdxegresos,remuneraciones",
+        "input_cols": "bienesyservicios,remuneraciones",
+        "output_cols": "consultas",
+        "year": 2014
+    }
+
+    def test_search_exhaustive_and_stepwise(self, client: TestClient, crear_panel):
+        """La búsqueda exhaustiva evalúa todos los subconjuntos y los ordena por AIC."""
+        crear_panel([2014], n_hospitals=10)
+
+        response = client.get("/determinantes-search", params=self.PARAMS)
+        assert response.status_code == 200
+        data = response.json()
+        # En un año del panel consultas y grdxegresos son colineales: de los 7
+        # subconjuntos se descartan los 2 que las incluyen a ambas
+        assert data["modelos_evaluados"] == 5
+        aics = [m["aic"] for m in data["modelos"]]
+        assert aics == sorted(aics)
+        mejor = data["modelos"][0]["variables"]
+        assert [c["variable"] for c in data["mejor_modelo"]] == ["const"] + mejor
+
+        # El mejor modelo coincide con determinantes-efficiency sobre esas variables
+        detalle = client.get("/determinantes-efficiency", params={
+            **{k: v for k, v in self.PARAMS.items() if k != "candidate_vars"},
+            "independent_vars": ",".join(mejor)
+        }).json()
+        assert detalle["aic"] == pytest.approx(data["modelos"][0]["aic"])
+
+        response = client.get("/determinantes-search", params={**self.PARAMS, "method": "stepwise",
+                                                               "criterion": "r2_adj"})
+        assert response.status_code == 200
+        assert response.json()["modelos_evaluados"] <= 6
+
+    @pytest.mark.parametrize("regression", ["tobit", "truncated"])
+    def test_determinantes_bounded_regression(self, client: TestClient, crear_panel, regression):
+        """Segunda etapa Tobit/truncada sobre los puntajes DEA (acotados en 1)."""
+        crear_panel([2014], n_hospitals=20)
+        params = {k: v for k, v in self.PARAMS.items() if k != "candidate_vars"}
+        response = client.get("/determinantes-efficiency", params={
+            **params, "independent_vars": "grdxegresos", "regression": regression})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["regresion"] == regression
+        assert data["sigma"] > 0
+        assert [c["variable"] for c in data["coeficientes"]] == ["const", "grdxegresos"]
+        if regression == "tobit":
+            assert data["observaciones_censuradas"] >= 1       # al menos un hospital eficiente
+        else:
+            assert data["observaciones_censuradas"] == 0
+
+        response = client.get("/determinantes-efficiency", params={
+            **params, "independent_vars": "grdxegresos", "regression": "otro"})
+        assert response.status_code == 400
+
+    def test_determinantes_panel_fixed_effects(self, client: TestClient, crear_panel):
+        """Sin year: todos los hospital-año (no solo uno por hospital) y efectos fijos de panel."""
+        crear_panel([2014, 2015, 2016], n_hospitals=8)
+        params = {k: v for k, v in self.PARAMS.items() if k not in ("candidate_vars", "year")}
+        params["independent_vars"] = "consultas,complejidad"
+
+        pooled = client.get("/determinantes-efficiency", params=params).json()
+        assert pooled["panel"] == "pooled"
+        assert pooled["observaciones"] == 24
+
+        for panel in ("within", "twoway"):
+            response = client.get("/determinantes-efficiency", params={**params, "panel": panel})
+            assert response.status_code == 200
+            data = response.json()
+            assert data["panel"] == panel
+            assert data["errores_estandar"] == "cluster_hospital"
+            assert data["efectos_fijos"]["hospitales"] == 8
+            # complejidad no varía dentro de hospital: la absorbe el efecto fijo
+            assert data["variables_omitidas"] == ["complejidad"]
+            assert [c["variable"] for c in data["coeficientes"]] == ["consultas"]
+
+        for extra in ({"panel": "otro"}, {"panel": "within", "year": 2014},
+                      {"panel": "within", "regression": "tobit"}):
+            response = client.get("/determinantes-efficiency", params={**params, **extra})
+            assert response.status_code == 400
+
+    def test_determinantes_bootstrap_job(self, client: TestClient, crear_panel):
+        """Simar-Wilson como trabajo: 202 con job_id, avance en /jobs y resultado con intervalos."""
+        import time
+
+        crear_panel([2014], n_hospitals=20)
+        params = {k: v for k, v in self.PARAMS.items() if k not in ("candidate_vars", "efficiency_method")}
+        params.update(independent_vars="grdxegresos", n_boot1=5, n_boot2=20)
+
+        response = client.post("/determinantes-bootstrap", params=params)
+        assert response.status_code == 202
+        job = response.json()
+        assert job["tipo"] == "determinantes-bootstrap"
+        assert job["estado"] in ("pendiente", "en_curso")
+
+        for _ in range(300):
+            job = client.get(f"/jobs/{job['job_id']}").json()
+            if job["estado"] in ("completado", "error"):
+                break
+            time.sleep(0.1)
+        assert job["estado"] == "completado", job.get("error")
+        assert job["progreso"] == 1.0
+        resultado = job["resultado"]
+        assert resultado["regresion"] == "simar_wilson"
+        assert resultado["replicas_bootstrap"] == [5, 20]
+        for c in resultado["coeficientes"]:
+            assert c["ic_inferior"] <= c["ic_superior"]
+        assert len(resultado["eficiencias_corregidas"]) == 20
+
+        assert client.get("/jobs/no-existe").status_code == 404
+        # En la ruta síncrona se rechaza y se indica el endpoint de trabajos
+        response = client.get("/determinantes-efficiency", params={**params, "regression": "simar_wilson"})
+        assert response.status_code == 400
+        response = client.post("/determinantes-bootstrap", params={**params, "independent_vars": "no_existe"})
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("extra", [{"method": "otro"}, {"criterion": "otro"},
+                                       {"candidate_vars": "no_existe"}])
+    def test_search_invalid_params(self, client: TestClient, crear_panel, extra):
+        crear_panel([2014], n_hospitals=10)
+        response = client.get("/determinantes-search", params={**self.PARAMS, **extra})
+        assert response.status_code == 400
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -0,0 +1,70 @@
+"""
+Pruebas de ETag / If-None-Match y Cache-Control (utils/http_cache.py).
+
+Tests que cubren:
+- 304 sin cuerpo cuando el ETag del cliente sigue vigente
+- El 304 se decide antes de abrir la sesión de base de datos y de calcular
+- Cambio de datos → nuevo ETag y 200
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from database import versioning
+from database.database import get_db
+from utils import http_cache
+import utils.functions as utils
+
+
+class TestConditionalRequests:
+    """If-None-Match sobre /hospitals, /dea y /sfa"""
+
+    @pytest.mark.parametrize("path", ["/hospitals", "/dea", "/sfa"])
+    def test_not_modified(self, client: TestClient, crear_panel, version_cache, path):
+        crear_panel([2014], n_hospitals=6)
+        first = client.get(path, params={"year": 2014})
+        assert first.status_code == 200
+        assert first.headers["cache-control"] == http_cache.CACHE_CONTROL
+        etag = first.headers["etag"]
+
+        again = client.get(path, params={"year": 2014}, headers={"If-None-Match": etag})
+        assert again.status_code == 304
+        assert again.content == b""
+        assert again.headers["etag"] == etag
+
+        # Lista de ETags y prefijo débil también valen; otro ETag no
+        assert client.get(path, params={"year": 2014},
+                          headers={"If-None-Match": f'"otro", W/{etag}'}).status_code == 304
+        assert client.get(path, params={"year": 2014},
+                          headers={"If-None-Match": '"otro"'}).status_code == 200
+
+    def test_not_modified_skips_db_and_compute(self, client: TestClient, test_app, crear_panel,
+                                               version_cache, monkeypatch):
+        crear_panel([2014], n_hospitals=6)
+        etag = client.get("/dea", params={"year": 2014}).headers["etag"]
+
+        sessions = []
+        original = test_app.dependency_overrides[get_db]
+
+        def counting_get_db():
+            sessions.append(1)
+            yield from original()
+
+        test_app.dependency_overrides[get_db] = counting_get_db
+        monkeypatch.setattr(utils, "calculate_dea_metrics",
+                            lambda *a, **k: pytest.fail("no debía calcular DEA"))
+        # Con la versión en caché (como con LISTEN activo) no se toca la base
+        monkeypatch.setattr(versioning, "POLL_SECONDS", 3600.0)
+
+        response = client.get("/dea", params={"year": 2014}, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert sessions == []
+
+    def test_data_change_invalidates(self, client: TestClient, test_db: Session, crear_panel, version_cache):
+        crear_panel([2014], n_hospitals=6)
+        etag = client.get("/hospitals", params={"year": 2014}).headers["etag"]
+        versioning.bump_data_version(test_db)
+        test_db.commit()
+        response = client.get("/hospitals", params={"year": 2014}, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
@@ -0,0 +1,178 @@
+"""
+Pruebas para la ingesta masiva de hospitales (POST /hospitals/ingest).
+
+Tests que cubren:
+- Fusión por (hospital_id, año): actualiza existentes e inserta nuevos
+- Campos obligatorios de HospitalResponse (las filas nuevas los traen todos)
+- Incremento de la versión de datos solo cuando cambian filas
+- Errores de validación por fila sin escribir nada
+- dry_run y columnas desconocidas
+- Esquema requerido (el de db/init.sql)
+"""
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from database.versioning import get_data_version
+
+CSV_HEADER = "hospital_id,año,hospital_name,consultas,bienesyservicios,remuneraciones,diascamadisponibles\n"
+# Todos los campos obligatorios de HospitalResponse (necesarios para insertar)
+FULL_HEADER = ("hospital_id,año,hospital_name,region_id,latitud,longitud,consultas,grdxegresos,"
+               "bienesyservicios,remuneraciones,diascamadisponibles,consultasurgencias,examenes,"
+               "quirofanos,complejidad\n")
+
+
+def _full_row(hospital_id: int, año: int, name: str, consultas: int = 77777) -> str:
+    return f"{hospital_id},{año},{name},1,-33.0,-70.0,{consultas},5000.0,8000000,4000000,50000,20000,100000.0,10.0,2\n"
+
+
+def _post(client: TestClient, body: str, **params):
+    params.setdefault("recompute", False)
+    return client.post("/hospitals/ingest", content=body.encode("utf-8"),
+                       params=params, headers={"Content-Type": "text/csv"})
+
+
+class TestIngestEndpoint:
+    """Conjunto de pruebas para el endpoint /hospitals/ingest"""
+
+    def test_ingest_upsert(self, client: TestClient, test_db: Session, crear_panel):
+        crear_panel([2014], n_hospitals=3)
+        body = CSV_HEADER + (
+            "300,2014,Hospital Panel 0,99999,1,2,3\n"
+            "301,2014, Hospital Panel 1 ,88888,1,2,3\n"
+        )
+        response = _post(client, body)
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["filas"], data["actualizadas"], data["insertadas"]) == (2, 2, 0)
+        assert data["total_errores"] == 0
+        assert data["version_datos"] == 1
+        # Las columnas que no vienen en el archivo se conservan
+        assert test_db.execute(text(
+            "SELECT complejidad, latitud FROM hospitals WHERE hospital_id = 300")).one() == (2, -33.0)
+
+        response = _post(client, FULL_HEADER + _full_row(300, 2015, "Hospital Panel 0")
+                         + _full_row(302, 2014, "Hospital Panel 2", consultas=66666))
+        data = response.json()
+        assert (data["filas"], data["actualizadas"], data["insertadas"]) == (2, 1, 1)
+        assert data["version_datos"] == get_data_version(test_db) == 2
+
+        rows = test_db.execute(text(
+            "SELECT hospital_id, año, hospital_name, consultas FROM hospitals "
+            "ORDER BY año, hospital_id")).fetchall()
+        assert len(rows) == 4
+        assert rows[0][3] == 99999 and rows[1][2] == "Hospital Panel 1" and rows[2][3] == 66666
+        assert rows[3] == (300, 2015, "Hospital Panel 0", 77777)
+
+        # Reingestar lo mismo actualiza pero sigue siendo un cambio de datos
+        assert _post(client, body).json()["version_datos"] == 3
+
+    def test_ingest_required_fields(self, client: TestClient, test_db: Session, crear_panel):
+        """Las filas nuevas traen todos los campos obligatorios; las actualizaciones pueden ser parciales."""
+        from database import schemas
+
+        crear_panel([2014], n_hospitals=2)
+        required = {n for n, f in schemas.HospitalResponse.model_fields.items() if f.is_required()}
+
+        response = _post(client, "hospital_id,año,consultas\n300,2014,1000\n999,2014,1000\n")
+        assert response.status_code == 400
+        detail = response.json()["detail"]
+        errores = {(e["fila"], e["columna"], e["error"]) for e in detail["errores"]}
+        assert errores == {(2, col, "es obligatorio") for col in required - {"hospital_id", "año", "consultas"}}
+        assert _post(client, "hospital_id,año,consultas\n999,2014,1000\n", dry_run=True).status_code == 400
+        assert test_db.execute(text("SELECT COUNT(*) FROM hospitals")).scalar() == 2
+        assert client.get("/hospitals", params={"year": 2014}).status_code == 200
+
+        # Valores vacíos en campos obligatorios, también al actualizar
+        response = _post(client, CSV_HEADER + "300,2014,  ,1,1,2,3\n301,2014,X,1,,2,3\n")
+        assert response.status_code == 400
+        errores = {(e["fila"], e["columna"], e["error"]) for e in response.json()["detail"]["errores"]}
+        assert errores == {(1, "hospital_name", "es obligatorio"), (2, "bienesyservicios", "es obligatorio")}
+
+        # Actualización parcial de un registro existente
+        data = _post(client, "hospital_id,año,consultas\n300,2014,1000\n").json()
+        assert (data["actualizadas"], data["insertadas"]) == (1, 0)
+        assert client.get("/hospitals/300").json()["consultas"] == 1000
+
+    def test_ingest_with_version_trigger(self, client: TestClient, test_db: Session, crear_panel, monkeypatch):
+        """Con el trigger de versión instalado la ingesta no incrementa por su cuenta: informa el valor final."""
+        from database import versioning
+        from utils import ingest
+
+        crear_panel([2014], n_hospitals=2)
+        # Simula el trigger: cada sentencia que modifica hospitals incrementa la versión
+        monkeypatch.setattr(ingest, "trigger_installed", lambda db: True)
+        original_merge = ingest._merge
+
+        def merge_con_trigger(db, columns):
+            result = original_merge(db, columns)
+            versioning.bump_data_version(db)
+            return result
+
+        monkeypatch.setattr(ingest, "_merge", merge_con_trigger)
+        data = _post(client, CSV_HEADER + "300,2014,X,1,1,2,3\n").json()
+        assert data["version_datos"] == 1
+        assert get_data_version(test_db) == 1
+
+    def test_ingest_validation_errors(self, client: TestClient, test_db: Session, crear_panel):
+        crear_panel([2014], n_hospitals=2)
+        body = CSV_HEADER + (
+            "300,2014,Hospital Panel 0,-5,1,2,3\n"
+            "301,2014,Hospital Panel 1,10,abc,2,3\n"
+            "301,2014,Hospital Panel 1,10,1,2,3\n"
+            ",2015,Sin id,10,1,2,3\n"
+        )
+        response = _post(client, body)
+        assert response.status_code == 400
+        detail = response.json()["detail"]
+        assert detail["total_errores"] == 4
+        errores = {(e["fila"], e["columna"]) for e in detail["errores"]}
+        assert errores == {(1, "consultas"), (2, "bienesyservicios"), (3, "hospital_id"), (4, "hospital_id")}
+        # No se escribió nada
+        assert test_db.execute(text("SELECT COUNT(*) FROM hospitals")).scalar() == 2
+        assert test_db.execute(text("SELECT consultas FROM hospitals WHERE hospital_id = 300")).scalar() == 80000
+        assert get_data_version(test_db) == 0
+
+    def test_ingest_rejects_non_finite(self, client: TestClient, test_db: Session, crear_panel):
+        """"inf" y "-inf" son numéricos para pandas pero no valores válidos."""
+        crear_panel([2014], n_hospitals=2)
+        body = CSV_HEADER + "300,2014,X,inf,1,2,3\n301,inf,Y,1,1,-inf,3\n"
+        response = _post(client, body)
+        assert response.status_code == 400
+        errores = {(e["fila"], e["columna"], e["error"]) for e in response.json()["detail"]["errores"]}
+        assert {(1, "consultas", "no es finito"), (2, "año", "no es finito"),
+                (2, "remuneraciones", "no es finito")} <= errores
+        assert test_db.execute(text("SELECT consultas FROM hospitals WHERE hospital_id = 300")).scalar() == 80000
+
+    def test_ingest_dry_run(self, client: TestClient, test_db: Session, crear_panel):
+        crear_panel([2014], n_hospitals=2)
+        response = _post(client, FULL_HEADER + _full_row(300, 2014, "X") + _full_row(305, 2014, "Y"), dry_run=True)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["dry_run"] and data["filas"] == 2 and data["insertadas"] == 0
+        assert test_db.execute(text("SELECT COUNT(*) FROM hospitals")).scalar() == 2
+
+    def test_ingest_requires_init_sql_schema(self, client: TestClient, test_db: Session):
+        """Sobre la tabla del modelo (hospital_id como PK, sin crear_panel) la ingesta responde 400, no 500."""
+        response = _post(client, FULL_HEADER + _full_row(999, 2014, "X"))
+        assert response.status_code == 400
+        assert "db/init.sql" in response.json()["detail"]
+        assert test_db.execute(text("SELECT COUNT(*) FROM hospitals")).scalar() == 0
+
+        test_db.execute(text("DROP INDEX idx_hospitals_año_hospital_id"))
+        test_db.execute(text("CREATE TABLE hospitals_tmp AS SELECT * FROM hospitals"))
+        test_db.execute(text("DROP TABLE hospitals"))
+        test_db.execute(text("ALTER TABLE hospitals_tmp RENAME TO hospitals"))
+        test_db.commit()
+        response = _post(client, FULL_HEADER + _full_row(999, 2014, "X"))
+        assert response.status_code == 400
+        assert "idx_hospitals_año_hospital_id" in response.json()["detail"]
+
+    def test_ingest_bad_columns(self, client: TestClient, test_db: Session, crear_panel):
+        crear_panel([2014], n_hospitals=1)
+        response = _post(client, "hospital_id,año,columna_rara\n300,2014,1\n")
+        assert response.status_code == 400
+        assert "columna_rara" in response.json()["detail"]
+        response = _post(client, "hospital_name,consultas\nX,1\n")
+        assert response.status_code == 400
+        assert _post(client, CSV_HEADER, format="xlsx").status_code == 400
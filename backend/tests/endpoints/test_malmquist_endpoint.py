@@ -12,12 +12,15 @@ Tests que cubren:
 - Validaciones de parámetros (años iguales, columnas inválidas)
 - Manejo de casos sin datos para los años especificados
 - Parámetros personalizados de inputs y outputs
+- Indicador de Luenberger (/luenberger), alternativa aditiva al índice Malmquist
 """
 
 import pytest
+import numpy as np
 from fastapi.testclient import TestClient
 from database.models import Hospital
 from sqlalchemy.orm import Session
+from sqlalchemy import text
 
 
 class TestMalmquistEndpoint:
@@ -519,3 +522,103 @@ class TestMalmquistEndpoint:
         
         # Verificar métricas
         assert data["metrics"]["n_hospitals"] == 2
+
+    def test_malmquist_chain_mode(self, client: TestClient, crear_panel):
+        """
+        Modo 'chain': encadena todos los años consecutivos del rango y devuelve
+        la productividad acumulada por hospital con su trayectoria.
+        """
+        crear_panel([2014, 2015, 2016, 2017])
+
+        response = client.get("/malmquist?year_t=2014&year_t1=2017&mode=chain")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["analysis_info"]["mode"] == "chain"
+        assert data["analysis_info"]["years"] == [2014, 2015, 2016, 2017]
+        assert data["metrics"]["n_periodos"] == 3
+        assert len(data["results"]) == 5
+
+        for result in data["results"]:
+            assert "hospital_name" in result
+            trayectoria = result["trayectoria"]
+            assert [(p["year_t"], p["year_t1"]) for p in trayectoria] == [(2014, 2015), (2015, 2016), (2016, 2017)]
+            acumulado = np.prod([p["Malmquist"] for p in trayectoria])
+            assert result["Malmquist_acum"] == pytest.approx(acumulado)
+
+    def test_malmquist_invalid_mode(self, client: TestClient, test_db: Session):
+        """Un modo desconocido debe devolver 400."""
+        response = client.get("/malmquist?year_t=2014&year_t1=2016&mode=otro")
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("technology", ["global", "sequential"])
+    def test_malmquist_technology(self, client: TestClient, crear_panel, technology):
+        """Las tecnologías global y secuencial usan el panel completo de años."""
+        crear_panel([2014, 2015, 2016])
+
+        response = client.get(f"/malmquist?year_t=2014&year_t1=2016&technology={technology}")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["analysis_info"]["technology"] == technology
+        assert len(data["results"]) == 5
+        if technology == "sequential":
+            assert all(r["TECH"] >= 1 - 1e-6 for r in data["results"])
+
+        response = client.get(f"/malmquist?year_t=2014&year_t1=2016&mode=chain&technology={technology}")
+        assert response.status_code == 200
+        assert response.json()["summary"]["technology"] == technology
+
+    def test_malmquist_invalid_technology(self, client: TestClient, test_db: Session):
+        """Una tecnología desconocida debe devolver 400."""
+        response = client.get("/malmquist?year_t=2014&year_t1=2016&technology=otra")
+        assert response.status_code == 400
+
+    def test_malmquist_full_decomposition(self, client: TestClient, crear_panel):
+        """decomposition=full separa EFFCH en eficiencia pura y de escala."""
+        crear_panel([2014, 2016])
+
+        response = client.get("/malmquist?year_t=2014&year_t1=2016&decomposition=full")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["analysis_info"]["decomposition"] == "full"
+        assert "delta_escala_promedio" in data["metrics"]
+        for result in data["results"]:
+            assert result["PEFFCH"] * result["SECH"] == pytest.approx(result["EFFCH"])
+            assert result["EFF_VRS_t"] >= result["EFF_t"] - 1e-9
+
+        response = client.get("/malmquist?year_t=2014&year_t1=2016&decomposition=otra")
+        assert response.status_code == 400
+
+
+class TestLuenbergerEndpoint:
+    """Tests para el endpoint /luenberger."""
+
+    def test_luenberger_basic(self, client: TestClient, crear_panel):
+        """Devuelve un indicador finito para todos los hospitales de ambos años."""
+        crear_panel([2014, 2016], n_hospitals=6)
+
+        response = client.get("/luenberger?year_t=2014&year_t1=2016")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["metrics"]["n_hospitals"] == 6
+        assert data["analysis_info"]["direction"] == "both"
+        for result in data["results"]:
+            assert "hospital_name" in result
+            assert result["Luenberger"] == pytest.approx(result["LEFFCH"] + result["LTECH"])
+
+    @pytest.mark.parametrize("query", [
+        "year_t=2014&year_t1=2014",
+        "year_t=2014&year_t1=2016&rts=DRS",
+        "year_t=2014&year_t1=2016&direction=otra",
+    ])
+    def test_luenberger_invalid_params(self, client: TestClient, test_db: Session, query):
+        """Parámetros inválidos devuelven 400."""
+        response = client.get(f"/luenberger?{query}")
+        assert response.status_code == 400
+
+    def test_luenberger_missing_year(self, client: TestClient, crear_panel):
+        """Un año sin datos devuelve 404."""
+        crear_panel([2014], n_hospitals=3)
+        response = client.get("/luenberger?year_t=2014&year_t1=2016")
+        assert response.status_code == 404
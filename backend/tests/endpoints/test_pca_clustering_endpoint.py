@@ -87,6 +87,53 @@ def test_pca_clustering_default_success(client: TestClient, test_db: Session):
     assert "PC2" in data["results"][0]
     assert "ET DEA" in data["results"][0]  # Eficiencia técnica DEA por defecto
 
+    # Selección automática: curva por k y el k elegido es el de mayor silhouette
+    response = client.get("/pca-clustering?k_max=4")
+    assert response.status_code == 200
+    metrics = response.json()["metrics"]
+    assert [s["k"] for s in metrics["k_scores"]] == [2, 3, 4]
+    best = max(metrics["k_scores"], key=lambda s: s["silhouette"])
+    assert metrics["k_clusters"] == best["k"]
+    assert metrics["silhouette_score"] == pytest.approx(best["silhouette"])
+
+    # Criterio alternativo O(n·k) sobre el mismo barrido
+    response = client.get("/pca-clustering?k_max=4&criterion=davies_bouldin")
+    assert response.status_code == 200
+    metrics = response.json()["metrics"]
+    assert metrics["criterion"] == "davies_bouldin"
+    best = min(metrics["k_scores"], key=lambda s: s["davies_bouldin"])
+    assert metrics["k_clusters"] == best["k"]
+
+    response = client.get("/pca-clustering?criterion=otro")
+    assert response.status_code == 400
+
+    # Estabilidad por remuestreo bootstrap
+    response = client.get("/pca-clustering?k=2&stability=30")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["metrics"]["stability"]["n_resamples"] == 30
+    assert 0 <= data["metrics"]["stability"]["mean_stability"] <= 1
+    assert {"stability", "consensus_cluster", "coassignment"} <= set(data["results"][0])
+
+    response = client.get("/pca-clustering?k=2&stability=10&stability_mode=otro")
+    assert response.status_code == 400
+
+    # Ward jerárquico: dendrograma cacheado y recorte para otro k
+    response = client.get("/pca-clustering?algorithm=ward&k=2&dendrogram=true")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["metrics"]["algorithm"] == "ward"
+    assert len(data["dendrogram"]["linkage"]) == len(hospitales_test) - 1
+    response = client.get("/pca-clustering?algorithm=ward&k=3")
+    assert response.status_code == 200
+    assert response.json()["metrics"]["k_clusters"] == 3
+    assert "dendrogram" not in response.json()
+
+    response = client.get("/pca-clustering?algorithm=otro")
+    assert response.status_code == 400
+    response = client.get("/pca-clustering?algorithm=ward&stability=10")
+    assert response.status_code == 400
+
 def test_pca_clustering_sfa_method(client: TestClient, test_db: Session):
     """Test con método SFA en lugar de DEA."""
     # Crear hospitales de prueba
@@ -258,3 +305,26 @@ def test_pca_clustering_validation_errors(client: TestClient, test_db: Session):
     
     response = client.get("/pca-clustering?n_components=15")
     assert response.status_code == 422
+
+
+def test_pca_clustering_all_years(client: TestClient, crear_panel):
+    """years=all agrupa cada hospital-año del panel y devuelve la matriz de transición."""
+    crear_panel([2014, 2015, 2016], n_hospitals=8)
+
+    response = client.get("/pca-clustering?years=all&k=2")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["metrics"]["mode"] == "panel"
+    assert data["metrics"]["years"] == [2014, 2015, 2016]
+    assert data["metrics"]["n_observations"] == 24
+    assert len(data["results"]) == 24
+    assert {"hospital_id", "año", "cluster", "PC1", "hospital_name"} <= set(data["results"][0])
+
+    transition = data["transition_matrix"]
+    assert transition["labels"] == [0, 1]
+    assert sum(map(sum, transition["counts"])) == 16   # 8 hospitales × 2 pares de años
+    assert set(data["cluster_sizes_by_year"]) == {"2014", "2015", "2016"}
+
+    response = client.get("/pca-clustering?years=2014")
+    assert response.status_code == 400
@@ -192,3 +192,30 @@ def test_pca_validation_errors(client: TestClient, test_db: Session):
     
     response = client.get("/pca?n_components=11")
     assert response.status_code == 422
+
+def test_pca_basis_year_projection(client: TestClient, crear_panel):
+    """Con basis_year los hospitales de otro año se proyectan en la base del año de referencia."""
+    crear_panel([2014, 2015], n_hospitals=6)
+    cols = "consultas,grdxegresos,bienesyservicios,remuneraciones"
+
+    base = client.get(f"/pca?year=2014&feature_cols={cols}")
+    cruzado = client.get(f"/pca?year=2015&basis_year=2014&feature_cols={cols}")
+    assert base.status_code == 200 and cruzado.status_code == 200
+
+    # Misma base (cargas y varianza explicada del año 2014), distintas observaciones
+    assert cruzado.json()["metrics"]["basis_year"] == 2014
+    assert cruzado.json()["components_matrix"] == base.json()["components_matrix"]
+    assert (cruzado.json()["metrics"]["explained_variance_ratio"]
+            == base.json()["metrics"]["explained_variance_ratio"])
+    assert ([r["PC1"] for r in cruzado.json()["results"]]
+            != [r["PC1"] for r in base.json()["results"]])
+
+    response = client.get(f"/pca?year=2015&basis_year=1990&feature_cols={cols}")
+    assert response.status_code == 404
+
+    # Solver explícito y precisión simple
+    response = client.get(f"/pca?year=2014&feature_cols={cols}&solver=randomized&float32=true")
+    assert response.status_code == 200
+    assert response.json()["metrics"]["solver"] == "randomized"
+    response = client.get(f"/pca?year=2014&feature_cols={cols}&solver=otro")
+    assert response.status_code == 400
@@ -139,3 +139,40 @@ class TestSFAEndpoint:
         data = response.json()
         assert "results" in data
         assert "metrics" in data
+
+    def test_sfa_endpoint_multistart(self, client: TestClient, test_db: Session):
+        """Test del modo multi-arranque: reporta diagnósticos de convergencia."""
+        for i in range(8):
+            test_db.add(Hospital(
+                hospital_id=200 + i,
+                region_id=1,
+                hospital_name=f"Hospital Multi {i}",
+                latitud=-33.0,
+                longitud=-70.0,
+                consultas=1000 + 150 * i + (i % 3) * 90,
+                grdxegresos=50.0 + i,
+                bienesyservicios=50000 + 7000 * i,
+                remuneraciones=100000 + 9000 * i + (i % 2) * 4000,
+                diascamadisponibles=365 + 20 * i,
+                consultasurgencias=500,
+                examenes=200.0,
+                quirofanos=5.0,
+                año=2014,
+                complejidad=3
+            ))
+        test_db.commit()
+
+        response = client.get("/sfa?year=2014&input_cols=bienesyservicios,remuneraciones&n_starts=3")
+
+        assert response.status_code == 200
+        convergencia = response.json()["metrics"]["convergencia"]
+        assert convergencia["n_starts"] == 3
+        assert len(convergencia["inicios"]) == 3
+        assert "norma_gradiente" in convergencia
+        assert "iteraciones" in convergencia
+        assert "convergio" in convergencia
+
+    def test_sfa_endpoint_invalid_n_starts(self, client: TestClient, test_db: Session):
+        """n_starts fuera de rango debe ser rechazado por la validación de FastAPI."""
+        response = client.get("/sfa?year=2014&n_starts=0")
+        assert response.status_code == 422
@@ -0,0 +1,72 @@
+"""
+Tests del middleware de compresión (utils/compression.py).
+"""
+import gzip
+import json
+
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from utils.compression import CompressionMiddleware
+
+PAYLOAD = {"results": [{"hospital_id": i, "cluster": i % 3, "pc1": i / 7} for i in range(500)]}
+
+
+@pytest.fixture
+def compressed_app():
+    app = FastAPI()
+
+    @app.get("/grande")
+    def grande(response: Response):
+        response.headers["ETag"] = '"v1-abc"'
+        return PAYLOAD
+
+    @app.get("/chico")
+    def chico():
+        return {"ok": True}
+
+    @app.get("/stream")
+    def stream():
+        lines = (json.dumps(row) + "\n" for row in PAYLOAD["results"])
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    middleware = CompressionMiddleware(app, minimum_size=500, gzip_level=5, brotli_enabled=False)
+    return middleware, TestClient(middleware)
+
+
+def test_gzip_and_cache(compressed_app):
+    middleware, client = compressed_app
+    response = client.get("/grande", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"v1-abc"'
+    assert int(response.headers["content-length"]) < len(json.dumps(PAYLOAD)) / 3
+    assert response.json() == PAYLOAD
+    assert (middleware.cache.hits, middleware.cache.misses) == (0, 1)
+
+    # El mismo cuerpo se sirve desde la caché comprimida
+    assert client.get("/grande", headers={"Accept-Encoding": "gzip"}).json() == PAYLOAD
+    assert middleware.cache.hits == 1
+
+
+def test_threshold_and_negotiation(compressed_app):
+    _, client = compressed_app
+    chico = client.get("/chico", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in chico.headers
+    sin = client.get("/grande", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in sin.headers and sin.headers["etag"] == '"v1-abc"'
+    rechazado = client.get("/grande", headers={"Accept-Encoding": "br, gzip;q=0"})
+    assert "content-encoding" not in rechazado.headers
+
+
+def test_streaming_gzip(compressed_app):
+    _, client = compressed_app
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        raw = b"".join(response.iter_raw())
+    rows = [json.loads(line) for line in gzip.decompress(raw).splitlines()]
+    assert rows == PAYLOAD["results"]
@@ -0,0 +1,98 @@
+"""
+Tests para el pool de workers persistente (utils/pool.py).
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils import pool
+import utils.functions as utils
+
+
+class TestPoolConfig:
+    """Tamaño del pool y partición en bloques."""
+
+    def test_pool_size_from_env(self, monkeypatch):
+        monkeypatch.setenv("WORKER_POOL_SIZE", "3")
+        assert pool.pool_size() == 3
+        assert pool.effective_workers(2) == 2
+        assert pool.effective_workers(None) == 3
+
+        monkeypatch.delenv("WORKER_POOL_SIZE")
+        assert 1 <= pool.pool_size() <= (os.cpu_count() or 1)
+
+    def test_chunk_bounds_cover_rows(self):
+        bounds = pool.chunk_bounds(50, 4)
+        assert bounds[0][0] == 0 and bounds[-1][1] == 50
+        assert all(a[1] == b[0] for a, b in zip(bounds, bounds[1:]))
+        assert pool.chunk_bounds(5, 4) == [(0, 5)]
+        assert pool.chunk_bounds(0, 4) == []
+
+    def test_imap_yields_in_order(self, monkeypatch):
+        monkeypatch.setenv("WORKER_POOL_SIZE", "2")
+        assert list(pool.imap(pow, [(2, i) for i in range(6)])) == [2 ** i for i in range(6)]
+        assert pool.run(pow, [(3, 2)], n_jobs=1) == [9]
+
+    def test_shared_arrays_roundtrip_and_cleanup(self):
+        X = np.arange(12, dtype=float).reshape(4, 3)
+        with pool.shared_arrays({"X": X}) as shm:
+            ref = shm["X"]
+            np.testing.assert_array_equal(pool.load(ref), X)
+            folder = os.path.dirname(ref.path)
+        assert not os.path.exists(folder)
+
+        # Una nueva publicación suelta los mmaps de la anterior
+        with pool.shared_arrays({"X": X + 1}) as shm:
+            np.testing.assert_array_equal(pool.load(shm["X"]), X + 1)
+            assert list(pool._ATTACHED) == [shm["X"].path]
+
+    def test_imap_honors_n_jobs(self, monkeypatch):
+        monkeypatch.setenv("WORKER_POOL_SIZE", "4")
+        state = {"in_flight": 0, "max": 0}
+
+        class FakeFuture:
+            def __init__(self, value):
+                self.value = value
+
+            def result(self):
+                state["in_flight"] -= 1
+                return self.value
+
+        class FakeExecutor:
+            def submit(self, func, *args):
+                state["in_flight"] += 1
+                state["max"] = max(state["max"], state["in_flight"])
+                return FakeFuture(func(*args))
+
+        monkeypatch.setattr(pool, "get_executor", FakeExecutor)
+        assert list(pool.imap(pow, [(2, i) for i in range(8)], n_jobs=2)) == [2 ** i for i in range(8)]
+        assert state["max"] == 2
+        state["max"] = 0
+        list(pool.imap(pow, [(2, i) for i in range(8)]))
+        assert state["max"] == 4
+
+
+class TestPoolScores:
+    """Las evaluaciones en el pool coinciden con la ejecución en proceso."""
+
+    def test_pool_matches_inline(self, monkeypatch):
+        monkeypatch.setenv("WORKER_POOL_SIZE", "2")
+        rng = np.random.default_rng(11)
+        df = pd.DataFrame({
+            'hospital_id': np.tile(np.arange(20), 2),
+            'año': np.repeat([2014, 2015], 20),
+            'input1': rng.uniform(80, 120, 40),
+            'input2': rng.uniform(150, 250, 40),
+            'output1': rng.uniform(40, 70, 40)
+        })
+        df_t, df_t1 = df[df['año'] == 2014], df[df['año'] == 2015]
+        inputs, outputs = ['input1', 'input2'], ['output1']
+
+        inline, _ = utils.calculate_dea_malmquist_fast(df_t, df_t1, inputs, outputs, n_jobs=1)
+        pooled, _ = utils.calculate_dea_malmquist_fast(df_t, df_t1, inputs, outputs, n_jobs=None)
+        np.testing.assert_allclose(pooled['Malmquist'], inline['Malmquist'])
+
+        luen_inline, _ = utils.calculate_luenberger(df_t, df_t1, inputs, outputs, n_jobs=1)
+        luen_pool, _ = utils.calculate_luenberger(df_t, df_t1, inputs, outputs, n_jobs=None)
+        np.testing.assert_allclose(luen_pool['Luenberger'], luen_inline['Luenberger'])
@@ -89,6 +89,34 @@ class TestSFAMetrics:
         assert 'et_promedio' in metrics  # Verificar métrica existente
         assert len(result_df) == len(df)  # Mantiene todas las filas
 
+    def test_sfa_metrics_multistart_diagnostics(self):
+        """Prueba SFA con varios arranques en paralelo y diagnósticos de convergencia."""
+        # Con esta semilla algunos arranques caen en el óptimo degenerado lambda≈0
+        rng = np.random.default_rng(1)
+        n = 40
+        x1 = rng.uniform(1e5, 1e6, n)
+        x2 = rng.uniform(1e5, 1e6, n)
+        y = np.exp(0.5 * np.log(x1) + 0.4 * np.log(x2)
+                   + rng.normal(0, 0.2, n) - np.abs(rng.normal(0, 0.3, n)))
+        df = pd.DataFrame({'input1': x1, 'input2': x2, 'output1': y, 'id': range(n)})
+
+        _, metrics_single = utils.calculate_sfa_metrics(df, ['input1', 'input2'], ['output1'])
+        result_df, metrics = utils.calculate_sfa_metrics(
+            df, ['input1', 'input2'], ['output1'], n_starts=4, n_jobs=2
+        )
+
+        conv = metrics['convergencia']
+        assert conv['n_starts'] == 4
+        assert len(conv['inicios']) == 4
+        for key in ['convergio', 'norma_gradiente', 'iteraciones', 'tiempo_total_s', 'log_likelihood']:
+            assert key in conv
+        # El óptimo elegido es el de mayor log-verosimilitud entre los arranques
+        assert conv['log_likelihood'] >= metrics_single['convergencia']['log_likelihood'] - 1e-8
+        assert conv['log_likelihood'] == pytest.approx(max(i['log_likelihood'] for i in conv['inicios']))
+        assert conv['convergio']
+        assert not conv['lambda_degenerado']
+        assert (result_df['ET SFA'] > 0).all()
+
 
 class TestDEAMetrics:
     """Pruebas para calculate_dea_metrics."""
@@ -247,6 +275,56 @@ class TestPCAFunctions:
         assert 'PC3' not in result_df.columns
 
 
+    def test_run_pca_cached_basis(self, monkeypatch):
+        """La base se ajusta una vez; otro n_components solo recorta y proyecta."""
+        from sklearn.decomposition import PCA
+
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame(rng.normal(size=(30, 4)), columns=['a', 'b', 'c', 'd'])
+        utils._PCA_BASIS_CACHE.clear()
+
+        df3, meta3 = utils.run_pca(df, ['a', 'b', 'c', 'd'], n_components=3)
+        monkeypatch.setattr(PCA, "fit", lambda *a, **kw: pytest.fail("no debe reajustar"))
+        df2, meta2 = utils.run_pca(df, ['a', 'b', 'c', 'd'], n_components=2)
+
+        np.testing.assert_allclose(df2.to_numpy(), df3[['PC1', 'PC2']].to_numpy())
+        assert meta2['explained_variance_ratio'] == meta3['explained_variance_ratio'][:2]
+
+        # Proyección de otro conjunto en la misma base
+        otro = df + 1.0
+        df_otro, meta_otro = utils.run_pca(otro, ['a', 'b', 'c', 'd'], n_components=2, basis_df=df)
+        assert meta_otro['components'].equals(meta2['components'])
+        assert not np.allclose(df_otro.to_numpy(), df2.to_numpy())
+
+
+    def test_run_pca_solver_selection(self):
+        """SVD truncada para matrices anchas con pocas componentes; coincide con la exacta."""
+        rng = np.random.default_rng(1)
+        cols = [f"v{i}" for i in range(60)]
+        df = pd.DataFrame(rng.normal(size=(80, 3)) @ rng.normal(size=(3, 60)) * 5
+                          + rng.normal(size=(80, 60)), columns=cols)
+
+        assert utils._pca_solver((80, 60), 2) == "randomized"
+        assert utils._pca_solver((80, 6), 2) == "exact"
+        assert utils._pca_solver((80, 60), None) == "exact"
+
+        df_rand, meta_rand = utils.run_pca(df, cols, n_components=2)
+        df_exact, meta_exact = utils.run_pca(df, cols, n_components=2, solver="exact")
+        assert meta_rand['solver'] == "randomized" and meta_exact['solver'] == "exact"
+        np.testing.assert_allclose(meta_rand['explained_variance_ratio'],
+                                   meta_exact['explained_variance_ratio'], rtol=1e-6)
+        np.testing.assert_allclose(np.abs(df_rand.to_numpy()), np.abs(df_exact.to_numpy()),
+                                   rtol=1e-4, atol=1e-6)
+
+        df_32, meta_32 = utils.run_pca(df, cols, n_components=2, float32=True)
+        assert (df_32.dtypes == np.float32).all()
+        np.testing.assert_allclose(np.abs(df_32.to_numpy()), np.abs(df_rand.to_numpy()),
+                                   rtol=1e-3, atol=1e-3)
+
+        with pytest.raises(ValueError, match="solver"):
+            utils.run_pca(df, cols, solver="otro")
+
+
 class TestPCAKmeans:
     """Pruebas para pca_kmeans."""
     
@@ -301,6 +379,155 @@ class TestPCAKmeans:
         assert 'cluster' in result_df.columns
         assert 'k' in result_dict  # Nombre real del campo
 
+    def test_pca_kmeans_parallel_sweep_keeps_best_model(self, monkeypatch):
+        """El barrido en el pool coincide con el secuencial y no reajusta el ganador."""
+        from sklearn.cluster import KMeans
+        from sklearn.metrics import silhouette_score
+
+        rng = np.random.default_rng(5)
+        centers = np.array([[0, 0, 0], [5, 5, 0], [0, 5, 5]])
+        df = pd.DataFrame(np.vstack([c + rng.normal(0, 0.5, (15, 3)) for c in centers]),
+                          columns=['var1', 'var2', 'var3'])
+        feature_cols = ['var1', 'var2', 'var3']
+
+        df_seq, meta_seq = utils.pca_kmeans(df, feature_cols, k=None, k_max=6, n_jobs=1)
+        monkeypatch.setenv("WORKER_POOL_SIZE", "2")
+        df_par, meta_par = utils.pca_kmeans(df, feature_cols, k=None, k_max=6)
+
+        assert [s['k'] for s in meta_par['k_scores']] == [2, 3, 4, 5, 6]
+        assert meta_par['k_scores'] == meta_seq['k_scores']
+        assert meta_par['k'] == 3
+        np.testing.assert_array_equal(df_par['cluster'], df_seq['cluster'])
+
+        pcs = df_par[['PC1', 'PC2']].to_numpy()
+        labels = KMeans(n_clusters=3, n_init="auto", random_state=42).fit_predict(pcs)
+        np.testing.assert_array_equal(df_par['cluster'], labels)
+        assert meta_par['silhouette'] == pytest.approx(silhouette_score(pcs, labels))
+
+    @pytest.mark.parametrize("criterion", ["calinski_harabasz", "davies_bouldin", "gap"])
+    def test_pca_kmeans_criteria(self, monkeypatch, criterion):
+        """Todos los criterios salen del mismo barrido; el gap es reproducible en el pool."""
+        rng = np.random.default_rng(5)
+        centers = np.array([[0, 0, 0], [5, 5, 0], [0, 5, 5]])
+        df = pd.DataFrame(np.vstack([c + rng.normal(0, 0.5, (15, 3)) for c in centers]),
+                          columns=['var1', 'var2', 'var3'])
+        feature_cols = ['var1', 'var2', 'var3']
+
+        _, meta = utils.pca_kmeans(df, feature_cols, k=None, k_max=6,
+                                   criterion=criterion, n_jobs=1)
+        assert meta['k'] == 3
+        assert meta['criterion'] == criterion
+        assert {'inertia', 'calinski_harabasz', 'davies_bouldin', 'silhouette'} <= set(meta['k_scores'][0])
+
+        if criterion == "gap":
+            monkeypatch.setenv("WORKER_POOL_SIZE", "2")
+            _, meta_par = utils.pca_kmeans(df, feature_cols, k=None, k_max=6, criterion="gap")
+            assert [s['gap'] for s in meta_par['k_scores']] == [s['gap'] for s in meta['k_scores']]
+
+        with pytest.raises(ValueError, match="criterion"):
+            utils.pca_kmeans(df, feature_cols, criterion="otro")
+
+    def test_pca_ward_cached_recut(self, monkeypatch):
+        """Ward recupera los grupos y otro k solo recorta el árbol cacheado."""
+        from scipy.cluster import hierarchy
+
+        rng = np.random.default_rng(5)
+        centers = np.array([[0, 0, 0], [5, 5, 0], [0, 5, 5]])
+        df = pd.DataFrame(np.vstack([c + rng.normal(0, 0.5, (15, 3)) for c in centers]),
+                          columns=['var1', 'var2', 'var3'])
+        feature_cols = ['var1', 'var2', 'var3']
+        utils._LINKAGE_CACHE.clear()
+
+        df_out, meta = utils.pca_ward(df, feature_cols, k=None, k_max=6)
+        assert meta['k'] == 3
+        assert [s['k'] for s in meta['k_scores']] == [2, 3, 4, 5, 6]
+        assert pd.crosstab(df_out['cluster'], np.repeat([0, 1, 2], 15)).gt(0).sum().eq(1).all()
+        assert meta['linkage'].shape == (44, 4)
+        _, meta_gap = utils.pca_ward(df, feature_cols, k=None, k_max=6, criterion="gap")
+        assert 'gap' in meta_gap['k_scores'][0]
+
+        calls = []
+        monkeypatch.setattr(hierarchy, "linkage", lambda *a, **kw: calls.append(a))
+        df_k4, meta_k4 = utils.pca_ward(df, feature_cols, k=4)
+        assert calls == []
+        assert meta_k4['k'] == 4 and df_k4['cluster'].nunique() == 4
+        assert meta_k4['linkage'] is meta['linkage']
+        # La caché no retiene la matriz de distancias n × n
+        assert all(len(tree) == 3 for tree in utils._LINKAGE_CACHE.values())
+
+    def test_cluster_stability(self, monkeypatch):
+        """Grupos separados son estables; las etiquetas permutadas se alinean y el pool es reproducible."""
+        rng = np.random.default_rng(5)
+        centers = np.array([[0, 0, 0], [5, 5, 0], [0, 5, 5]])
+        df = pd.DataFrame(np.vstack([c + rng.normal(0, 0.5, (15, 3)) for c in centers]),
+                          columns=['var1', 'var2', 'var3'])
+        feature_cols = ['var1', 'var2', 'var3']
+        df_out, _ = utils.pca_kmeans(df, feature_cols, k=3)
+        labels = df_out['cluster'].to_numpy()
+
+        stab, meta = utils.cluster_stability(df, feature_cols, labels, n_resamples=40, n_jobs=1)
+        assert stab.index.equals(df.index)
+        assert meta['mean_stability'] > 0.95
+        assert meta['reference_agreement'] == 1.0
+        np.testing.assert_array_equal(stab['consensus_cluster'], labels)
+        assert meta['coassignment_matrix'].shape == (45, 45)
+        np.testing.assert_allclose(np.diag(meta['coassignment_matrix']), 1.0)
+
+        # Alineación: una permutación de etiquetas se deshace por completo
+        perm = np.array([2, 0, 1])
+        aligned = utils._align_labels(np.vstack([labels, perm[labels]]), labels, 3)
+        np.testing.assert_array_equal(aligned, np.vstack([labels, labels]))
+
+        monkeypatch.setenv("WORKER_POOL_SIZE", "2")
+        stab_par, _ = utils.cluster_stability(df, feature_cols, labels, n_resamples=40, mode="both")
+        stab_seq, _ = utils.cluster_stability(df, feature_cols, labels, n_resamples=40, mode="both", n_jobs=1)
+        pd.testing.assert_frame_equal(stab_par, stab_seq)
+
+        with pytest.raises(ValueError, match="mode"):
+            utils.cluster_stability(df, feature_cols, labels, mode="otro")
+
+
+class TestPCAKmeansPanel:
+    """Pruebas para el clustering del panel completo por bloques."""
+
+    @staticmethod
+    def _panel():
+        # Dos grupos bien separados; los hospitales 1 y 2 migran del grupo A al B en 2015
+        rows = []
+        rng = np.random.default_rng(2)
+        for year in (2014, 2015):
+            for h in range(1, 9):
+                grupo_b = h > 4 or (year == 2015 and h <= 2)
+                base = np.array([10.0, 10.0, 10.0]) if grupo_b else np.zeros(3)
+                rows.append({'hospital_id': h, 'año': year,
+                             **dict(zip(['v1', 'v2', 'v3'], base + rng.normal(0, 0.3, 3)))})
+        return pd.DataFrame(rows)
+
+    def test_panel_labels_and_transitions(self):
+        df = self._panel()
+        chunks = lambda: (df.iloc[i:i + 5] for i in range(0, len(df), 5))
+
+        df_out, meta = utils.pca_kmeans_panel(chunks, ['v1', 'v2', 'v3'], k=2, batch_size=6)
+
+        assert meta['n_observations'] == 16
+        assert meta['years'] == [2014, 2015]
+        assert meta['n_transitions'] == 8
+        assert meta['transition_counts'].sum() == 8
+
+        lab = df_out.set_index(['hospital_id', 'año'])['cluster']
+        a, b = lab[(3, 2014)], lab[(5, 2014)]
+        assert a != b
+        assert meta['transition_counts'][a, b] == 2      # hospitales 1 y 2
+        assert meta['transition_counts'][a, a] == 2      # hospitales 3 y 4
+        assert meta['transition_counts'][b, b] == 4
+        np.testing.assert_allclose(meta['transition_matrix'].sum(axis=1), 1.0)
+
+    def test_panel_auto_k_on_sample(self):
+        df = self._panel()
+        _, meta = utils.pca_kmeans_panel(lambda: iter([df]), ['v1', 'v2', 'v3'], k_max=4)
+        assert meta['k'] == 2
+        assert [s['k'] for s in meta['k_scores']] == [2, 3, 4]
+
 
 class TestMalmquistCalculations:
     """Tests para cálculos del índice de Malmquist"""
@@ -450,6 +677,330 @@ class TestMalmquistCalculations:
         assert summary['n_hospitals'] == 2
 
 
+class TestMalmquistChain:
+    """Tests para el índice Malmquist encadenado."""
+
+    @staticmethod
+    def _panel(years, n=6):
+        rng = np.random.default_rng(7)
+        rows = []
+        for t, year in enumerate(years):
+            for i in range(n):
+                rows.append({
+                    'hospital_id': i + 1,
+                    'año': year,
+                    'input1': rng.uniform(80, 120) + 5 * t,
+                    'input2': rng.uniform(150, 250),
+                    'output1': rng.uniform(40, 70) + 3 * t * (i % 2)
+                })
+        return pd.DataFrame(rows)
+
+    def test_chain_matches_pairwise_and_accumulates(self):
+        years = [2014, 2015, 2016]
+        df = self._panel(years)
+        inputs, outputs = ['input1', 'input2'], ['output1']
+
+        df_chain, summary = utils.calculate_dea_malmquist_chain(df, inputs, outputs, n_jobs=1)
+
+        assert summary['years'] == years
+        assert summary['n_hospitals'] == 6
+        assert len(df_chain) == 6 * (len(years) - 1)
+        assert len(summary['por_periodo']) == 2
+
+        # Cada período coincide con el cálculo de dos años sobre los mismos hospitales
+        for a, b in zip(years[:-1], years[1:]):
+            pair, _ = utils.calculate_dea_malmquist_fast(
+                df[df['año'] == a], df[df['año'] == b], inputs, outputs, n_jobs=1
+            )
+            chain = df_chain[df_chain.year_t == a].set_index('hospital_id')
+            np.testing.assert_allclose(chain['Malmquist'], pair['Malmquist'], rtol=1e-6)
+            np.testing.assert_allclose(chain['TECH'], pair['TECH'], rtol=1e-6)
+
+        # El acumulado es el producto de los índices de cada período
+        acum = df_chain.groupby('hospital_id')['Malmquist'].prod()
+        last = df_chain[df_chain.year_t1 == years[-1]].set_index('hospital_id')['Malmquist_acum']
+        np.testing.assert_allclose(last.sort_index(), acum.sort_index())
+
+    def test_chain_requires_balanced_panel(self):
+        df = self._panel([2014, 2015])
+        df = df[~((df.hospital_id == 1) & (df['año'] == 2015))]
+        df_chain, summary = utils.calculate_dea_malmquist_chain(df, ['input1', 'input2'], ['output1'], n_jobs=1)
+        assert 1 not in df_chain.hospital_id.values
+        assert summary['n_hospitals'] == 5
+
+        with pytest.raises(ValueError, match="al menos dos años"):
+            utils.calculate_dea_malmquist_chain(df, ['input1'], ['output1'], years=[2014])
+
+    def test_global_frontier_reduction_matches_full_pool(self):
+        df = self._panel([2014, 2015, 2016], n=8)
+        inputs, outputs = ['input1', 'input2'], ['output1']
+        X, Y = df[inputs].to_numpy(float), df[outputs].to_numpy(float)
+
+        XG, YG = utils._technology_frontier(df, inputs, outputs, "global", None, "VRS", "in")
+        assert len(XG) < len(X)
+        np.testing.assert_allclose(
+            utils._envelope_scores(XG, YG, X, Y, "VRS", "in"),
+            utils._envelope_scores(X, Y, X, Y, "VRS", "in"), atol=1e-6)
+
+    def test_global_chain_is_circular(self):
+        years = [2014, 2015, 2016]
+        df = self._panel(years)
+        inputs, outputs = ['input1', 'input2'], ['output1']
+
+        df_chain, summary = utils.calculate_dea_malmquist_chain(
+            df, inputs, outputs, n_jobs=1, technology="global")
+        direct, _ = utils.calculate_dea_malmquist_chain(
+            df, inputs, outputs, years=[2014, 2016], n_jobs=1,
+            technology="global", df_panel=df)
+
+        assert summary['technology'] == "global"
+        last = df_chain[df_chain.year_t1 == 2016].set_index('hospital_id')['Malmquist_acum']
+        np.testing.assert_allclose(last.sort_index(),
+                                   direct.set_index('hospital_id')['Malmquist'].sort_index())
+
+    def test_sequential_has_no_technical_regress(self):
+        df = self._panel([2014, 2015, 2016])
+        df_chain, _ = utils.calculate_dea_malmquist_chain(
+            df, ['input1', 'input2'], ['output1'], n_jobs=1, technology="sequential")
+        assert (df_chain['TECH'] >= 1 - 1e-6).all()
+
+        pair, _ = utils.calculate_dea_malmquist_fast(
+            df[df['año'] == 2015], df[df['año'] == 2016], ['input1', 'input2'], ['output1'],
+            n_jobs=1, technology="sequential", df_panel=df)
+        chain = df_chain[df_chain.year_t == 2015].set_index('hospital_id')
+        np.testing.assert_allclose(chain['Malmquist'], pair['Malmquist'], rtol=1e-6)
+
+    @pytest.mark.parametrize("technology", ["contemporaneous", "sequential"])
+    def test_full_decomposition(self, technology):
+        df = self._panel([2014, 2015, 2016])
+        inputs, outputs = ['input1', 'input2'], ['output1']
+
+        df_chain, summary = utils.calculate_dea_malmquist_chain(
+            df, inputs, outputs, n_jobs=1, technology=technology, decomposition="full")
+        basic, _ = utils.calculate_dea_malmquist_chain(
+            df, inputs, outputs, n_jobs=1, technology=technology)
+
+        np.testing.assert_allclose(df_chain['PEFFCH'] * df_chain['SECH'], df_chain['EFFCH'])
+        np.testing.assert_allclose(df_chain['Malmquist'], basic['Malmquist'])
+        assert (df_chain['EFF_VRS_t'] >= df_chain['EFF_t'] - 1e-9).all()
+        assert 'SECH_mean' in summary['por_periodo'][0]
+
+        # CRS y VRS resueltas sobre la misma matriz = llamadas separadas
+        X, Y = df[inputs].to_numpy(float), df[outputs].to_numpy(float)
+        both = utils._envelope_scores(X, Y, X, Y, ("CRS", "VRS"), "in")
+        np.testing.assert_allclose(both[:, 1], utils._envelope_scores(X, Y, X, Y, "VRS", "in"))
+
+        with pytest.raises(ValueError, match="rts='CRS'"):
+            utils.calculate_dea_malmquist_fast(
+                df[df['año'] == 2014], df[df['año'] == 2015], inputs, outputs,
+                rts="VRS", decomposition="full")
+
+    def test_invalid_technology(self):
+        df = self._panel([2014, 2015])
+        with pytest.raises(ValueError, match="technology"):
+            utils.calculate_dea_malmquist_chain(df, ['input1'], ['output1'], technology="otra")
+
+
+class TestLuenberger:
+    """Tests para el indicador de Luenberger con distancias direccionales."""
+
+    def test_directional_distance_matches_radial(self):
+        rng = np.random.default_rng(3)
+        X, Y = rng.uniform(1, 10, (12, 2)), rng.uniform(1, 10, (12, 1))
+        beta = utils._directional_scores(X, Y, X, Y, "CRS", "in")
+        theta = utils._envelope_scores(X, Y, X, Y, "CRS", "in", include_self=False)
+        np.testing.assert_allclose(beta, 1 - theta, atol=1e-9)
+
+    def test_luenberger_is_additive_and_stable(self):
+        df = TestMalmquistChain._panel([2014, 2015])
+        # Un hospital con producto casi nulo: Malmquist explota, Luenberger no
+        df.loc[(df.hospital_id == 1) & (df['año'] == 2014), 'output1'] = 1e-9
+        inputs, outputs = ['input1', 'input2'], ['output1']
+        df_t, df_t1 = df[df['año'] == 2014], df[df['año'] == 2015]
+
+        df_out, summary = utils.calculate_luenberger(df_t, df_t1, inputs, outputs)
+
+        assert summary['n_hospitals'] == 6
+        assert np.isfinite(df_out.to_numpy()).all()
+        np.testing.assert_allclose(df_out['Luenberger'], df_out['LEFFCH'] + df_out['LTECH'])
+        assert df_out.loc[1, 'Luenberger'] > 0
+
+        pair, _ = utils.calculate_dea_malmquist_fast(df_t, df_t1, inputs, outputs, n_jobs=1)
+        malmquist = pair.loc[1, 'Malmquist']
+        assert not np.isfinite(malmquist) or malmquist > 1e6
+
+        with pytest.raises(ValueError, match="direction"):
+            utils.calculate_luenberger(df_t, df_t1, inputs, outputs, direction="otra")
+
+
+class TestDeterminantAnalysis:
+    """Pruebas para el OLS de determinant_analysis."""
+
+    def test_qr_ols_matches_statsmodels(self):
+        """El OLS por QR reproduce a statsmodels (también con regresores colineales)."""
+        import statsmodels.api as sm
+
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame(rng.normal(size=(40, 3)), columns=['a', 'b', 'c'])
+        df['y'] = 1 + 2 * df['a'] - df['b'] + rng.normal(size=40)
+        df['d'] = 2 * df['a']
+
+        for cols in (['a', 'b', 'c'], ['a', 'b', 'd']):
+            table, meta = utils.determinant_analysis(df, 'y', cols)
+            model = sm.OLS(df['y'], sm.add_constant(df[cols])).fit()
+            np.testing.assert_allclose(table['Coef.'], model.params, rtol=1e-8)
+            np.testing.assert_allclose(table['Std.Err.'], model.bse, rtol=1e-8)
+            np.testing.assert_allclose(table['P>|t|'], model.pvalues, rtol=1e-6, atol=1e-12)
+            assert meta['r2_adj'] == pytest.approx(model.rsquared_adj)
+            assert meta['aic'] == pytest.approx(model.aic)
+
+        table, meta = utils.determinant_analysis(df, 'y', ['a', 'b', 'c'])
+        assert meta['top_vars'][:2] == ['a', 'b']
+        assert 'c' not in meta['top_vars']
+
+        _, meta_sm = utils.determinant_analysis(df, 'y', ['a', 'b', 'c'], ols_backend="statsmodels")
+        assert meta_sm['r2'] == pytest.approx(meta['r2'])
+        assert 'condition_number' in meta_sm['diagnostics']
+
+        with pytest.raises(ValueError, match="ols_backend"):
+            utils.determinant_analysis(df, 'y', ['a'], ols_backend="otro")
+
+    def test_determinant_search_matches_full_refits(self):
+        """Los puntajes incrementales coinciden con reajustar cada subconjunto."""
+        from itertools import combinations
+
+        rng = np.random.default_rng(0)
+        cols = [f"v{i}" for i in range(6)]
+        df = pd.DataFrame(rng.normal(size=(50, 6)) * [1e7, 1, 100, 1, 1, 1], columns=cols)
+        df['v5'] = 2 * df['v1'] + df['v2']          # colineal: se descarta
+        df['y'] = 0.8 * df['v1'] - 0.5 * df['v3'] + rng.normal(size=50)
+
+        models, meta = utils.determinant_search(df, 'y', cols, top_n=100)
+        n_full_rank = sum(1 for r in range(1, 7) for c in combinations(cols, r)
+                          if not {'v1', 'v2', 'v5'} <= set(c))
+        assert meta['n_models_evaluated'] == len(models) == n_full_rank
+        assert models['aic'].is_monotonic_increasing
+        for _, row in models.iterrows():
+            X, _, has_const = utils._design_matrix(df, row['variables'], True)
+            fit = utils._ols_qr(df['y'].to_numpy(), X, has_const)
+            assert row['aic'] == pytest.approx(fit['aic'])
+            assert row['r2_adj'] == pytest.approx(fit['r2_adj'])
+
+        stepwise, meta_sw = utils.determinant_search(df, 'y', cols, method="stepwise")
+        assert {'v1', 'v3'} <= set(stepwise.at[0, 'variables'])
+        assert meta_sw['n_models_evaluated'] < meta['n_models_evaluated']
+
+        limited, _ = utils.determinant_search(df, 'y', cols, max_vars=2, criterion="r2_adj")
+        assert limited['n_vars'].max() <= 2
+        assert limited['r2_adj'].is_monotonic_decreasing
+
+    def test_tobit_and_truncated_regression(self):
+        """Tobit/truncado: gradiente analítico, igualdad con OLS sin censura y recuperación de β."""
+        from scipy.optimize import check_grad
+
+        rng = np.random.default_rng(3)
+        n = 400
+        df = pd.DataFrame({'a': rng.normal(size=n), 'b': rng.normal(size=n)})
+        latent = 0.8 + 0.15 * df['a'] - 0.1 * df['b'] + rng.normal(scale=0.1, size=n)
+        df['y'] = latent.clip(upper=1.0)
+        X, _, _ = utils._design_matrix(df, ['a', 'b'], True)
+        y = df['y'].to_numpy()
+
+        for model in ("tobit", "truncated"):
+            mask = y < 1 if model == "truncated" else slice(None)
+            err = check_grad(lambda t: -utils._bounded_loglik(t, y[mask], X[mask], None, 1.0, model)[0],
+                             lambda t: -utils._bounded_loglik(t, y[mask], X[mask], None, 1.0, model)[1],
+                             np.array([0.7, 0.1, -0.1, np.log(0.12)]))
+            assert err < 1e-3
+
+        table, meta = utils.determinant_analysis(df, 'y', ['a', 'b'], regression="tobit")
+        assert meta['n_censored'] == int((y >= 1).sum()) > 0
+        assert meta['converged']
+        np.testing.assert_allclose(table['Coef.'], [0.8, 0.15, -0.1], atol=0.03)
+        ols, _ = utils.determinant_analysis(df, 'y', ['a', 'b'])
+        assert abs(ols.at[1, 'Coef.']) < abs(table.at[1, 'Coef.'])      # OLS atenúa
+
+        table_tr, meta_tr = utils.determinant_analysis(df, 'y', ['a', 'b'], regression="truncated")
+        assert meta_tr['n_observations'] == int((y < 1).sum())
+        np.testing.assert_allclose(table_tr['Coef.'], [0.8, 0.15, -0.1], atol=0.05)
+
+        # Sin observaciones censuradas el Tobit es el OLS (con σ de máxima verosimilitud)
+        table_nc, _ = utils.determinant_analysis(df, 'y', ['a', 'b'], regression="tobit", upper=10.0)
+        ols_nc, _ = utils.determinant_analysis(df, 'y', ['a', 'b'])
+        np.testing.assert_allclose(table_nc['Coef.'], ols_nc['Coef.'], rtol=1e-5, atol=1e-7)
+
+        with pytest.raises(ValueError, match="regression"):
+            utils.determinant_analysis(df, 'y', ['a'], regression="otro")
+
+    def test_simar_wilson_bootstrap(self):
+        """Doble bootstrap: recupera β, los intervalos lo contienen y el avance es monótono."""
+        rng = np.random.default_rng(0)
+        n = 60
+        df = pd.DataFrame({'z1': rng.normal(size=n), 'x1': rng.uniform(50, 150, n),
+                           'x2': rng.uniform(50, 150, n)})
+        theta = np.clip(0.75 + 0.1 * df['z1'] + rng.normal(scale=0.05, size=n), 0.2, 1)
+        df['y1'] = np.sqrt(df['x1'] * df['x2']) * theta
+
+        avance = []
+        kwargs = dict(dependent='eficiencia', independents=['z1'], efficiency_method='DEA',
+                      input_cols=['x1', 'x2'], output_cols=['y1'], regression='simar_wilson',
+                      bootstrap_reps=(10, 50), n_jobs=1)
+        table, meta = utils.determinant_analysis(df, progress=lambda f, etapa: avance.append((f, etapa)),
+                                                 **kwargs)
+        assert table.at[1, 'Coef.'] == pytest.approx(0.1, abs=0.03)
+        assert (table['[0.025'] < table['Coef.']).all() and (table['Coef.'] < table['0.975]']).all()
+        assert (table['Std.Err.'] > 0).all()
+        assert meta['bootstrap_reps'] == (10, 50)
+        assert len(meta['bias_corrected']) == n
+        # Corrección de sesgo: los puntajes DEA sobreestiman la eficiencia
+        assert meta['mean_bias'] > 0
+        fracciones = [f for f, _ in avance]
+        assert fracciones == sorted(fracciones) and fracciones[-1] == pytest.approx(1.0)
+        assert {etapa for _, etapa in avance} == {'dea', 'regresion'}
+
+        # Misma semilla → mismo resultado
+        table_2, _ = utils.determinant_analysis(df, **kwargs)
+        np.testing.assert_allclose(table_2['0.975]'], table['0.975]'])
+
+        with pytest.raises(ValueError, match="simar_wilson"):
+            utils.determinant_analysis(df, **{**kwargs, 'efficiency_method': 'SFA'})
+
+    @pytest.mark.parametrize("panel", ["within", "twoway"])
+    def test_panel_fixed_effects_match_dummies(self, panel):
+        """Demeaning por grupo = OLS con dummies densas (panel desbalanceado), SE cluster por hospital."""
+        import statsmodels.api as sm
+
+        rng = np.random.default_rng(1)
+        H, T = 30, 6
+        df = pd.DataFrame({'hospital_id': np.repeat(np.arange(H), T),
+                           'año': np.tile(np.arange(2014, 2014 + T), H)})
+        efecto = rng.normal(size=H)[df['hospital_id']]
+        df['x1'] = rng.normal(size=H * T) + efecto
+        df['x2'] = rng.normal(size=H * T)
+        df['x3'] = np.repeat(rng.normal(size=H), T)          # constante por hospital
+        df['y'] = 0.5 * df['x1'] - 0.3 * df['x2'] + 2 * efecto + rng.normal(size=H * T)
+        df = df.sample(frac=0.8, random_state=0)
+
+        table, meta = utils.determinant_analysis(df, 'y', ['x1', 'x2', 'x3'], panel=panel)
+        assert list(table['variable']) == ['x1', 'x2']
+        assert meta['dropped_vars'] == ['x3']
+        assert meta['n_entities'] == H
+
+        dummies = [pd.get_dummies(df['hospital_id'], prefix='h', dtype=float)]
+        if panel == "twoway":
+            dummies.append(pd.get_dummies(df['año'], prefix='t', drop_first=True, dtype=float))
+        X = pd.concat([df[['x1', 'x2']], *dummies], axis=1)
+        model = sm.OLS(df['y'], X).fit(cov_type="cluster", cov_kwds={"groups": df['hospital_id']})
+        np.testing.assert_allclose(table['Coef.'], model.params[['x1', 'x2']], rtol=1e-7)
+        # statsmodels cuenta las dummies en K; los efectos anidados en el cluster no se cuentan
+        n = len(df)
+        ajuste = np.sqrt((n - X.shape[1]) / (n - 2))
+        np.testing.assert_allclose(table['Std.Err.'], model.bse[['x1', 'x2']] * ajuste, rtol=1e-6)
+
+        with pytest.raises(ValueError, match="panel"):
+            utils.determinant_analysis(df, 'y', ['x1'], panel=panel, regression="tobit")
+
+
 class TestUtilityFunctions:
     """Pruebas para funciones utilitarias."""
     
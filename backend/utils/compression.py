@@ -0,0 +1,238 @@
+"""
+Compresión de respuestas (gzip / brotli) para los payloads grandes de análisis.
+
+Middleware ASGI configurable (umbral de tamaño y nivel por algoritmo) que:
+- elige brotli si el cliente lo acepta y el paquete `brotli` está instalado,
+  y si no gzip;
+- comprime una sola vez cada cuerpo distinto: las respuestas completas se
+  guardan ya comprimidas en una LRU acotada por bytes y direccionada por el
+  hash del cuerpo, así que los resultados que se repiten (respuestas cacheadas
+  en memoria, precalculadas o con el mismo ETag) solo cuestan un hash;
+- comprime por bloques las respuestas en streaming (NDJSON), sin cachearlas;
+- debilita el ETag de la variante comprimida (W/...), que If-None-Match sigue
+  aceptando con comparación débil (utils/http_cache.py).
+"""
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:                                      # dependencia opcional
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+# Cuerpos más grandes se comprimen en un hilo para no bloquear el event loop
+THREAD_THRESHOLD = 256 * 1024
+
+
+class CompressedCache:
+    """LRU de cuerpos comprimidos, acotada por el total de bytes guardados."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, old = self._items.popitem(last=False)
+                self.size -= len(old)
+
+
+class CompressionMiddleware:
+    """
+    Args:
+        minimum_size: cuerpos más chicos se envían sin comprimir
+        gzip_level: nivel de zlib (1-9)
+        brotli_quality: calidad de brotli (0-11)
+        cache_bytes: tamaño máximo de la caché de cuerpos comprimidos (0 la desactiva)
+        brotli_enabled: ofrecer brotli si está instalado
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5,
+                 cache_bytes: int = 64 * 1024 * 1024, brotli_enabled: bool = True):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = (("br",) if brotli_enabled and brotli is not None else ()) + ("gzip",)
+        self.cache = CompressedCache(cache_bytes) if cache_bytes > 0 else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = self.negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _Responder(self, encoding, send).send)
+
+    def negotiate(self, accept_encoding: str) -> str | None:
+        """Primera codificación soportada que el cliente acepta (q=0 la excluye)."""
+        accepted = set()
+        for item in accept_encoding.split(","):
+            name, *params = [part.strip() for part in item.split(";")]
+            q = 1.0
+            for param in params:
+                key, _, value = param.partition("=")
+                if key.strip() == "q":
+                    try:
+                        q = float(value)
+                    except ValueError:
+                        q = 0.0
+            if name and q > 0:
+                accepted.add(name.lower())
+        for encoding in self.encodings:
+            if encoding in accepted or "*" in accepted:
+                return encoding
+        return None
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return zlib.compress(body, self.gzip_level, wbits=31)
+
+    def compressor(self, encoding: str):
+        """Compresor incremental para respuestas en streaming."""
+        if encoding == "br":
+            return _BrotliStream(self.brotli_quality)
+        return _GzipStream(self.gzip_level)
+
+    async def compress_cached(self, body: bytes, encoding: str) -> bytes:
+        key = None
+        if self.cache is not None:
+            key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        if len(body) >= THREAD_THRESHOLD:
+            compressed = await anyio.to_thread.run_sync(self.compress, body, encoding)
+        else:
+            compressed = self.compress(body, encoding)
+        if key is not None:
+            self.cache.put(key, compressed)
+        return compressed
+
+
+class _GzipStream:
+    def __init__(self, level: int):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        # Z_SYNC_FLUSH: cada bloque NDJSON llega completo al cliente sin esperar al final
+        return self._z.compress(data) + self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush()
+
+
+class _BrotliStream:
+    def __init__(self, quality: int):
+        self._b = brotli.Compressor(quality=quality)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._b.process(data) + self._b.flush()
+
+    def finish(self) -> bytes:
+        return self._b.finish()
+
+
+class _Responder:
+    """Intercepta los mensajes de la respuesta y decide si comprimir al ver el primer bloque."""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.mw = middleware
+        self.encoding = encoding
+        self._send = send
+        self.start = None
+        self.mode = None                 # None (esperando cuerpo), "passthrough" o "stream"
+        self.stream = None
+
+    def _compressible(self, headers: MutableHeaders) -> bool:
+        return ("content-encoding" not in headers
+                and self.start["status"] not in (204, 206, 304)
+                and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES))
+
+    def _encoded_headers(self, headers: MutableHeaders):
+        headers["Content-Encoding"] = self.encoding
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+
+    async def send(self, message):
+        kind = message["type"]
+        if kind == "http.response.start":
+            self.start = message
+            return
+        if self.mode == "passthrough":
+            await self._send(message)
+            return
+        if kind != "http.response.body":           # p. ej. http.response.pathsend
+            self.mode = "passthrough"
+            await self._send(self.start)
+            await self._send(message)
+            return
+        if self.mode == "stream":
+            data = self.stream.chunk(message.get("body", b""))
+            if not message.get("more_body", False):
+                data += self.stream.finish()
+            await self._send({"type": "http.response.body", "body": data,
+                              "more_body": message.get("more_body", False)})
+            return
+
+        # Primer bloque del cuerpo
+        headers = MutableHeaders(raw=self.start["headers"])
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self._compressible(headers):
+            self.mode = "passthrough"
+            await self._send(self.start)
+            await self._send(message)
+            return
+        headers.add_vary_header("Accept-Encoding")
+
+        if more_body:
+            self.mode = "stream"
+            self.stream = self.mw.compressor(self.encoding)
+            self._encoded_headers(headers)
+            del headers["Content-Length"]
+            await self._send(self.start)
+            await self._send({"type": "http.response.body", "body": self.stream.chunk(body), "more_body": True})
+            return
+
+        self.mode = "passthrough"
+        if len(body) < self.mw.minimum_size:
+            await self._send(self.start)
+            await self._send(message)
+            return
+        compressed = await self.mw.compress_cached(body, self.encoding)
+        self._encoded_headers(headers)
+        headers["Content-Length"] = str(len(compressed))
+        await self._send(self.start)
+        await self._send({"type": "http.response.body", "body": compressed})
@@ -1,20 +1,32 @@
+import hashlib
+import time
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
 from pysfa import SFA
 from Pyfrontier.frontier_model import EnvelopDEA
-from typing import List, Tuple, Dict
-from joblib import Parallel, delayed
+from typing import Callable, Dict, Iterable, List, Tuple
+from scipy.optimize import linprog
+from utils import pool
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
-from typing import List, Tuple, Dict
+
+# Versiones de los algoritmos de eficiencia: forman parte de la especificación
+# de los resultados precalculados (utils/precompute.py), así que hay que
+# incrementarlas al cambiar calculate_sfa_metrics / calculate_dea_metrics de
+# forma que altere los puntajes; eso invalida lo guardado en efficiency_results
+SFA_ALGORITHM_VERSION = 1
+DEA_ALGORITHM_VERSION = 1
 
 def calculate_sfa_metrics(df: pd.DataFrame,
                           input_cols: list[str],
                           output_col: list[str],
                           te_threshold: float = 0.6,
                           fun: str = SFA.FUN_PROD,
-                          method: str = SFA.TE_teJ) -> tuple[pd.DataFrame, dict]:
+                          method: str = SFA.TE_teJ,
+                          n_starts: int = 1,
+                          n_jobs: int = 1) -> tuple[pd.DataFrame, dict]:
     """
     Ejecuta SFA sobre df y devuelve:
       - df_out: df con columna 'Eff_SFA'
@@ -34,6 +46,11 @@ def calculate_sfa_metrics(df: pd.DataFrame,
       Función a usar (SFA.FUN_PROD o FUN_COST).
     method : str
       Método de eficiencia (SFA.TE_teJ, TE_te, TE_teMod).
+    n_starts : int
+      Nº de valores iniciales de lambda a optimizar (1 ⇒ arranque único de pysfa).
+      Con más de uno se conserva el óptimo de mayor log-verosimilitud.
+    n_jobs : int
+      Workers del pool persistente para los arranques (-1 o None ⇒ todo el pool).
     """
     # 1) Si output_col es una lista, tomar solo el primer elemento
     if isinstance(output_col, list):
@@ -58,8 +75,9 @@ def calculate_sfa_metrics(df: pd.DataFrame,
         x = np.log(df_validos[input_cols]).to_numpy()
         y = np.log(df_validos[output_col_name]).to_numpy()
 
-        sfa = SFA.SFA(y, x, fun=fun, method=method)
-        sfa.optimize()
+        sfa, convergencia = _optimize_sfa_multistart(y, x, fun, method,
+                                                     n_starts=n_starts,
+                                                     n_jobs=n_jobs)
         
         # Extraer eficiencia
         te = np.array(sfa.get_technical_efficiency())
@@ -99,6 +117,7 @@ def calculate_sfa_metrics(df: pd.DataFrame,
         pct_crit = 100.0
         var_clave = "No determinada"
         lambda_varianza = 0.0
+        convergencia = None
     
     # 5) ASIGNAR ET SFA = 0 a hospitales inválidos
     if len(df_invalidos) > 0:
@@ -117,18 +136,89 @@ def calculate_sfa_metrics(df: pd.DataFrame,
     metrics = {        'et_promedio': et_promedio_total,      # Promedio incluyendo 0s
         'pct_criticos': pct_crit_total,        # % críticos incluyendo 0s
         'variable_clave': var_clave,
-        'varianza': float(lambda_varianza)
+        'varianza': float(lambda_varianza),
+        'convergencia': convergencia
     }
     return df_out, metrics
 
 
+def _fit_sfa_start(y: np.ndarray,
+                   x: np.ndarray,
+                   fun: str,
+                   method: str,
+                   lamda0: float):
+    """Optimiza la verosimilitud SFA desde un lambda inicial; devuelve (lamda0, resultado, segundos)."""
+    t0 = time.perf_counter()
+    res = SFA.SFA(y, x, fun=fun, method=method, lamda0=lamda0).optimize()
+    return lamda0, res, time.perf_counter() - t0
+
+
+def _sfa_lambda_starts(n_starts: int) -> list[float]:
+    """Valores iniciales de lambda: siempre el 1.0 de pysfa más una grilla logarítmica."""
+    if n_starts <= 1:
+        return [1.0]
+    grid = np.geomspace(0.05, 20.0, n_starts)
+    grid = np.delete(grid, np.argmin(np.abs(np.log(grid))))   # su lugar lo ocupa el 1.0
+    return [1.0] + grid.tolist()
+
+
+def _optimize_sfa_multistart(y: np.ndarray,
+                             x: np.ndarray,
+                             fun: str,
+                             method: str,
+                             n_starts: int = 1,
+                             n_jobs: int = 1):
+    """
+    Optimiza SFA desde varios lambda iniciales y devuelve:
+      - sfa          : modelo pysfa con el mejor óptimo congelado
+      - convergencia : dict con diagnósticos del óptimo elegido y de cada arranque
+
+    pysfa vuelve a ejecutar `optimize()` en cada getter (beta, lambda, TE, p-values…),
+    así que el óptimo elegido se fija en la instancia para no repetir la optimización.
+    """
+    t0 = time.perf_counter()
+    starts = _sfa_lambda_starts(n_starts)
+    fits = pool.run(_fit_sfa_start, [(y, x, fun, method, l0) for l0 in starts], n_jobs)
+
+    # Mejor log-verosimilitud, priorizando los arranques que convergieron
+    finitos = [f for f in fits if np.isfinite(f[1].fun)] or fits
+    convergidos = [f for f in finitos if f[1].success] or finitos
+    lamda0, res, _ = min(convergidos, key=lambda f: f[1].fun)
+
+    sfa = SFA.SFA(y, x, fun=fun, method=method, lamda0=lamda0)
+    sfa.optimize = lambda: res
+
+    def _diagnostico(l0, r, segundos):
+        return {
+            'lambda_inicial': float(l0),
+            'lambda': float(r.x[-1]),
+            'log_likelihood': float(-r.fun),
+            'convergio': bool(r.success),
+            'norma_gradiente': float(np.linalg.norm(r.jac)),
+            'iteraciones': int(r.nit),
+            'tiempo_s': float(segundos)
+        }
+
+    convergencia = {
+        **_diagnostico(lamda0, res, next(f[2] for f in fits if f[0] == lamda0)),
+        'mensaje': str(res.message),
+        'evaluaciones': int(res.nfev),
+        'lambda_degenerado': bool(abs(res.x[-1]) < 1e-2),
+        'n_starts': len(starts),
+        'tiempo_total_s': float(time.perf_counter() - t0),
+        'inicios': [_diagnostico(*f) for f in fits]
+    }
+    return sfa, convergencia
+
+
 def calculate_dea_metrics(df: pd.DataFrame,
                           input_cols: list[str],
                           output_cols: list[str],
                           orientation: str = "in",
                           rts: str = "CRS",
                           te_threshold: float = 0.6,
-                          n_jobs: int = 1
+                          n_jobs: int = 1,
+                          include_slacks: bool = False
                          ) -> tuple[pd.DataFrame, dict]:
     """
     Ejecuta un DEA y devuelve:
@@ -142,6 +232,7 @@ def calculate_dea_metrics(df: pd.DataFrame,
       orientation  : 'in' o 'out'
       rts          : 'CRS' o 'VRS'
       te_threshold : umbral para % críticos (score < te_threshold)
+      include_slacks : agrega columnas 'slack_<input>' (NaN en inválidos)
     """
     
     # 1) CREAR MÁSCARA de hospitales válidos (inputs y outputs > 0)
@@ -170,6 +261,9 @@ def calculate_dea_metrics(df: pd.DataFrame,
         
         # Asignar scores a hospitales válidos
         df_validos["ET DEA"] = scores_crs
+        if include_slacks:
+            for j, col in enumerate(input_cols):
+                df_validos[f"slack_{col}"] = slacks_crs[:, j]
         
         # KPI: promedio y críticos (solo de hospitales válidos)
         et_promedio = float(scores_crs.mean())
@@ -215,10 +309,75 @@ def calculate_dea_metrics(df: pd.DataFrame,
     
     return df_out, metrics
 
+_PCA_BASIS_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_PCA_BASIS_CACHE_MAXSIZE = 64
+
+PCA_SOLVERS = ("auto", "exact", "randomized")
+
+# Con solver='auto' se usa SVD truncada aleatorizada si la matriz es ancha
+# (muchas variables) o grande y se piden pocas componentes; si no, SVD exacta
+PCA_RANDOMIZED_MIN_FEATURES = 50
+PCA_RANDOMIZED_MIN_CELLS = 200_000
+
+
+def _pca_solver(shape: Tuple[int, int], n_components: int | None) -> str:
+    """Resuelve solver='auto' según la forma de la matriz y las componentes pedidas."""
+    n, p = shape
+    if n_components is None or n_components >= 0.8 * min(n, p):
+        return "exact"
+    if p >= PCA_RANDOMIZED_MIN_FEATURES or n * p >= PCA_RANDOMIZED_MIN_CELLS:
+        return "randomized"
+    return "exact"
+
+
+def _pca_basis(X: np.ndarray, feature_cols: List[str], scale: bool,
+               n_components: int | None = None, solver: str = "auto",
+               float32: bool = False):
+    """
+    Escalador y base PCA ajustados sobre X, cacheados por (contenido de X,
+    feature_cols, scale, solver, precisión).
+
+      - 'exact'      : descomposición completa (todas las componentes); cualquier
+                       n_components se obtiene recortando la misma base, así que
+                       las llamadas repetidas (otro n_components, /pca y luego
+                       /pca-clustering del mismo año) solo proyectan
+      - 'randomized' : SVD truncada aleatorizada con solo n_components
+                       direcciones, O(n·p·k) en vez de O(n·p·min(n, p))
+    float32=True ajusta en precisión simple (la mitad de memoria).
+    """
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.decomposition import PCA
+
+    X = np.ascontiguousarray(X, dtype=np.float32 if float32 else float)
+    if solver == "auto":
+        solver = _pca_solver(X.shape, n_components)
+    n_fit = n_components if solver == "randomized" else None
+    key = (hashlib.sha1(X.tobytes()).hexdigest(), X.shape, X.dtype.str,
+           tuple(feature_cols), scale, solver, n_fit)
+    if key in _PCA_BASIS_CACHE:
+        _PCA_BASIS_CACHE.move_to_end(key)
+        return _PCA_BASIS_CACHE[key]
+
+    scaler = StandardScaler(with_mean=scale, with_std=scale).fit(X)
+    if solver == "randomized":
+        pca = PCA(n_components=n_fit, svd_solver="randomized", random_state=0)
+    else:
+        pca = PCA()
+    basis = (scaler, pca.fit(scaler.transform(X)))
+
+    _PCA_BASIS_CACHE[key] = basis
+    if len(_PCA_BASIS_CACHE) > _PCA_BASIS_CACHE_MAXSIZE:
+        _PCA_BASIS_CACHE.popitem(last=False)
+    return basis
+
+
 def run_pca(df: pd.DataFrame,
             feature_cols: List[str],
             n_components: int | None = None,
-            scale: bool = True
+            scale: bool = True,
+            basis_df: pd.DataFrame | None = None,
+            solver: str = "auto",
+            float32: bool = False
            ) -> Tuple[pd.DataFrame, Dict]:
     """
     Ejecuta PCA sobre las columnas `feature_cols` y devuelve:
@@ -231,73 +390,180 @@ def run_pca(df: pd.DataFrame,
     feature_cols : columnas a incluir en el PCA (solo numéricas)
     n_components : nº de componentes (None ⇒ tantas como variables)
     scale        : estandarizar variables a media 0 y σ 1 antes de PCA
+    basis_df     : datos sobre los que se ajustan escalado y base (None ⇒ df);
+                   permite proyectar otro año en el espacio de componentes de
+                   un año de referencia. La base ajustada se cachea (_pca_basis)
+    solver       : 'auto', 'exact' o 'randomized' (ver _pca_basis)
+    float32      : calcular en precisión simple
     """
-    X = df[feature_cols].to_numpy(dtype=float)
-    
-    # Escalado opcional
-    if scale:
-        from sklearn.preprocessing import StandardScaler
-        X = StandardScaler().fit_transform(X)
-    
-    from sklearn.decomposition import PCA
-    pca = PCA(n_components=n_components)
-    pcs = pca.fit_transform(X)
+    if solver not in PCA_SOLVERS:
+        raise ValueError(f"solver debe ser uno de {PCA_SOLVERS}")
+    dtype = np.float32 if float32 else float
+    X = df[feature_cols].to_numpy(dtype=dtype)
+    X_fit = X if basis_df is None else basis_df[feature_cols].to_numpy(dtype=dtype)
+
+    n_max = min(X_fit.shape)
+    if n_components is None:
+        n_components = n_max
+    elif not 0 < n_components <= n_max:
+        raise ValueError(f"n_components={n_components} debe estar entre 1 y {n_max}")
+    scaler, pca = _pca_basis(X_fit, feature_cols, scale, n_components, solver, float32)
+
+    # Proyección sobre las n_components primeras direcciones de la base
+    components = pca.components_[:n_components]
+    pcs = (scaler.transform(X) - pca.mean_) @ components.T
     
-    pc_cols = [f"PC{i+1}" for i in range(pcs.shape[1])]
+    pc_cols = [f"PC{i+1}" for i in range(n_components)]
     df_pca  = pd.DataFrame(pcs, index=df.index, columns=pc_cols)
     
     metrics = {
-        "explained_variance_ratio": pca.explained_variance_ratio_.tolist(),
-        "components": pd.DataFrame(pca.components_,
+        "explained_variance_ratio": pca.explained_variance_ratio_[:n_components].tolist(),
+        "components": pd.DataFrame(components,
                                    index=pc_cols,
-                                   columns=feature_cols)
+                                   columns=feature_cols),
+        "solver": "randomized" if pca.svd_solver == "randomized" else "exact"
     }
     return df_pca, metrics
 
+CLUSTER_CRITERIA = ("silhouette", "calinski_harabasz", "davies_bouldin", "gap")
+
+# Por encima de este n la silhouette O(n²) solo se calcula si es el criterio
+# elegido; para el modelo final se estima con una muestra
+SILHOUETTE_MAX_N = 2000
+
+
+def _fit_kmeans_k(Z, D, k: int, random_state: int):
+    """
+    Ajusta K-means con k clusters y evalúa los criterios sobre ese mismo ajuste:
+    inercia, Calinski–Harabasz y Davies–Bouldin (O(n·k)) y, si se entrega la
+    matriz de distancias D, silhouette con métrica precomputada.
+    """
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import (silhouette_score, calinski_harabasz_score,
+                                 davies_bouldin_score)
+    Z, D = pool.load(Z), pool.load(D)
+    km = KMeans(n_clusters=k, n_init="auto", random_state=random_state)
+    labels = km.fit_predict(Z)
+    scores = {"k": k,
+              "inertia": float(km.inertia_),
+              "calinski_harabasz": float(calinski_harabasz_score(Z, labels)),
+              "davies_bouldin": float(davies_bouldin_score(Z, labels))}
+    if D is not None:
+        scores["silhouette"] = float(silhouette_score(D, labels, metric="precomputed"))
+    return km, scores
+
+
+def _gap_reference_draw(lo, hi, n: int, ks: List[int], seed, random_state: int):
+    """log(W*_k) de un conjunto uniforme de referencia en la caja [lo, hi] (estadístico gap)."""
+    from sklearn.cluster import KMeans
+    R = np.random.default_rng(seed).uniform(lo, hi, size=(n, len(lo)))
+    return np.log([KMeans(n_clusters=kk, n_init="auto", random_state=random_state)
+                   .fit(R).inertia_ for kk in ks])
+
+
+def _select_k(k_scores: List[Dict], criterion: str) -> int:
+    """Posición del k elegido según el criterio."""
+    if criterion == "silhouette":
+        return int(np.argmax([s["silhouette"] for s in k_scores]))
+    if criterion == "calinski_harabasz":
+        return int(np.argmax([s["calinski_harabasz"] for s in k_scores]))
+    if criterion == "davies_bouldin":
+        return int(np.argmin([s["davies_bouldin"] for s in k_scores]))
+    # gap (Tibshirani et al.): menor k con Gap(k) >= Gap(k+1) - s(k+1)
+    gap = np.array([s["gap"] for s in k_scores])
+    se = np.array([s["gap_se"] for s in k_scores])
+    ok = np.flatnonzero(gap[:-1] >= gap[1:] - se[1:])
+    return int(ok[0]) if len(ok) else int(np.argmax(gap))
+
+
+def _sweep_k(Z: np.ndarray, ks: List[int], criterion: str, random_state: int,
+             n_jobs: int | None = None, gap_draws: int = 10):
+    """
+    Ajusta K-means para cada k de ks (en paralelo en el pool), evalúa los
+    criterios sobre esos mismos ajustes y devuelve (modelo elegido, sus
+    puntajes, puntajes de todos los k).
+    """
+    from sklearn.metrics import pairwise_distances
+
+    with_silhouette = criterion == "silhouette" or len(Z) <= SILHOUETTE_MAX_N
+    D = pairwise_distances(Z) if with_silhouette else None
+
+    parallel = len(ks) > 1 and pool.effective_workers(n_jobs) > 1
+    if parallel:
+        with pool.shared_arrays({"Z": Z} if D is None else {"Z": Z, "D": D}) as shm:
+            fits = pool.run(_fit_kmeans_k,
+                            [(shm["Z"], shm.get("D"), kk, random_state) for kk in ks], n_jobs)
+    else:
+        fits = [_fit_kmeans_k(Z, D, kk, random_state) for kk in ks]
+    k_scores = [sc for _, sc in fits]
+
+    # Estadístico gap: referencias uniformes en la caja de Z, sembradas y en paralelo
+    if criterion == "gap" and len(ks) > 1:
+        seeds = np.random.SeedSequence(random_state).spawn(gap_draws)
+        ref = np.array(pool.run(_gap_reference_draw,
+                                [(Z.min(axis=0), Z.max(axis=0), len(Z), ks, sd, random_state)
+                                 for sd in seeds],
+                                n_jobs if parallel else 1))
+        log_w = np.log([sc["inertia"] for sc in k_scores])
+        for i, sc in enumerate(k_scores):
+            sc["gap"] = float(ref[:, i].mean() - log_w[i])
+            sc["gap_se"] = float(ref[:, i].std() * np.sqrt(1 + 1 / gap_draws))
+
+    kmeans, best = fits[_select_k(k_scores, criterion)] if len(ks) > 1 else fits[0]
+    return kmeans, best, k_scores
+
+
 def pca_kmeans(df: pd.DataFrame,
                feature_cols: List[str],
                n_components: int = 2,
                k: int | None = None,
                k_max: int = 10,
                scale: bool = True,
-               random_state: int = 42
+               random_state: int = 42,
+               n_jobs: int | None = None,
+               criterion: str = "silhouette",
+               gap_draws: int = 10
               ) -> Tuple[pd.DataFrame, Dict]:
     """
     1) Ejecuta PCA con run_pca
-    2) Aplica K-means (elige k óptimo con silhouette si k=None)
+    2) Aplica K-means (elige k óptimo según `criterion` si k=None)
     3) Devuelve df con PCs y 'cluster', y un diccionario de metadatos
+
+    Con k=None los k de 2..k_max se ajustan en paralelo en el pool de workers y
+    todos los criterios se evalúan sobre esos mismos ajustes; se conserva el
+    modelo ganador sin reajustarlo. meta['k_scores'] trae las curvas por k.
+
+    criterion:
+      - 'silhouette'        : máximo (O(n²); la matriz de distancias se calcula una vez)
+      - 'calinski_harabasz' : máximo (O(n·k))
+      - 'davies_bouldin'    : mínimo (O(n·k))
+      - 'gap'               : estadístico gap con `gap_draws` referencias
+                              uniformes sembradas desde random_state, en paralelo
     """
+    from sklearn.metrics import silhouette_score
+
+    if criterion not in CLUSTER_CRITERIA:
+        raise ValueError(f"criterion debe ser uno de {CLUSTER_CRITERIA}")
+
     # ---- PCA --------------------------------------------------
     df_pca, pca_meta = run_pca(df, feature_cols,
                                n_components=n_components,
                                scale=scale)
     pc_cols = df_pca.columns.tolist()
+    Z = df_pca[pc_cols].to_numpy()
+    ks = list(range(2, min(k_max, len(Z) - 1) + 1)) if k is None else [k]
+    if not ks:
+        raise ValueError("Se necesitan al menos 3 observaciones para elegir k")
 
-    # ---- elegir k si no viene fijo ---------------------------
-    if k is None:
-        best_k, best_score = 2, -1
-        for kk in range(2, k_max + 1):
-            from sklearn.cluster import KMeans
-            from sklearn.metrics import silhouette_score
-            km = KMeans(n_clusters=kk, n_init="auto", random_state=random_state)
-            labels = km.fit_predict(df_pca[pc_cols])
-            score = silhouette_score(df_pca[pc_cols], labels)
-            if score > best_score:
-                best_k, best_score = kk, score
-        k = best_k
-        silhouette_best = best_score
+    # ---- barrido de k (o k fijo) -------------------------------
+    kmeans, best, k_scores = _sweep_k(Z, ks, criterion, random_state, n_jobs, gap_draws)
+    k = kmeans.n_clusters
+    cluster_labels = kmeans.labels_
+    if "silhouette" in best:
+        silhouette_best = best["silhouette"]
     else:
-        silhouette_best = None
-
-    # ---- K-means definitivo -----------------------------------
-    from sklearn.cluster import KMeans
-    from sklearn.metrics import silhouette_score
-    kmeans = KMeans(n_clusters=k, n_init="auto", random_state=random_state)
-    cluster_labels = kmeans.fit_predict(df_pca[pc_cols])
-
-    # calcular silhouette si no se calculó antes
-    if silhouette_best is None:
-        silhouette_best = silhouette_score(df_pca[pc_cols], cluster_labels)
+        silhouette_best = float(silhouette_score(
+            Z, cluster_labels, sample_size=SILHOUETTE_MAX_N, random_state=random_state))
 
     # ---- ensamblar DataFrame de salida ------------------------
     df_out = df.copy()
@@ -309,13 +575,415 @@ def pca_kmeans(df: pd.DataFrame,
         "explained_variance_ratio": pca_meta["explained_variance_ratio"],
         "components": pca_meta["components"],
         "k": k,
+        "criterion": criterion,
         "silhouette": silhouette_best,
+        "k_scores": k_scores,
         "cluster_centers": pd.DataFrame(kmeans.cluster_centers_,
                                         columns=pc_cols)
     }
     return df_out, meta
 
 
+CLUSTER_ALGORITHMS = ("kmeans", "ward")
+
+# Solo se cachean Z (n × n_components), la matriz de enlace ((n-1) × 4) y los
+# metadatos del PCA, que crecen linealmente con n; la matriz de distancias
+# n × n de la silueta se calcula en cada llamada
+_LINKAGE_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_LINKAGE_CACHE_MAXSIZE = 32
+
+
+def _ward_tree(df: pd.DataFrame, feature_cols: List[str], n_components: int, scale: bool):
+    """
+    PCA + árbol de Ward (scipy linkage) de df, cacheados por
+    (contenido de las variables, feature_cols, scale, n_components): pedir otro
+    k para el mismo año solo vuelve a cortar el dendrograma.
+    Devuelve (Z, pca_meta, linkage).
+    """
+    from scipy.cluster.hierarchy import linkage
+
+    X = np.ascontiguousarray(df[feature_cols].to_numpy(dtype=float))
+    key = (hashlib.sha1(X.tobytes()).hexdigest(), X.shape,
+           tuple(feature_cols), scale, n_components)
+    if key in _LINKAGE_CACHE:
+        _LINKAGE_CACHE.move_to_end(key)
+        return _LINKAGE_CACHE[key]
+
+    df_pca, pca_meta = run_pca(df, feature_cols, n_components=n_components, scale=scale)
+    Z = df_pca.to_numpy()
+    tree = (Z, pca_meta, linkage(Z, method="ward"))
+
+    _LINKAGE_CACHE[key] = tree
+    if len(_LINKAGE_CACHE) > _LINKAGE_CACHE_MAXSIZE:
+        _LINKAGE_CACHE.popitem(last=False)
+    return tree
+
+
+def _cut_tree_scores(Z: np.ndarray, L: np.ndarray, D, k: int) -> Tuple[np.ndarray, Dict]:
+    """Corta el árbol en k clusters (etiquetas 0..k-1) y evalúa los criterios del corte."""
+    from scipy.cluster.hierarchy import fcluster
+    from sklearn.metrics import (silhouette_score, calinski_harabasz_score,
+                                 davies_bouldin_score)
+    labels = fcluster(L, k, criterion="maxclust") - 1
+    centers = np.vstack([Z[labels == c].mean(axis=0) for c in range(labels.max() + 1)])
+    scores = {"k": k,
+              "inertia": float(((Z - centers[labels]) ** 2).sum()),
+              "calinski_harabasz": float(calinski_harabasz_score(Z, labels)),
+              "davies_bouldin": float(davies_bouldin_score(Z, labels))}
+    if D is not None:
+        scores["silhouette"] = float(silhouette_score(D, labels, metric="precomputed"))
+    return labels, scores
+
+
+def _ward_gap_reference(lo, hi, n: int, ks: List[int], seed):
+    """log(W*_k) de los cortes de Ward de un conjunto uniforme de referencia."""
+    from scipy.cluster.hierarchy import linkage
+    R = np.random.default_rng(seed).uniform(lo, hi, size=(n, len(lo)))
+    L = linkage(R, method="ward")
+    return np.log([_cut_tree_scores(R, L, None, kk)[1]["inertia"] for kk in ks])
+
+
+def pca_ward(df: pd.DataFrame,
+             feature_cols: List[str],
+             n_components: int = 2,
+             k: int | None = None,
+             k_max: int = 10,
+             scale: bool = True,
+             random_state: int = 42,
+             criterion: str = "silhouette",
+             gap_draws: int = 10
+            ) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Alternativa jerárquica (aglomerativa de Ward) a pca_kmeans con la misma
+    salida. El árbol se calcula una sola vez por conjunto de datos y
+    parámetros (ver _ward_tree); cambiar k, o barrer 2..k_max, solo corta el
+    dendrograma cacheado. meta['linkage'] es la matriz de scipy para dibujarlo.
+    """
+    if criterion not in CLUSTER_CRITERIA:
+        raise ValueError(f"criterion debe ser uno de {CLUSTER_CRITERIA}")
+
+    from sklearn.metrics import pairwise_distances
+
+    Z, pca_meta, L = _ward_tree(df, feature_cols, n_components, scale)
+    ks = list(range(2, min(k_max, len(Z) - 1) + 1)) if k is None else [k]
+    if not ks:
+        raise ValueError("Se necesitan al menos 3 observaciones para elegir k")
+    # Distancias una vez por llamada, compartidas por los cortes del barrido
+    D = pairwise_distances(Z) if len(Z) <= SILHOUETTE_MAX_N else None
+
+    cuts = [_cut_tree_scores(Z, L, D, kk) for kk in ks]
+    k_scores = [sc for _, sc in cuts]
+    if criterion == "gap" and len(ks) > 1:
+        seeds = np.random.SeedSequence(random_state).spawn(gap_draws)
+        ref = np.array([_ward_gap_reference(Z.min(axis=0), Z.max(axis=0), len(Z), ks, sd)
+                        for sd in seeds])
+        log_w = np.log([sc["inertia"] for sc in k_scores])
+        for i, sc in enumerate(k_scores):
+            sc["gap"] = float(ref[:, i].mean() - log_w[i])
+            sc["gap_se"] = float(ref[:, i].std() * np.sqrt(1 + 1 / gap_draws))
+    labels, best = cuts[_select_k(k_scores, criterion)] if len(ks) > 1 else cuts[0]
+    k = int(labels.max()) + 1
+
+    pc_cols = pca_meta["components"].index.tolist()
+    df_out = pd.concat([df.copy(), pd.DataFrame(Z, index=df.index, columns=pc_cols)], axis=1)
+    df_out["cluster"] = labels
+
+    if "silhouette" in best:
+        silhouette_best = best["silhouette"]
+    else:
+        from sklearn.metrics import silhouette_score
+        silhouette_best = float(silhouette_score(
+            Z, labels, sample_size=SILHOUETTE_MAX_N, random_state=random_state))
+
+    meta = {
+        "explained_variance_ratio": pca_meta["explained_variance_ratio"],
+        "components": pca_meta["components"],
+        "k": k,
+        "criterion": criterion,
+        "silhouette": silhouette_best,
+        "k_scores": k_scores,
+        "cluster_centers": df_out.groupby("cluster")[pc_cols].mean(),
+        "linkage": L
+    }
+    return df_out, meta
+
+
+STABILITY_MODES = ("bootstrap", "seeds", "both")
+
+
+def _stability_block(X, n_components: int, k: int, scale: bool,
+                     seeds, bootstrap: bool, km_seed: int | None) -> np.ndarray:
+    """
+    Reajusta escalado + PCA + K-means una vez por semilla (sobre un remuestreo
+    bootstrap de las filas si bootstrap=True) y asigna TODOS los hospitales al
+    centro más cercano del modelo reajustado. Con km_seed=None la semilla de
+    K-means también sale de la semilla. Devuelve etiquetas (n_semillas, n).
+    """
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.decomposition import PCA
+    from sklearn.cluster import KMeans
+    X = pool.load(X)
+    n = len(X)
+    labels = np.empty((len(seeds), n), dtype=np.int32)
+    for b, seed in enumerate(seeds):
+        rng = np.random.default_rng(seed)
+        idx = rng.integers(0, n, n) if bootstrap else np.arange(n)
+        Xb = X[idx]
+        scaler = StandardScaler(with_mean=scale, with_std=scale).fit(Xb)
+        pca = PCA(n_components=n_components).fit(scaler.transform(Xb))
+        km = KMeans(n_clusters=k, n_init="auto",
+                    random_state=km_seed if km_seed is not None
+                    else int(rng.integers(2**31 - 1)))
+        km.fit(pca.transform(scaler.transform(Xb)))
+        labels[b] = km.predict(pca.transform(scaler.transform(X)))
+    return labels
+
+
+def _align_labels(labels: np.ndarray, reference: np.ndarray, k: int) -> np.ndarray:
+    """
+    Renombra las etiquetas de cada remuestreo para que coincidan al máximo con
+    las de referencia: las tablas de contingencia k×k de todos los remuestreos
+    se arman de una vez con bincount y cada permutación sale de un
+    emparejamiento húngaro.
+    """
+    from scipy.optimize import linear_sum_assignment
+    B = len(labels)
+    flat = (np.arange(B)[:, None] * k + labels) * k + reference[None, :]
+    contingency = np.bincount(flat.ravel(), minlength=B * k * k).reshape(B, k, k)
+    perm = np.empty((B, k), dtype=labels.dtype)
+    for b in range(B):
+        rows, cols = linear_sum_assignment(contingency[b], maximize=True)
+        perm[b, rows] = cols
+    return np.take_along_axis(perm, labels, axis=1)
+
+
+def cluster_stability(df: pd.DataFrame,
+                      feature_cols: List[str],
+                      labels: np.ndarray,
+                      n_components: int = 2,
+                      scale: bool = True,
+                      random_state: int = 42,
+                      n_resamples: int = 200,
+                      mode: str = "bootstrap",
+                      n_jobs: int | None = None
+                     ) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Estabilidad de una segmentación PCA + K-means (p. ej. la de pca_kmeans).
+
+    Repite el ajuste `n_resamples` veces en el pool de workers con k fijo
+    (el nº de clusters de `labels`) y, en cada repetición, asigna todos los
+    hospitales al modelo reajustado:
+      - 'bootstrap' : remuestreo con reposición de los hospitales
+      - 'seeds'     : mismos datos, distinto random_state de K-means
+      - 'both'      : remuestreo y semilla distintos
+    Las semillas se derivan de random_state con SeedSequence, por lo que el
+    resultado es reproducible e independiente del nº de workers.
+
+    Devuelve
+    --------
+    df_stab : por hospital (mismo índice que df) 'stability' (fracción de
+              remuestreos en que queda en su cluster de consenso),
+              'consensus_cluster' (moda de las etiquetas alineadas) y
+              'coassignment' (frecuencia media de co-asignación con los
+              demás miembros de su cluster de consenso)
+    meta    : coassignment_matrix (n×n), estabilidad media global y por
+              cluster, y acuerdo de la asignación original con el consenso
+    """
+    if mode not in STABILITY_MODES:
+        raise ValueError(f"mode debe ser uno de {STABILITY_MODES}")
+    if n_resamples < 1:
+        raise ValueError("n_resamples debe ser al menos 1")
+
+    X = df[feature_cols].to_numpy(dtype=float)
+    reference = np.asarray(labels, dtype=np.int32)
+    k = int(reference.max()) + 1
+    seeds = np.random.SeedSequence(random_state).spawn(n_resamples)
+    bootstrap = mode in ("bootstrap", "both")
+    km_seed = random_state if mode == "bootstrap" else None   # solo varían las filas
+
+    n_workers = pool.effective_workers(n_jobs)
+    blocks = pool.chunk_bounds(n_resamples, n_workers, min_rows=1)
+    if n_workers > 1 and len(blocks) > 1:
+        with pool.shared_arrays({"X": X}) as shm:
+            parts = pool.run(_stability_block,
+                             [(shm["X"], n_components, k, scale, seeds[lo:hi], bootstrap, km_seed)
+                              for lo, hi in blocks], n_jobs)
+    else:
+        parts = [_stability_block(X, n_components, k, scale, seeds, bootstrap, km_seed)]
+    aligned = _align_labels(np.vstack(parts), reference, k)
+
+    # Frecuencias por cluster (k × n) y co-asignación media (n × n)
+    onehot = np.eye(k)[aligned]            # (B, n, k)
+    freq = onehot.mean(axis=0).T                             # (k, n)
+    consensus = freq.argmax(axis=0)
+    stability = freq[consensus, np.arange(len(consensus))]
+    coassign = np.einsum("bik,bjk->ij", onehot, onehot) / len(aligned)
+
+    same = consensus[:, None] == consensus[None, :]
+    np.fill_diagonal(same, False)
+    peers = same.sum(axis=1)
+    co_mean = np.divide((coassign * same).sum(axis=1), peers,
+                        out=np.ones(len(peers)), where=peers > 0)
+
+    df_stab = pd.DataFrame({"stability": stability,
+                            "consensus_cluster": consensus,
+                            "coassignment": co_mean}, index=df.index)
+    meta = {
+        "n_resamples": n_resamples,
+        "mode": mode,
+        "k": k,
+        "mean_stability": float(stability.mean()),
+        "cluster_stability": {int(c): float(stability[consensus == c].mean())
+                              for c in np.unique(consensus)},
+        "reference_agreement": float((consensus == reference).mean()),
+        "coassignment_matrix": coassign
+    }
+    return df_stab, meta
+
+
+def _rebatch(frames: Iterable[pd.DataFrame], batch_size: int):
+    """
+    Reagrupa un flujo de DataFrames en lotes de al menos batch_size filas
+    (el resto final se une al último lote), como exige partial_fit.
+    """
+    buf, n, prev = [], 0, None
+    for f in frames:
+        buf.append(f)
+        n += len(f)
+        while n >= batch_size:
+            df = pd.concat(buf, ignore_index=True)
+            if prev is not None:
+                yield prev
+            prev, buf = df.iloc[:batch_size], [df.iloc[batch_size:]]
+            n = len(buf[0])
+    tail = pd.concat(buf, ignore_index=True) if buf else None
+    if prev is None:
+        if tail is not None and len(tail):
+            yield tail
+    elif tail is not None and len(tail):
+        yield pd.concat([prev, tail], ignore_index=True)
+    else:
+        yield prev
+
+
+def pca_kmeans_panel(chunk_source: Callable[[], Iterable[pd.DataFrame]],
+                     feature_cols: List[str],
+                     n_components: int = 2,
+                     k: int | None = None,
+                     k_max: int = 10,
+                     scale: bool = True,
+                     random_state: int = 42,
+                     criterion: str = "silhouette",
+                     batch_size: int = 1024
+                    ) -> Tuple[pd.DataFrame, Dict]:
+    """
+    PCA + K-means sobre el panel completo (todas las observaciones hospital-año)
+    con memoria acotada: los datos se recorren por lotes con StandardScaler,
+    IncrementalPCA y MiniBatchKMeans (partial_fit), sin cargar la tabla entera.
+
+    Parámetros
+    ----------
+    chunk_source : función sin argumentos que devuelve un iterable nuevo de
+                   DataFrames (con 'hospital_id', 'año' y feature_cols) en cada
+                   llamada; se recorre una vez por etapa
+    k            : nº de clusters (None ⇒ se elige con `criterion` sobre una
+                   muestra de a lo más SILHOUETTE_MAX_N observaciones proyectadas)
+    batch_size   : filas por lote de partial_fit
+
+    Devuelve
+    --------
+    df_out : hospital_id, año, PC1..PCk y cluster por observación hospital-año
+    meta   : varianza explicada, cargas, centros, tamaños por año y matriz de
+             transición entre clusters de años consecutivos del mismo hospital
+    """
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.decomposition import IncrementalPCA
+    from sklearn.cluster import MiniBatchKMeans
+
+    if criterion not in CLUSTER_CRITERIA:
+        raise ValueError(f"criterion debe ser uno de {CLUSTER_CRITERIA}")
+
+    def batches():
+        for chunk in _rebatch(chunk_source(), batch_size):
+            chunk = chunk.dropna(subset=feature_cols)
+            if len(chunk):
+                yield chunk
+
+    # 1 ▸ Escalado (medias y varianzas acumuladas)
+    scaler = StandardScaler(with_mean=scale, with_std=scale)
+    n_obs = 0
+    for chunk in batches():
+        scaler.partial_fit(chunk[feature_cols].to_numpy(float))
+        n_obs += len(chunk)
+    if n_obs <= max(n_components, 2):
+        raise ValueError("No hay suficientes observaciones válidas en el panel")
+
+    # 2 ▸ PCA incremental
+    ipca = IncrementalPCA(n_components=n_components)
+    for chunk in batches():
+        ipca.partial_fit(scaler.transform(chunk[feature_cols].to_numpy(float)))
+    project = lambda chunk: ipca.transform(scaler.transform(chunk[feature_cols].to_numpy(float)))
+
+    # 3 ▸ Elegir k sobre una muestra acotada de la proyección (si no viene fijo)
+    k_scores = None
+    if k is None:
+        rng = np.random.default_rng(random_state)
+        frac = min(1.0, SILHOUETTE_MAX_N / n_obs)
+        sample = np.vstack([Zc[rng.random(len(Zc)) < frac]
+                            for Zc in map(project, batches())])
+        ks = list(range(2, min(k_max, len(sample) - 1) + 1))
+        if not ks:
+            raise ValueError("Se necesitan al menos 3 observaciones para elegir k")
+        km_sample, _, k_scores = _sweep_k(sample, ks, criterion, random_state)
+        k = km_sample.n_clusters
+
+    # 4 ▸ MiniBatchKMeans incremental
+    mbk = MiniBatchKMeans(n_clusters=k, random_state=random_state, n_init=3,
+                          batch_size=batch_size)
+    for chunk in batches():
+        mbk.partial_fit(project(chunk))
+
+    # 5 ▸ Etiquetas por hospital-año
+    pc_cols = [f"PC{i+1}" for i in range(n_components)]
+    parts = []
+    for chunk in batches():
+        Zc = project(chunk)
+        part = pd.DataFrame(Zc, columns=pc_cols)
+        part.insert(0, "año", chunk["año"].to_numpy())
+        part.insert(0, "hospital_id", chunk["hospital_id"].to_numpy())
+        part["cluster"] = mbk.predict(Zc)
+        parts.append(part)
+    df_out = (pd.concat(parts, ignore_index=True)
+              .sort_values(["hospital_id", "año"], ignore_index=True))
+
+    # 6 ▸ Transiciones entre años consecutivos del mismo hospital
+    nxt = df_out.groupby("hospital_id")[["año", "cluster"]].shift(-1)
+    consecutive = (nxt["año"] - df_out["año"]) == 1
+    counts = np.zeros((k, k), dtype=int)
+    np.add.at(counts, (df_out.loc[consecutive, "cluster"].to_numpy(),
+                       nxt.loc[consecutive, "cluster"].to_numpy().astype(int)), 1)
+    rows = counts.sum(axis=1, keepdims=True)
+    transition = np.divide(counts, rows, out=np.zeros((k, k)), where=rows > 0)
+
+    meta = {
+        "explained_variance_ratio": ipca.explained_variance_ratio_.tolist(),
+        "components": pd.DataFrame(ipca.components_, index=pc_cols,
+                                   columns=feature_cols),
+        "k": int(k),
+        "criterion": criterion,
+        "k_scores": k_scores,
+        "n_observations": int(len(df_out)),
+        "years": sorted(int(y) for y in df_out["año"].unique()),
+        "cluster_centers": pd.DataFrame(mbk.cluster_centers_, columns=pc_cols),
+        "cluster_sizes_by_year": (df_out.groupby(["año", "cluster"]).size()
+                                  .unstack(fill_value=0)),
+        "transition_counts": counts,
+        "transition_matrix": transition,
+        "n_transitions": int(consecutive.sum())
+    }
+    return df_out, meta
+
+
 # funcion que dice hola que tal
 def say_hello(name: str) -> str:
     """
@@ -333,29 +1001,286 @@ def say_hello(name: str) -> str:
     """
     return f"Hola, {name}! ¿Cómo estás?"
 
-# --- helper: siempre paralelo --------------------------------
-def _evaluate_parallel(Xref, Yref, Xnew, Ynew,
-                       rts, orient, n_jobs):
-    """Eficiencia de cada (x,y) sobre la frontera (Xref,Yref)."""
-    def _score(x, y):
-        dea = EnvelopDEA(rts, orient)
-        dea.fit(np.vstack([Xref, x]), np.vstack([Yref, y]))
-        return dea.results[-1].score            # plural en v1.0.x
-    return np.array(Parallel(n_jobs=n_jobs)(
-        delayed(_score)(x, y) for x, y in zip(Xnew, Ynew)
-    ), dtype=float)
+# --- helper: DEA envolvente DMU a DMU contra una frontera fija ----
+def _envelope_scores(Xref, Yref, Xeval, Yeval,
+                     rts="CRS", orient="in", include_self=True):
+    """
+    Eficiencia (modelo envolvente) de cada fila de (Xeval, Yeval) sobre la
+    frontera (Xref, Yref), con un LP por DMU.
+
+    La matriz de restricciones de la referencia se arma una sola vez y en cada
+    DMU solo cambian la columna de theta, la de la propia DMU y el lado derecho.
+    Con include_self=True la DMU evaluada se agrega a la referencia (como hacía
+    EnvelopDEA en el fallback), lo que garantiza factibilidad también en VRS.
+
+    rts puede ser una tupla (p. ej. ("CRS", "VRS")): cada DMU se resuelve con
+    todos los supuestos sobre la misma matriz y se devuelve una columna por
+    supuesto, en vez de un vector.
+    """
+    rts_list = (rts,) if isinstance(rts, str) else tuple(rts)
+    Xref, Yref = np.asarray(Xref, float), np.asarray(Yref, float)
+    Xeval, Yeval = np.atleast_2d(Xeval).astype(float), np.atleast_2d(Yeval).astype(float)
+
+    # El score radial es invariante a la escala de cada variable: normalizar
+    # evita coeficientes de 1e8 que degradan las tolerancias del solver
+    sx = np.abs(Xref).mean(axis=0) if len(Xref) else np.ones(Xref.shape[1])
+    sy = np.abs(Yref).mean(axis=0) if len(Yref) else np.ones(Yref.shape[1])
+    sx, sy = np.where(sx > 0, sx, 1.0), np.where(sy > 0, sy, 1.0)
+    Xref, Xeval, Yref, Yeval = Xref / sx, Xeval / sx, Yref / sy, Yeval / sy
+
+    n, m = Xref.shape
+    s = Yref.shape[1]
+    n_lam = n + int(include_self)
+
+    # Variables: [theta, lambda_1..lambda_n, (lambda_self)]
+    A = np.zeros((m + s, 1 + n_lam))
+    A[:m, 1:n + 1] = Xref.T
+    A[m:, 1:n + 1] = -Yref.T
+    b = np.zeros(m + s)
+    c = np.zeros(1 + n_lam)
+    c[0] = 1.0 if orient == "in" else -1.0        # min theta / max phi
+
+    # Restricción sobre sum(lambda) de cada supuesto: (fila A_ub, lado derecho, A_eq)
+    ones = np.r_[0.0, np.ones(n_lam)]
+    extra = {"CRS": (None, None, None),
+             "VRS": (None, None, ones[None, :]),      # = 1
+             "IRS": (-ones, -1.0, None),              # >= 1
+             "DRS": (ones, 1.0, None)}                # <= 1
+
+    scores = np.full((len(Xeval), len(rts_list)), np.nan)
+    for j, (x, y) in enumerate(zip(Xeval, Yeval)):
+        if include_self:
+            A[:m, -1], A[m:m + s, -1] = x, -y
+        if orient == "in":
+            A[:m, 0], A[m:m + s, 0] = -x, 0.0
+            b[:m], b[m:m + s] = 0.0, -y
+        else:
+            A[:m, 0], A[m:m + s, 0] = 0.0, y
+            b[:m], b[m:m + s] = x, 0.0
+        for k, r in enumerate(rts_list):
+            row, rhs, A_eq = extra[r]
+            A_ub, b_ub = (A, b) if row is None else (np.vstack([A, row]), np.r_[b, rhs])
+            res = linprog(c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq,
+                          b_eq=None if A_eq is None else [1.0],
+                          bounds=(0, None), method="highs")
+            if res.status == 0:
+                scores[j, k] = abs(res.fun)   # sin redondear: puntajes ~1e-7 no deben quedar en 0
+    return scores[:, 0] if isinstance(rts, str) else scores
+
+
+# --- helper: función de distancia direccional (Luenberger) ----
+LUENBERGER_DIRECTIONS = ("both", "in", "out")
+
+
+def _directional_scores(Xref, Yref, Xeval, Yeval,
+                        rts="CRS", direction="both", include_self=False):
+    """
+    Función de distancia direccional de cada fila de (Xeval, Yeval) sobre la
+    frontera (Xref, Yref): max beta s.a. sum(lambda·x) <= x - beta·gx,
+    sum(lambda·y) >= y + beta·gy, con g = (x, y), (x, 0) u (0, y) según
+    direction.
+
+    Misma mecánica que _envelope_scores (matriz armada una vez, un LP por
+    DMU); beta es libre, así que una DMU fuera de la frontera da beta < 0 en
+    vez de una razón que explota. 0 = sobre la frontera.
+    """
+    Xref, Yref = np.asarray(Xref, float), np.asarray(Yref, float)
+    Xeval, Yeval = np.atleast_2d(Xeval).astype(float), np.atleast_2d(Yeval).astype(float)
+
+    # Con g proporcional a la DMU, beta también es invariante a la escala
+    sx = np.abs(Xref).mean(axis=0) if len(Xref) else np.ones(Xref.shape[1])
+    sy = np.abs(Yref).mean(axis=0) if len(Yref) else np.ones(Yref.shape[1])
+    sx, sy = np.where(sx > 0, sx, 1.0), np.where(sy > 0, sy, 1.0)
+    Xref, Xeval, Yref, Yeval = Xref / sx, Xeval / sx, Yref / sy, Yeval / sy
+
+    n, m = Xref.shape
+    s = Yref.shape[1]
+    n_lam = n + int(include_self)
+    wx, wy = float(direction in ("both", "in")), float(direction in ("both", "out"))
+
+    # Variables: [beta, lambda_1..lambda_n, (lambda_self)]
+    A = np.zeros((m + s, 1 + n_lam))
+    A[:m, 1:n + 1] = Xref.T
+    A[m:, 1:n + 1] = -Yref.T
+    c = np.zeros(1 + n_lam)
+    c[0] = -1.0                                   # max beta
+    bounds = [(None, None)] + [(0, None)] * n_lam
+
+    A_eq = b_eq = None
+    if rts == "VRS":
+        A_eq, b_eq = np.r_[0.0, np.ones(n_lam)][None, :], [1.0]
+
+    scores = np.full(len(Xeval), np.nan)
+    for j, (x, y) in enumerate(zip(Xeval, Yeval)):
+        if include_self:
+            A[:m, -1], A[m:, -1] = x, -y
+        A[:m, 0], A[m:, 0] = wx * x, wy * y
+        res = linprog(c, A_ub=A, b_ub=np.r_[x, -y], A_eq=A_eq, b_eq=b_eq,
+                      bounds=bounds, method="highs")
+        if res.status == 0:
+            scores[j] = -res.fun
+    return scores
+
+
+# --- helper: lotes de evaluaciones en el pool persistente -----
+def _score_chunk(func, ref, ev, lo, hi, args):
+    """Evalúa las filas [lo, hi) de ev contra la frontera ref (en un worker)."""
+    Xr, Yr = pool.load(ref[0]), pool.load(ref[1])
+    Xe, Ye = pool.load(ev[0]), pool.load(ev[1])
+    return func(Xr, Yr, Xe[lo:hi], Ye[lo:hi], *args)
+
+
+def _run_score_tasks(data, tasks, n_jobs=None, func=None):
+    """
+    Resuelve varias evaluaciones frontera-vs-DMU en un solo trabajo.
+
+    data  : dict clave → (X, Y), tanto fronteras como conjuntos evaluados
+    tasks : lista de (clave_ref, clave_eval, args) → func(Xref, Yref, Xeval, Yeval, *args)
+    func  : _envelope_scores (por defecto) o _directional_scores
+
+    Con más de un worker los arreglos se publican una vez en memoria compartida
+    y cada tarea se parte en bloques de filas. Devuelve un arreglo de scores
+    por tarea, en orden.
+    """
+    func = _envelope_scores if func is None else func
+    n_workers = pool.effective_workers(n_jobs)
+    if n_workers == 1:
+        return [func(*data[ref], *data[ev], *args) for ref, ev, args in tasks]
+
+    keys = list(data)
+    arrays = {f"{i}{xy}": a for i, k in enumerate(keys) for xy, a in zip("XY", data[k])}
+    with pool.shared_arrays(arrays) as shm:
+        refs = {k: (shm[f"{i}X"], shm[f"{i}Y"]) for i, k in enumerate(keys)}
+        jobs = [(t, lo, hi) for t, (_, ev, _) in enumerate(tasks)
+                for lo, hi in pool.chunk_bounds(len(data[ev][0]), n_workers)]
+        parts = pool.run(_score_chunk,
+                         [(func, refs[tasks[t][0]], refs[tasks[t][1]], lo, hi, tasks[t][2])
+                          for t, lo, hi in jobs], n_jobs)
+
+    out = [[] for _ in tasks]
+    for (t, _, _), part in zip(jobs, parts):
+        out[t].append(part)
+    return [np.concatenate(p) for p in out]
+
+
+# --- fronteras agrupadas (global / secuencial) con caché -------
+_FRONTIER_CACHE: "OrderedDict[tuple, tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+_FRONTIER_CACHE_MAXSIZE = 64
+
+MALMQUIST_TECHNOLOGIES = ("contemporaneous", "global", "sequential")
+MALMQUIST_DECOMPOSITIONS = ("basic", "full")
+
+
+def _cached_frontier(X, Y, rts, orient):
+    """
+    Reduce (X, Y) a sus DMU eficientes (score 1), que generan la misma
+    tecnología, y cachea el resultado por contenido de los datos.
+    """
+    X, Y = np.ascontiguousarray(X, float), np.ascontiguousarray(Y, float)
+    key = (hashlib.sha1(X.tobytes() + Y.tobytes()).hexdigest(),
+           X.shape, Y.shape, rts, orient)
+    if key in _FRONTIER_CACHE:
+        _FRONTIER_CACHE.move_to_end(key)
+        return _FRONTIER_CACHE[key]
+
+    eff = _envelope_scores(X, Y, X, Y, rts, orient, include_self=False)
+    mask = np.isclose(eff, 1.0, atol=1e-6)
+    frontier = (X[mask], Y[mask])
+
+    _FRONTIER_CACHE[key] = frontier
+    if len(_FRONTIER_CACHE) > _FRONTIER_CACHE_MAXSIZE:
+        _FRONTIER_CACHE.popitem(last=False)
+    return frontier
+
+
+def _technology_frontier(df_panel, input_cols, output_cols,
+                         technology, year, rts, orient):
+    """
+    Frontera de referencia agrupada a partir del panel completo:
+      - global     : todas las observaciones válidas de todos los años
+      - sequential : observaciones válidas de los años <= year
+    Se reduce año a año (frontera(A ∪ B) = frontera(frontera(A) ∪ frontera(B))),
+    así cada frontera anual y cada acumulado quedan en caché y se reutilizan.
+    """
+    valid = df_panel[(df_panel[input_cols] > 0).all(axis=1) &
+                     (df_panel[output_cols] > 0).all(axis=1)]
+    if technology == "sequential":
+        valid = valid[valid["año"] <= year]
+    if valid.empty:
+        raise ValueError(f"No hay observaciones válidas para la tecnología {technology}")
+
+    frontier = None
+    for _, g in valid.sort_values(["año", "hospital_id"]).groupby("año"):
+        F = _cached_frontier(g[input_cols].to_numpy(float),
+                             g[output_cols].to_numpy(float), rts, orient)
+        if frontier is not None:
+            F = _cached_frontier(np.vstack([frontier[0], F[0]]),
+                                 np.vstack([frontier[1], F[1]]), rts, orient)
+        frontier = F
+    return frontier
+
+
+def _malmquist_components(eff1, eff2, tech1_on_2, tech2_on_1):
+    """
+    Descomposición de Färe et al. a partir de las eficiencias propias y cruzadas:
+      EFFCH = E_t1(t1) / E_t(t)
+      TECH  = sqrt( E_t(t1)/E_t1(t1) · E_t(t)/E_t1(t) )
+    de modo que Malmquist = EFFCH · TECH.
+    """
+    EFFCH = eff2 / eff1
+    TECH = np.sqrt((tech1_on_2 / eff2) * (eff1 / tech2_on_1))
+    return EFFCH, TECH
+
+
+def _scale_decomposition(eff1, eff2, vrs1, vrs2):
+    """
+    Descomposición de Färe, Grosskopf, Norris y Zhang (1994) del EFFCH (CRS):
+      PEFFCH = V_t1(t1) / V_t(t)                      (eficiencia técnica pura)
+      SECH   = (C_t1(t1)/V_t1(t1)) / (C_t(t)/V_t(t))  (eficiencia de escala)
+    de modo que EFFCH = PEFFCH · SECH.
+    """
+    PEFFCH = vrs2 / vrs1
+    SECH = (eff2 / vrs2) / (eff1 / vrs1)
+    return PEFFCH, SECH
 
 
 # --- función principal simplificada ---------------------------
 def calculate_dea_malmquist_fast(df_t, df_t1,
                                  input_cols, output_cols,
                                  rts="CRS", orientation="in",
-                                 n_jobs=4, use_cross=True,
+                                 n_jobs=None, use_cross=True,
                                  top_ids=None,
                                  max_dmus=None,
                                  top_input_col: str | None = None,
-                                 top_n: int = 30):
-    """Índice Malmquist con top-N opcional y %ΔProd.  Versión 100 % fallback."""
+                                 top_n: int = 30,
+                                 technology: str = "contemporaneous",
+                                 df_panel: pd.DataFrame | None = None,
+                                 decomposition: str = "basic"):
+    """Índice Malmquist con top-N opcional y %ΔProd.  Versión 100 % fallback.
+
+    technology:
+      - 'contemporaneous': fronteras de cada año y evaluaciones cruzadas
+      - 'global'     : una frontera agrupada de todos los años de df_panel
+                       (Pastor & Lovell); TECH es el cambio de brecha a la
+                       mejor práctica y el índice es circular
+      - 'sequential' : frontera de cada año = años <= t de df_panel
+    df_panel: panel con columna 'año' para global/secuencial (None ⇒ df_t ∪ df_t1).
+    decomposition:
+      - 'basic': EFFCH y TECH
+      - 'full' : además PEFFCH (eficiencia pura, VRS) y SECH (escala), con
+                 EFFCH = PEFFCH · SECH; requiere rts='CRS' y las eficiencias
+                 VRS propias se resuelven junto a las CRS sobre la misma matriz
+    n_jobs: workers del pool persistente (None ⇒ todo el pool, 1 ⇒ en proceso).
+    """
+    if technology not in MALMQUIST_TECHNOLOGIES:
+        raise ValueError(f"technology debe ser uno de {MALMQUIST_TECHNOLOGIES}")
+    if decomposition not in MALMQUIST_DECOMPOSITIONS:
+        raise ValueError(f"decomposition debe ser uno de {MALMQUIST_DECOMPOSITIONS}")
+    full = decomposition == "full"
+    if full and rts != "CRS":
+        raise ValueError("La descomposición completa requiere rts='CRS'")
+    if technology != "contemporaneous" and df_panel is None:
+        df_panel = pd.concat([df_t, df_t1], ignore_index=True)
 
     # 1 ▸ Filtrar positivos y alinear IDs
     pos = lambda df: df[(df[input_cols] > 0).all(axis=1) &
@@ -388,27 +1313,63 @@ def calculate_dea_malmquist_fast(df_t, df_t1,
     X1, Y1 = df1[input_cols].to_numpy(), df1[output_cols].to_numpy()
     X2, Y2 = df2[input_cols].to_numpy(), df2[output_cols].to_numpy()
 
-    # 4 ▸ Fronteras propias
-    dea1 = EnvelopDEA(rts, orientation, n_jobs); dea1.fit(X1, Y1)
-    dea2 = EnvelopDEA(rts, orientation, n_jobs); dea2.fit(X2, Y2)
-
-    eff1 = np.array([r.score for r in dea1.results])
-    eff2 = np.array([r.score for r in dea2.results])
+    # 4 ▸ Fronteras propias ('sequential': frontera acumulada hasta cada año)
+    if technology == "sequential":
+        year_t, year_t1 = int(df1["año"].iloc[0]), int(df2["año"].iloc[0])
+        XS1, YS1 = _technology_frontier(df_panel, input_cols, output_cols,
+                                        "sequential", year_t, rts, orientation)
+        XS2, YS2 = _technology_frontier(df_panel, input_cols, output_cols,
+                                        "sequential", year_t1, rts, orientation)
+        eff1 = _envelope_scores(XS1, YS1, X1, Y1, rts, orientation)
+        eff2 = _envelope_scores(XS2, YS2, X2, Y2, rts, orientation)
+        if full:   # la frontera secuencial VRS no es la reducción CRS
+            vrs1 = _envelope_scores(*_technology_frontier(
+                df_panel, input_cols, output_cols, "sequential", year_t, "VRS", orientation),
+                X1, Y1, "VRS", orientation)
+            vrs2 = _envelope_scores(*_technology_frontier(
+                df_panel, input_cols, output_cols, "sequential", year_t1, "VRS", orientation),
+                X2, Y2, "VRS", orientation)
+    elif full:
+        eff1, vrs1 = _envelope_scores(X1, Y1, X1, Y1, ("CRS", "VRS"), orientation,
+                                      include_self=False).T
+        eff2, vrs2 = _envelope_scores(X2, Y2, X2, Y2, ("CRS", "VRS"), orientation,
+                                      include_self=False).T
+    else:
+        eff1 = _envelope_scores(X1, Y1, X1, Y1, rts, orientation, include_self=False)
+        eff2 = _envelope_scores(X2, Y2, X2, Y2, rts, orientation, include_self=False)
+    extra = {}
 
     # 5 ▸ Cross-efficiencies (si se piden)
-    if use_cross:
-        tech1_on_2 = _evaluate_parallel(X1, Y1, X2, Y2,
-                                        rts, orientation, n_jobs)
-        tech2_on_1 = _evaluate_parallel(X2, Y2, X1, Y1,
-                                        rts, orientation, n_jobs)
-        TECH = np.sqrt((tech1_on_2 / eff1) * (eff2 / tech2_on_1))
+    if technology == "global":
+        # Un LP por DMU contra la frontera agrupada cacheada; sin cruces
+        XG, YG = _technology_frontier(df_panel, input_cols, output_cols,
+                                      "global", None, rts, orientation)
+        g1 = _envelope_scores(XG, YG, X1, Y1, rts, orientation)
+        g2 = _envelope_scores(XG, YG, X2, Y2, rts, orientation)
+        EFFCH = eff2 / eff1
+        TECH = (g2 / g1) / EFFCH                 # cambio de brecha (BPC)
+        extra = {"EFF_G_t": g1, "EFF_G_t1": g2}
+    elif technology == "sequential":
+        EFFCH, TECH = _malmquist_components(
+            eff1, eff2,
+            _envelope_scores(XS1, YS1, X2, Y2, rts, orientation),
+            _envelope_scores(XS2, YS2, X1, Y1, rts, orientation))
+    elif use_cross:
+        tech1_on_2, tech2_on_1 = _run_score_tasks(
+            {"t": (X1, Y1), "t1": (X2, Y2)},
+            [("t", "t1", (rts, orientation)), ("t1", "t", (rts, orientation))],
+            n_jobs)
+        EFFCH, TECH = _malmquist_components(eff1, eff2, tech1_on_2, tech2_on_1)
     else:
-        TECH = np.ones_like(eff1)
+        EFFCH, TECH = eff2 / eff1, np.ones_like(eff1)
 
     # 6 ▸ Índices finales
-    EFFCH     = eff2 / eff1
     MALMQUIST = EFFCH * TECH
     PCT_DELTA = (MALMQUIST - 1) * 100       # %ΔProd
+    if full:
+        PEFFCH, SECH = _scale_decomposition(eff1, eff2, vrs1, vrs2)
+        extra.update({"EFF_VRS_t": vrs1, "EFF_VRS_t1": vrs2,
+                      "PEFFCH": PEFFCH, "SECH": SECH})
 
     df_out = pd.DataFrame({
         "EFF_t":     eff1,
@@ -416,7 +1377,8 @@ def calculate_dea_malmquist_fast(df_t, df_t1,
         "EFFCH":     EFFCH,
         "TECH":      TECH,
         "Malmquist": MALMQUIST,
-        "%ΔProd":    PCT_DELTA
+        "%ΔProd":    PCT_DELTA,
+        **extra
     }, index=df1.hospital_id)
 
     summary = {
@@ -426,35 +1388,730 @@ def calculate_dea_malmquist_fast(df_t, df_t1,
         "pctΔProd_mean":  float(PCT_DELTA.mean()),
         "n_hospitals":    len(eff1)
     }
+    if full:
+        summary["PEFFCH_mean"] = float(PEFFCH.mean())
+        summary["SECH_mean"] = float(SECH.mean())
     return df_out, summary
 
-def determinant_analysis(df: pd.DataFrame,
-                         dependent: str,
-                         independents: List[str],
-                         efficiency_method: str = "SFA",
-                         input_cols: List[str] = None,
-                         output_cols: List[str] = None,
-                         top_n: int = 5,
-                         add_constant: bool = True
+def calculate_dea_malmquist_chain(df: pd.DataFrame,
+                                  input_cols: List[str],
+                                  output_cols: List[str],
+                                  years: List[int] | None = None,
+                                  rts: str = "CRS",
+                                  orientation: str = "in",
+                                  n_jobs: int | None = None,
+                                  top_input_col: str | None = None,
+                                  top_n: int = 30,
+                                  technology: str = "contemporaneous",
+                                  df_panel: pd.DataFrame | None = None,
+                                  decomposition: str = "basic"
+                                 ) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Índice Malmquist encadenado sobre todos los pares de años consecutivos.
+
+    Cada frontera anual se evalúa una sola vez y se reutiliza en las dos
+    comparaciones vecinas (t-1→t y t→t+1); todas las evaluaciones (propias y
+    cruzadas) se resuelven en un único trabajo paralelo.
+
+    Parámetros
+    ----------
+    df            : panel con columnas 'hospital_id', 'año', inputs y outputs
+    years         : años a encadenar (None ⇒ todos los del panel)
+    top_input_col : si se indica, se conservan los top_n hospitales del primer año
+    technology    : 'contemporaneous', 'global' o 'sequential' (ver
+                    calculate_dea_malmquist_fast); con 'global' el índice
+                    acumulado coincide con la comparación directa extremo a extremo
+    df_panel      : panel para las fronteras agrupadas (None ⇒ df)
+    decomposition : 'basic' o 'full' (agrega PEFFCH y SECH)
+    Resto igual que calculate_dea_malmquist_fast.
+
+    Devuelve
+    --------
+    df_out  : una fila por hospital y par de años, con Malmquist_acum y
+              %ΔProd_acum (productividad acumulada desde el primer año)
+    summary : promedios por período y acumulados
+    """
+    if technology not in MALMQUIST_TECHNOLOGIES:
+        raise ValueError(f"technology debe ser uno de {MALMQUIST_TECHNOLOGIES}")
+    if decomposition not in MALMQUIST_DECOMPOSITIONS:
+        raise ValueError(f"decomposition debe ser uno de {MALMQUIST_DECOMPOSITIONS}")
+    full = decomposition == "full"
+    if full and rts != "CRS":
+        raise ValueError("La descomposición completa requiere rts='CRS'")
+    df_panel = df if df_panel is None else df_panel
+    years = sorted(df["año"].unique()) if years is None else sorted(years)
+    if len(years) < 2:
+        raise ValueError("Se necesitan al menos dos años para encadenar el índice")
+
+    # 1 ▸ Panel balanceado de hospitales con inputs/outputs > 0 en todos los años
+    df = df[df["año"].isin(years) &
+            (df[input_cols] > 0).all(axis=1) &
+            (df[output_cols] > 0).all(axis=1)]
+    counts = df.groupby("hospital_id")["año"].nunique()
+    ids = sorted(counts.index[counts == len(years)])
+    if not ids:
+        raise ValueError("No hay hospitales presentes en todos los años tras filtrar > 0")
+
+    # 2 ▸ Recorte top según el primer año (si se pide)
+    if top_input_col is not None:
+        if top_input_col not in input_cols:
+            raise ValueError("top_input_col debe ser uno de input_cols")
+        first = df[(df["año"] == years[0]) & df.hospital_id.isin(ids)]
+        ids = sorted(first.nlargest(top_n, top_input_col)["hospital_id"])
+
+    panel = (df[df.hospital_id.isin(ids)]
+             .sort_values(["año", "hospital_id"])
+             .groupby("año"))
+    X = {yr: g[input_cols].to_numpy(float) for yr, g in panel}
+    Y = {yr: g[output_cols].to_numpy(float) for yr, g in panel}
+
+    # 3 ▸ Referencias según la tecnología y un solo trabajo paralelo
+    pairs = list(zip(years[:-1], years[1:]))
+    if technology == "sequential":
+        refs = {yr: _technology_frontier(df_panel, input_cols, output_cols,
+                                         "sequential", yr, rts, orientation)
+                for yr in years}
+    else:
+        refs = {yr: (X[yr], Y[yr]) for yr in years}
+
+    # Eficiencias propias: con 'full' se resuelven CRS y VRS juntas, salvo en
+    # 'sequential', donde la frontera VRS acumulada es otra referencia
+    sequential = technology == "sequential"
+    own_rts = ("CRS", "VRS") if full and not sequential else rts
+    if technology == "global":
+        refs["global"] = _technology_frontier(df_panel, input_cols, output_cols,
+                                              "global", None, rts, orientation)
+        tasks = ([(yr, yr, False, own_rts) for yr in years] +
+                 [("global", yr, True, rts) for yr in years])
+    else:
+        tasks = ([(yr, yr, sequential, own_rts) for yr in years] +
+                 [(a, b, True, rts) for a, b in pairs] +       # E_a(x_b)
+                 [(b, a, True, rts) for a, b in pairs])        # E_b(x_a)
+    if full and sequential:
+        for yr in years:
+            refs[("VRS", yr)] = _technology_frontier(df_panel, input_cols, output_cols,
+                                                     "sequential", yr, "VRS", orientation)
+        tasks += [(("VRS", yr), yr, True, "VRS") for yr in years]
+    data = {**{("ref", k): v for k, v in refs.items()},
+            **{("ev", yr): (X[yr], Y[yr]) for yr in years}}
+    scores = _run_score_tasks(
+        data,
+        [(("ref", ref), ("ev", ev), (task_rts, orientation, include_self))
+         for ref, ev, include_self, task_rts in tasks],
+        n_jobs)
+    score = {}
+    for (ref, ev, _, task_rts), sc in zip(tasks, scores):
+        if isinstance(task_rts, tuple):
+            score[(ref, ev)], score[(("VRS", ref), ev)] = sc.T
+        else:
+            score[(ref, ev)] = sc
+
+    # 4 ▸ Índices por período y acumulados
+    frames = []
+    acum = np.ones(len(ids))
+    for a, b in pairs:
+        eff1, eff2 = score[(a, a)], score[(b, b)]
+        if technology == "global":
+            EFFCH = eff2 / eff1
+            TECH = (score[("global", b)] / score[("global", a)]) / EFFCH
+        else:
+            EFFCH, TECH = _malmquist_components(eff1, eff2, score[(a, b)], score[(b, a)])
+        MALMQUIST = EFFCH * TECH
+        acum = acum * MALMQUIST
+        extra = {}
+        if full:
+            vrs1, vrs2 = score[(("VRS", a), a)], score[(("VRS", b), b)]
+            PEFFCH, SECH = _scale_decomposition(eff1, eff2, vrs1, vrs2)
+            extra = {"EFF_VRS_t": vrs1, "EFF_VRS_t1": vrs2,
+                     "PEFFCH": PEFFCH, "SECH": SECH}
+        frames.append(pd.DataFrame({
+            "hospital_id":    ids,
+            "year_t":         a,
+            "year_t1":        b,
+            "EFF_t":          eff1,
+            "EFF_t1":         eff2,
+            "EFFCH":          EFFCH,
+            "TECH":           TECH,
+            "Malmquist":      MALMQUIST,
+            "%ΔProd":         (MALMQUIST - 1) * 100,
+            "Malmquist_acum": acum,
+            "%ΔProd_acum":    (acum - 1) * 100,
+            **extra
+        }))
+    df_out = pd.concat(frames, ignore_index=True)
+
+    cols = ["EFFCH", "TECH", "Malmquist", "%ΔProd"] + (["PEFFCH", "SECH"] if full else [])
+    por_periodo = (df_out.groupby(["year_t", "year_t1"])
+                   [cols].mean()
+                   .rename(columns={"%ΔProd": "pctΔProd"})
+                   .add_suffix("_mean").reset_index()
+                   .to_dict(orient="records"))
+    summary = {
+        "technology":          technology,
+        "years":               list(map(int, years)),
+        "por_periodo":         por_periodo,
+        "Malmquist_acum_mean": float(acum.mean()),
+        "pctΔProd_acum_mean":  float(((acum - 1) * 100).mean()),
+        "n_hospitals":         len(ids)
+    }
+    return df_out, summary
+
+def calculate_luenberger(df_t: pd.DataFrame,
+                         df_t1: pd.DataFrame,
+                         input_cols: List[str],
+                         output_cols: List[str],
+                         rts: str = "CRS",
+                         direction: str = "both",
+                         n_jobs: int | None = None,
+                         top_input_col: str | None = None,
+                         top_n: int = 30
                         ) -> Tuple[pd.DataFrame, Dict]:
     """
-    Calcula eficiencia (SFA o DEA) y luego ajusta un modelo OLS para analizar determinantes.
-    
+    Indicador de productividad de Luenberger (Chambers, Färe y Grosskopf)
+    con funciones de distancia direccional D_a(b) = distancia de las
+    observaciones del año b a la frontera del año a:
+
+      LEFFCH     = D_t(t) - D_t1(t1)
+      LTECH      = ½ [(D_t1(t1) - D_t(t1)) + (D_t1(t) - D_t(t))]
+      Luenberger = LEFFCH + LTECH
+
+    Es aditivo (sin razones): no explota cuando una eficiencia se acerca a
+    cero. Valores > 0 indican mejora de productividad.
+
     Parámetros
     ----------
-    df               : DataFrame con los datos
-    dependent        : nombre de la columna dependiente (Y) o "eficiencia" para usar SFA/DEA
-    independents     : lista de columnas explicativas (X)
-    efficiency_method: "SFA" o "DEA" (solo se usa si dependent == "eficiencia")
-    input_cols       : columnas de inputs para SFA/DEA (requerido si dependent == "eficiencia")
-    output_cols      : columnas de outputs para SFA/DEA (requerido si dependent == "eficiencia")
-    top_n            : nº de determinantes "clave" a destacar
-    add_constant     : añade intercepto si True
-    
+    rts           : 'CRS' o 'VRS'. En VRS las evaluaciones cruzadas incluyen
+                    a la propia DMU en la referencia para garantizar factibilidad
+    direction     : 'both' (g = (x, y)), 'in' (g = (x, 0)) u 'out' (g = (0, y))
+    top_input_col : si se indica, se conservan los top_n hospitales de df_t
+                    (None ⇒ todos los hospitales válidos en ambos años)
+
     Devuelve
     --------
-    coef_table : DataFrame con coef, std_err, t, p
-    meta       : dict con r2, r2_adj, top_vars y método usado
+    df_out  : una fila por hospital con las cuatro distancias y los indicadores
+    summary : promedios y conteos de mejora
+    """
+    if rts not in ("CRS", "VRS"):
+        raise ValueError("rts debe ser 'CRS' o 'VRS'")
+    if direction not in LUENBERGER_DIRECTIONS:
+        raise ValueError(f"direction debe ser uno de {LUENBERGER_DIRECTIONS}")
+
+    pos = lambda df: df[(df[input_cols] > 0).all(axis=1) &
+                        (df[output_cols] > 0).all(axis=1)]
+    df_t, df_t1 = map(pos, (df_t, df_t1))
+    ids = sorted(set(df_t.hospital_id) & set(df_t1.hospital_id))
+    if top_input_col is not None:
+        if top_input_col not in input_cols:
+            raise ValueError("top_input_col debe ser uno de input_cols")
+        ids = (df_t.loc[df_t.hospital_id.isin(ids)]
+                  .nlargest(top_n, top_input_col)["hospital_id"]
+                  .tolist())
+    if not ids:
+        raise ValueError("No hay hospitales comunes tras filtrar > 0")
+
+    df1 = df_t .loc[df_t .hospital_id.isin(ids)].sort_values("hospital_id")
+    df2 = df_t1.loc[df_t1.hospital_id.isin(ids)].sort_values("hospital_id")
+    data = {"t":  (df1[input_cols].to_numpy(float), df1[output_cols].to_numpy(float)),
+            "t1": (df2[input_cols].to_numpy(float), df2[output_cols].to_numpy(float))}
+
+    # Las cuatro distancias en un solo trabajo paralelo (frontera, evaluados)
+    cross_self = rts != "CRS"
+    tasks = [("t", "t", False), ("t1", "t1", False),
+             ("t", "t1", cross_self), ("t1", "t", cross_self)]
+    scores = _run_score_tasks(
+        data, [(ref, ev, (rts, direction, include_self)) for ref, ev, include_self in tasks],
+        n_jobs, func=_directional_scores)
+    D = {(ref, ev): sc for (ref, ev, _), sc in zip(tasks, scores)}
+
+    LEFFCH = D[("t", "t")] - D[("t1", "t1")]
+    LTECH = 0.5 * ((D[("t1", "t1")] - D[("t", "t1")]) +
+                   (D[("t1", "t")] - D[("t", "t")]))
+    LUENBERGER = LEFFCH + LTECH
+
+    df_out = pd.DataFrame({
+        "D_t_t":      D[("t", "t")],
+        "D_t1_t1":    D[("t1", "t1")],
+        "D_t_t1":     D[("t", "t1")],
+        "D_t1_t":     D[("t1", "t")],
+        "LEFFCH":     LEFFCH,
+        "LTECH":      LTECH,
+        "Luenberger": LUENBERGER
+    }, index=df1.hospital_id)
+
+    summary = {
+        "LEFFCH_mean":     float(np.nanmean(LEFFCH)),
+        "LTECH_mean":      float(np.nanmean(LTECH)),
+        "Luenberger_mean": float(np.nanmean(LUENBERGER)),
+        "n_improved":      int((LUENBERGER > 0).sum()),
+        "n_declined":      int((LUENBERGER < 0).sum()),
+        "n_hospitals":     len(ids)
+    }
+    return df_out, summary
+
+OLS_BACKENDS = ("numpy", "statsmodels")
+COEF_COLUMNS = ["Coef.", "Std.Err.", "t", "P>|t|", "[0.025", "0.975]"]
+
+
+def _design_matrix(df: pd.DataFrame, independents: List[str], add_constant: bool):
+    """
+    Matriz X (float) y nombres de columnas; como sm.add_constant, el intercepto
+    'const' no se agrega si alguna variable ya es constante.
+    """
+    X = df[independents].to_numpy(dtype=float)
+    names = list(independents)
+    has_const = bool(len(X)) and bool((np.ptp(X, axis=0) == 0).any())
+    if add_constant and not has_const:
+        X = np.column_stack([np.ones(len(X)), X])
+        names = ["const"] + names
+    return X, names, add_constant or has_const
+
+
+def _ols_qr(y: np.ndarray, X: np.ndarray, has_const: bool = True) -> Dict:
+    """
+    OLS por descomposición QR (NumPy), sin pasar por statsmodels.
+    Devuelve coeficientes, errores estándar, t, p e IC 95% como arreglos, y
+    R², R² ajustado, AIC y BIC con las mismas convenciones que statsmodels.
+    Si X no tiene rango completo se usa la pseudoinversa (como statsmodels).
+    """
+    from scipy import stats
+    from scipy.linalg import solve_triangular
+
+    n, p = X.shape
+    Q, R = np.linalg.qr(X)
+    diag = np.abs(np.diag(R))
+    if 0 < p <= n and diag.min() > 1e-10 * diag.max():
+        rank = p
+        beta = solve_triangular(R, Q.T @ y)
+        R_inv = solve_triangular(R, np.eye(p))
+        xtx_inv = R_inv @ R_inv.T
+    else:
+        rank = np.linalg.matrix_rank(X)
+        pinv = np.linalg.pinv(X)
+        beta = pinv @ y
+        xtx_inv = pinv @ pinv.T
+
+    resid = y - X @ beta
+    ssr = float(resid @ resid)
+    df_resid = n - rank
+    sigma2 = ssr / df_resid if df_resid > 0 else np.nan
+    std_err = np.sqrt(np.clip(np.diag(xtx_inv), 0, None) * sigma2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_val = beta / std_err
+    p_val = 2 * stats.t.sf(np.abs(t_val), df_resid) if df_resid > 0 else np.full(p, np.nan)
+    q = stats.t.ppf(0.975, df_resid) if df_resid > 0 else np.nan
+
+    tss = float(((y - y.mean()) ** 2).sum()) if has_const else float(y @ y)
+    r2 = 1 - ssr / tss if tss > 0 else np.nan
+    k_const = int(has_const)
+    r2_adj = 1 - (n - k_const) / df_resid * (1 - r2) if df_resid > 0 else np.nan
+    llf = -n / 2 * (np.log(2 * np.pi) + np.log(ssr / n) + 1) if ssr > 0 else np.inf
+
+    return {
+        "coef": beta, "std_err": std_err, "t": t_val, "p": p_val,
+        "ci_low": beta - q * std_err, "ci_high": beta + q * std_err,
+        "r2": r2, "r2_adj": r2_adj, "df_resid": df_resid, "rank": rank,
+        "llf": llf, "aic": -2 * llf + 2 * rank, "bic": -2 * llf + np.log(n) * rank
+    }
+
+
+def _ols_statsmodels(y: np.ndarray, X: np.ndarray, names: List[str]) -> Dict:
+    """Mismo resultado que _ols_qr vía statsmodels, con diagnósticos adicionales."""
+    from statsmodels.stats.stattools import durbin_watson, jarque_bera
+
+    model = sm.OLS(y, pd.DataFrame(X, columns=names)).fit()
+    ci = model.conf_int().to_numpy()
+    jb_stat, jb_p, _, _ = jarque_bera(model.resid)
+    return {
+        "coef": model.params.to_numpy(), "std_err": model.bse.to_numpy(),
+        "t": model.tvalues.to_numpy(), "p": model.pvalues.to_numpy(),
+        "ci_low": ci[:, 0], "ci_high": ci[:, 1],
+        "r2": model.rsquared, "r2_adj": model.rsquared_adj,
+        "df_resid": model.df_resid, "rank": int(model.df_model) + int(model.k_constant),
+        "llf": model.llf, "aic": model.aic, "bic": model.bic,
+        "diagnostics": {
+            "f_statistic": float(model.fvalue) if model.fvalue is not None else None,
+            "f_pvalue": float(model.f_pvalue) if model.f_pvalue is not None else None,
+            "condition_number": float(model.condition_number),
+            "durbin_watson": float(durbin_watson(model.resid)),
+            "jarque_bera": float(jb_stat),
+            "jarque_bera_pvalue": float(jb_p)
+        }
+    }
+
+
+REGRESSION_MODELS = ("ols", "tobit", "truncated", "simar_wilson")
+
+
+def _bounded_loglik(theta: np.ndarray, y: np.ndarray, X: np.ndarray,
+                    lower: float | None, upper: float | None, model: str):
+    """
+    Log-verosimilitud normal censurada (Tobit) o truncada y su gradiente
+    analítico respecto de θ = (β, log σ), vectorizados por observación.
+    Las razones de Mills se evalúan en escala logarítmica (log_ndtr) para
+    que las colas no produzcan 0/0.
+    """
+    from scipy.special import log_ndtr
+
+    beta, log_sigma = theta[:-1], theta[-1]
+    sigma = np.exp(log_sigma)
+    xb = X @ beta
+    mills = lambda a: np.exp(-0.5 * a * a - 0.5 * np.log(2 * np.pi) - log_ndtr(a))
+
+    ll = np.zeros(len(y))
+    g_xb = np.zeros(len(y))          # ∂ℓ/∂(xβ)
+    g_ls = np.zeros(len(y))          # ∂ℓ/∂log σ
+
+    if model == "tobit":
+        at_upper = (y >= upper) if upper is not None else np.zeros(len(y), bool)
+        at_lower = (y <= lower) if lower is not None else np.zeros(len(y), bool)
+        free = ~(at_upper | at_lower)
+        if at_upper.any():
+            a = (xb[at_upper] - upper) / sigma
+            lam = mills(a)
+            ll[at_upper], g_xb[at_upper], g_ls[at_upper] = log_ndtr(a), lam / sigma, -lam * a
+        if at_lower.any():
+            b = (lower - xb[at_lower]) / sigma
+            lam = mills(b)
+            ll[at_lower], g_xb[at_lower], g_ls[at_lower] = log_ndtr(b), -lam / sigma, -lam * b
+    else:
+        free = np.ones(len(y), bool)
+
+    z = (y[free] - xb[free]) / sigma
+    ll[free] = -0.5 * z * z - 0.5 * np.log(2 * np.pi) - log_sigma
+    g_xb[free] = z / sigma
+    g_ls[free] = z * z - 1
+
+    if model == "truncated":
+        # − log P(lower < y* < upper) con un solo límite activo
+        if upper is not None:
+            u = (upper - xb) / sigma
+            lam = mills(u)
+            ll, g_xb, g_ls = ll - log_ndtr(u), g_xb + lam / sigma, g_ls + lam * u
+        else:
+            v = (xb - lower) / sigma
+            lam = mills(v)
+            ll, g_xb, g_ls = ll - log_ndtr(v), g_xb - lam / sigma, g_ls + lam * v
+
+    return float(ll.sum()), np.append(X.T @ g_xb, g_ls.sum())
+
+
+def _fit_bounded_mle(y: np.ndarray, X: np.ndarray, model: str,
+                     lower: float | None, upper: float | None,
+                     theta0: np.ndarray | None = None):
+    """
+    Maximiza _bounded_loglik con BFGS desde OLS (o desde theta0, p. ej. la
+    estimación original en las réplicas bootstrap); devuelve (θ, llf, convergencia).
+    """
+    from scipy.optimize import minimize
+
+    if theta0 is None:
+        beta0, *_ = np.linalg.lstsq(X, y, rcond=None)
+        resid = y - X @ beta0
+        theta0 = np.append(beta0, np.log(max(resid.std(), 1e-6)))
+    neg = lambda th: tuple(-v for v in _bounded_loglik(th, y, X, lower, upper, model))
+    res = minimize(neg, theta0, jac=True, method="BFGS", options={"gtol": 1e-6})
+    # BFGS suele terminar por "precision loss" ya en el óptimo: se acepta si el gradiente es ~0
+    converged = bool(res.success or np.abs(res.jac).max() < 1e-4)
+    return res.x, -res.fun, converged
+
+
+def _bounded_regression(y: np.ndarray, X: np.ndarray, model: str,
+                        lower: float | None = None, upper: float | None = 1.0,
+                        has_const: bool = True) -> Dict:
+    """
+    Regresión Tobit (censurada en lower/upper) o truncada (un límite) por
+    máxima verosimilitud con gradiente analítico. Devuelve el mismo dict que
+    _ols_qr (t son estadísticos z) más sigma, llf y el nº de observaciones
+    censuradas; r2 es la correlación al cuadrado entre y y xβ. Los errores
+    estándar salen de la inversa del hessiano, obtenido por diferencias
+    centrales del gradiente analítico.
+    """
+    from scipy import stats
+
+    if model == "truncated" and (lower is None) == (upper is None):
+        raise ValueError("La regresión truncada requiere exactamente un límite (lower o upper)")
+    if model == "tobit" and lower is None and upper is None:
+        raise ValueError("Tobit requiere al menos un límite de censura")
+
+    n, k = X.shape
+    # Columnas reescaladas (los insumos hospitalarios van de 1 a 1e7) para
+    # que BFGS converja; coeficientes y covarianza se devuelven a su escala
+    scale = X.std(axis=0)
+    scale = np.where(scale > 0, scale, 1.0)
+    Xs = X / scale
+    theta, llf, converged = _fit_bounded_mle(y, Xs, model, lower, upper)
+
+    # Hessiano por diferencias centrales del gradiente analítico (2·(k+1) evaluaciones)
+    grad = lambda th: _bounded_loglik(th, y, Xs, lower, upper, model)[1]
+    h = 1e-5 * np.maximum(np.abs(theta), 1.0)
+    H = np.column_stack([(grad(theta + e) - grad(theta - e)) / (2 * e[i])
+                         for i, e in enumerate(np.diag(h))])
+    H = (H + H.T) / 2
+    try:
+        cov = np.linalg.inv(-H)
+    except np.linalg.LinAlgError:
+        cov = np.linalg.pinv(-H)
+    beta = theta[:k] / scale
+    std_err = np.sqrt(np.clip(np.diag(cov)[:k], 0, None)) / scale
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = beta / std_err
+    p_val = 2 * stats.norm.sf(np.abs(z))
+    q = stats.norm.ppf(0.975)
+
+    # Pseudo-R²: correlación al cuadrado entre y y el índice latente xβ
+    # (McFadden no sirve con densidades continuas, cuya llf puede ser positiva)
+    n_params = k + 1
+    xb = X @ beta
+    r2 = float(np.corrcoef(y, xb)[0, 1] ** 2) if k > 1 and xb.std() > 0 else np.nan
+    k_const = int(has_const)
+    r2_adj = 1 - (n - k_const) / (n - k) * (1 - r2) if n > k else np.nan
+
+    censored = 0
+    if model == "tobit":
+        censored = int(((y >= upper) if upper is not None else 0).sum()
+                       + ((y <= lower) if lower is not None else np.zeros(0)).sum())
+    return {
+        "coef": beta, "std_err": std_err, "t": z, "p": p_val,
+        "ci_low": beta - q * std_err, "ci_high": beta + q * std_err,
+        "r2": r2, "r2_adj": r2_adj, "df_resid": n - n_params, "rank": n_params,
+        "llf": llf, "aic": -2 * llf + 2 * n_params, "bic": -2 * llf + np.log(n) * n_params,
+        "sigma": float(np.exp(theta[-1])), "converged": converged, "n_censored": censored
+    }
+
+
+# --- doble bootstrap de Simar y Wilson (2007, algoritmo 2) -----
+SIMAR_WILSON_REPS = (100, 1000)
+
+
+def _truncnorm_draws(rng, mean: np.ndarray, sigma: float, lower: float | None,
+                     upper: float | None, n_draws: int) -> np.ndarray:
+    """
+    n_draws réplicas de mean + ε con ε ~ N(0, σ²) truncada para que el
+    resultado quede en (lower, upper); una fila por réplica, vectorizado.
+    """
+    from scipy import stats
+
+    a = -np.inf if lower is None else (lower - mean) / sigma
+    b = np.inf if upper is None else (upper - mean) / sigma
+    eps = stats.truncnorm.rvs(a, b, size=(n_draws, len(mean)), random_state=rng)
+    return mean + sigma * eps
+
+
+def _sw_dea_block(X, Y, theta_hat, theta_star, lo: int, hi: int, rts: str):
+    """
+    Réplicas [lo, hi) del primer bucle: cada DMU original se evalúa contra la
+    frontera de pseudo-datos x* = x·θ̂/θ* (mismos outputs).
+    """
+    X, Y = pool.load(X), pool.load(Y)
+    theta_hat, theta_star = pool.load(theta_hat), pool.load(theta_star)
+    out = np.empty((hi - lo, len(X)))
+    for r, b in enumerate(range(lo, hi)):
+        X_star = X * (theta_hat / theta_star[b])[:, None]
+        out[r] = _envelope_scores(X_star, Y, X, Y, rts, "in", include_self=False)
+    return out
+
+
+def _sw_truncreg_block(Zs, draws, lo: int, hi: int, theta0, upper: float):
+    """Réplicas [lo, hi) del segundo bucle: β de la regresión truncada de cada réplica."""
+    Zs, draws = pool.load(Zs), pool.load(draws)
+    return np.stack([_fit_bounded_mle(draws[b], Zs, "truncated", None, upper, theta0)[0]
+                     for b in range(lo, hi)])
+
+
+def _run_blocks(func, arrays: Dict[str, np.ndarray], n_reps: int, extra: tuple,
+                n_jobs, progress: Callable | None, span: Tuple[float, float], stage: str):
+    """
+    Reparte n_reps réplicas en bloques sobre el pool (arreglos en memoria
+    compartida) e informa el avance a progress(fracción, etapa) dentro de span.
+    """
+    from contextlib import nullcontext
+
+    n_workers = pool.effective_workers(n_jobs)
+    # Al menos ~10 bloques para que el avance se vea aunque no haya pool
+    bounds = pool.chunk_bounds(n_reps, max(n_workers, 5), min_rows=1)
+    ctx = pool.shared_arrays(arrays) if n_workers > 1 else nullcontext(arrays)
+    parts = []
+    with ctx as refs:
+        args = [(*refs.values(), lo, hi, *extra) for lo, hi in bounds]
+        for (_, hi), part in zip(bounds, pool.imap(func, args, n_jobs)):
+            parts.append(part)
+            if progress is not None:
+                progress(span[0] + (span[1] - span[0]) * hi / n_reps, stage)
+    return np.concatenate(parts)
+
+
+def _simar_wilson(X: np.ndarray, Y: np.ndarray, theta_hat: np.ndarray,
+                  Z: np.ndarray, has_const: bool = True, rts: str = "CRS",
+                  reps: Tuple[int, int] = SIMAR_WILSON_REPS, alpha: float = 0.05,
+                  random_state: int = 42, n_jobs: int | None = None,
+                  progress: Callable | None = None) -> Dict:
+    """
+    Doble bootstrap de Simar y Wilson para la segunda etapa DEA (orientación
+    a insumos, puntajes θ ≤ 1, regresión truncada en 1):
+
+      1. Regresión truncada de θ̂ < 1 sobre Z → β̂, σ̂.
+      2. reps[0] réplicas: θ* = Zβ̂ + ε truncado a (0, 1), pseudo-insumos
+         x·θ̂/θ* y DEA de cada hospital contra esa frontera → sesgo de θ̂.
+      3. Regresión truncada de los puntajes corregidos θ̂̂ < 1 → β̂̂, σ̂̂.
+      4. reps[1] réplicas de θ** = Zβ̂̂ + ε truncado en 1, cada una con su
+         regresión truncada → intervalos percentil de β̂̂.
+
+    Las réplicas se sortean vectorizadas en el proceso principal y se reparten
+    por bloques en el pool; los workers comparten X, Y y Z en memoria
+    compartida y reutilizan la plantilla de LP de _envelope_scores. Devuelve
+    el dict de _bounded_regression con errores estándar e intervalos bootstrap.
+    """
+    from scipy import stats
+
+    n_boot1, n_boot2 = reps
+    if n_boot1 < 2 or n_boot2 < 2:
+        raise ValueError("Se requieren al menos 2 réplicas en cada bucle del bootstrap")
+    rng = np.random.default_rng(random_state)
+    below = theta_hat < 1 - 1e-6
+    if below.sum() <= Z.shape[1]:
+        raise ValueError("Muy pocos hospitales ineficientes para la regresión truncada")
+
+    # 1) Primera regresión truncada
+    fit1 = _bounded_regression(theta_hat[below], Z[below], "truncated", upper=1.0, has_const=has_const)
+
+    # 2) Primer bucle: sesgo de los puntajes DEA
+    theta_star = _truncnorm_draws(rng, Z @ fit1["coef"], fit1["sigma"], 0.0, 1.0, n_boot1)
+    theta_star = np.clip(theta_star, 1e-6, None)
+    boot_eff = _run_blocks(_sw_dea_block,
+                           {"X": X, "Y": Y, "theta_hat": theta_hat, "theta_star": theta_star},
+                           n_boot1, (rts,), n_jobs, progress, (0.0, 0.8), "dea")
+    bias = np.nanmean(boot_eff, axis=0) - theta_hat
+    corrected = theta_hat - bias
+
+    # 3) Segunda regresión truncada sobre los puntajes corregidos
+    keep = (corrected > 0) & (corrected < 1)
+    if keep.sum() <= Z.shape[1]:
+        raise ValueError("Muy pocos puntajes corregidos bajo 1 para la regresión truncada")
+    Z2, y2 = Z[keep], corrected[keep]
+    fit2 = _bounded_regression(y2, Z2, "truncated", upper=1.0, has_const=has_const)
+
+    # 4) Segundo bucle: distribución bootstrap de β̂̂ (en la escala interna de Z)
+    scale = Z2.std(axis=0)
+    scale = np.where(scale > 0, scale, 1.0)
+    theta0 = np.append(fit2["coef"] * scale, np.log(fit2["sigma"]))
+    draws = _truncnorm_draws(rng, Z2 @ fit2["coef"], fit2["sigma"], None, 1.0, n_boot2)
+    boot_theta = _run_blocks(_sw_truncreg_block, {"Zs": Z2 / scale, "draws": draws},
+                             n_boot2, (theta0, 1.0), n_jobs, progress, (0.8, 1.0), "regresion")
+    boot_beta = boot_theta[:, :-1] / scale
+
+    coef = fit2["coef"]
+    std_err = boot_beta.std(axis=0, ddof=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = coef / std_err
+    ci_low, ci_high = np.percentile(boot_beta, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    return {
+        **fit2,
+        "std_err": std_err, "t": z, "p": 2 * stats.norm.sf(np.abs(z)),
+        "ci_low": ci_low, "ci_high": ci_high,
+        "n_observations": int(keep.sum()),
+        "bias_corrected": corrected,
+        "mean_bias": float(np.nanmean(bias)),
+        "bootstrap_reps": (int(n_boot1), int(n_boot2))
+    }
+
+
+# --- efectos fijos de panel (within / dos vías) --------------
+PANEL_ESTIMATORS = ("pooled", "within", "twoway")
+
+
+def _group_demean(M: np.ndarray, groups: List[np.ndarray],
+                  tol: float = 1e-10, max_iter: int = 1000) -> np.ndarray:
+    """
+    Resta a cada columna de M sus medias por grupo (códigos 0..G-1), sin armar
+    dummies: medias con bincount por columna. Con dos dimensiones se alternan
+    las proyecciones hasta converger (exacto en una pasada si el panel está
+    balanceado; iterativo si no lo está).
+    """
+    M = np.array(M, dtype=float)
+    counts = [np.bincount(g) for g in groups]
+    for _ in range(max_iter if len(groups) > 1 else 1):
+        prev = M.copy()
+        for g, c in zip(groups, counts):
+            means = np.column_stack([np.bincount(g, weights=col, minlength=len(c)) for col in M.T]) / c[:, None]
+            M -= means[g]
+        if len(groups) == 1 or np.abs(M - prev).max() <= tol * max(1.0, np.abs(prev).max()):
+            break
+    return M
+
+
+def _panel_fe(y: np.ndarray, X: np.ndarray, names: List[str],
+              entity: np.ndarray, time_: np.ndarray, estimator: str) -> Dict:
+    """
+    Efectos fijos por hospital ("within") o por hospital y año ("twoway"):
+    OLS sobre los datos demeaned por grupo y errores estándar robustos por
+    cluster de hospital (corrección G/(G-1)·(N-1)/(N-K), t con G-1 g.l.).
+    Las variables constantes dentro de hospital quedan absorbidas por el
+    efecto fijo y se informan en "dropped". R² es el R² within.
+    """
+    from scipy import stats
+
+    ent, _ = pd.factorize(entity)
+    groups = [ent]
+    if estimator == "twoway":
+        groups.append(pd.factorize(time_)[0])
+    n_entities = int(ent.max()) + 1
+
+    W = _group_demean(np.column_stack([y, X]), groups)
+    y_w, X_w = W[:, 0], W[:, 1:]
+
+    # Regresores absorbidos por los efectos fijos (variación within ~ 0)
+    scale = np.abs(X).max(axis=0)
+    keep = np.abs(X_w).max(axis=0) > 1e-9 * np.where(scale > 0, scale, 1.0)
+    dropped = [nm for nm, k in zip(names, keep) if not k]
+    X_w = X_w[:, keep]
+    n, k = X_w.shape
+    if k == 0:
+        raise ValueError("Todas las variables independientes son constantes dentro de cada hospital")
+
+    beta, *_ = np.linalg.lstsq(X_w, y_w, rcond=None)
+    resid = y_w - X_w @ beta
+    ssr = float(resid @ resid)
+    tss = float(y_w @ y_w)
+
+    # Sándwich con scores sumados por hospital (bincount por columna)
+    bread = np.linalg.pinv(X_w.T @ X_w)
+    scores = X_w * resid[:, None]
+    S = np.column_stack([np.bincount(ent, weights=col, minlength=n_entities) for col in scores.T])
+    G = n_entities
+    c = G / max(G - 1, 1) * (n - 1) / max(n - k, 1)
+    cov = c * bread @ (S.T @ S) @ bread
+    std_err = np.sqrt(np.clip(np.diag(cov), 0, None))
+
+    df_t = max(G - 1, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = beta / std_err
+    p_val = 2 * stats.t.sf(np.abs(t), df_t)
+    q = stats.t.ppf(0.975, df_t)
+
+    absorbed = n_entities + (int(groups[1].max()) if estimator == "twoway" else 0)
+    df_resid = n - k - absorbed
+    r2 = 1 - ssr / tss if tss > 0 else np.nan
+    r2_adj = 1 - (1 - r2) * (n - 1) / df_resid if df_resid > 0 else np.nan
+    llf = -0.5 * n * (np.log(2 * np.pi * ssr / n) + 1) if ssr > 0 else np.nan
+    return {
+        "coef": beta, "std_err": std_err, "t": t, "p": p_val,
+        "ci_low": beta - q * std_err, "ci_high": beta + q * std_err,
+        "r2": r2, "r2_adj": r2_adj, "df_resid": df_resid, "rank": k,
+        "llf": llf, "aic": -2 * llf + 2 * k, "bic": -2 * llf + np.log(n) * k,
+        "names": [nm for nm, kp in zip(names, keep) if kp], "dropped": dropped,
+        "n_entities": n_entities,
+        "n_periods": int(groups[1].max()) + 1 if estimator == "twoway" else None
+    }
+
+
+def _dependent_frame(df: pd.DataFrame, dependent: str, efficiency_method: str,
+                     input_cols: List[str] | None, output_cols: List[str] | None
+                    ) -> Tuple[pd.DataFrame, str, str]:
+    """
+    DataFrame de trabajo, columna dependiente y método: con dependent="eficiencia"
+    calcula SFA o DEA (una sola vez) y usa 'ET SFA' / 'ET DEA' como variable
+    dependiente; si no, usa la columna indicada ("Directo").
     """
     df_work = df.copy()
     
@@ -486,44 +2143,345 @@ def determinant_analysis(df: pd.DataFrame,
             raise ValueError("efficiency_method debe ser 'SFA' o 'DEA'")
         
         # Usar la eficiencia calculada como variable dependiente
-        df_work = df_eff
-        dependent_col = efficiency_col
+        return df_eff, efficiency_col, efficiency_method
         
-    else:
-        # Usar la variable dependiente especificada directamente
-        dependent_col = dependent
-        efficiency_method = "Directo"
+    # Usar la variable dependiente especificada directamente
+    return df_work, dependent, "Directo"
+
+
+def determinant_analysis(df: pd.DataFrame,
+                         dependent: str,
+                         independents: List[str],
+                         efficiency_method: str = "SFA",
+                         input_cols: List[str] = None,
+                         output_cols: List[str] = None,
+                         top_n: int = 5,
+                         add_constant: bool = True,
+                         ols_backend: str = "numpy",
+                         regression: str = "ols",
+                         upper: float = 1.0,
+                         bootstrap_reps: Tuple[int, int] = SIMAR_WILSON_REPS,
+                         random_state: int = 42,
+                         n_jobs: int | None = None,
+                         progress: Callable | None = None,
+                         panel: str = "pooled"
+                        ) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Calcula eficiencia (SFA o DEA) y luego ajusta un modelo OLS, Tobit o
+    truncado para analizar determinantes.
+    
+    Parámetros
+    ----------
+    df               : DataFrame con los datos
+    dependent        : nombre de la columna dependiente (Y) o "eficiencia" para usar SFA/DEA
+    independents     : lista de columnas explicativas (X)
+    efficiency_method: "SFA" o "DEA" (solo se usa si dependent == "eficiencia")
+    input_cols       : columnas de inputs para SFA/DEA (requerido si dependent == "eficiencia")
+    output_cols      : columnas de outputs para SFA/DEA (requerido si dependent == "eficiencia")
+    top_n            : nº de determinantes "clave" a destacar
+    add_constant     : añade intercepto si True
+    ols_backend      : "numpy" (QR directo, por defecto) o "statsmodels"
+                       (mismos coeficientes más diagnósticos en meta["diagnostics"])
+    regression       : "ols", "tobit" (censurado en `upper`: los puntajes
+                       DEA se acumulan en 1) o "truncated" (truncado en
+                       `upper`, solo observaciones < upper, como en la segunda
+                       etapa de Simar y Wilson) o "simar_wilson" (doble
+                       bootstrap sobre la regresión truncada; solo DEA). En
+                       todos se excluyen las eficiencias 0 asignadas a
+                       hospitales inválidos
+    upper            : límite superior de censura o truncamiento
+    bootstrap_reps   : réplicas (primer bucle, segundo bucle) de simar_wilson
+    random_state     : semilla del bootstrap
+    n_jobs           : workers del pool para el bootstrap (None = todo el pool)
+    progress         : callback progress(fracción, etapa) del bootstrap
+    panel            : "pooled" (un OLS sobre todas las filas), "within"
+                       (efectos fijos por hospital) o "twoway" (hospital y
+                       año); los dos últimos requieren las columnas
+                       hospital_id y año, usan OLS y errores robustos por
+                       cluster de hospital, y el intercepto queda absorbido
+    
+    Devuelve
+    --------
+    coef_table : DataFrame con coef, std_err, t, p
+    meta       : dict con r2, r2_adj, aic, bic, top_vars y método usado
+    """
+    if ols_backend not in OLS_BACKENDS:
+        raise ValueError(f"ols_backend debe ser uno de {OLS_BACKENDS}")
+    if regression not in REGRESSION_MODELS:
+        raise ValueError(f"regression debe ser uno de {REGRESSION_MODELS}")
+    if panel not in PANEL_ESTIMATORS:
+        raise ValueError(f"panel debe ser uno de {PANEL_ESTIMATORS}")
+    if panel != "pooled" and (regression != "ols" or ols_backend != "numpy"):
+        raise ValueError("Los efectos fijos de panel solo están disponibles con regression='ols' y ols_backend='numpy'")
+    if panel != "pooled" and not {"hospital_id", "año"} <= set(df.columns):
+        raise ValueError("Los efectos fijos de panel requieren las columnas hospital_id y año")
+    if regression == "simar_wilson" and (dependent != "eficiencia" or efficiency_method.upper() != "DEA"):
+        raise ValueError("simar_wilson requiere dependent='eficiencia' y efficiency_method='DEA'")
+    df_work, dependent_col, efficiency_method = _dependent_frame(
+        df, dependent, efficiency_method, input_cols, output_cols)
     
     # 0) Filtrar filas completas
     df_clean = df_work.dropna(subset=[dependent_col] + independents).copy()
 
+    if regression != "ols":
+        if dependent == "eficiencia":
+            df_clean = df_clean[df_clean[dependent_col] > 0]     # inválidos (ET = 0)
+        if regression == "truncated":
+            df_clean = df_clean[df_clean[dependent_col] < upper]
+
     # 1) Matrices
     y = df_clean[dependent_col].astype(float).to_numpy()
-    X = df_clean[independents].astype(float)
-    if add_constant:
-        X = sm.add_constant(X)
+    if panel != "pooled":
+        # El efecto fijo absorbe el intercepto
+        X, names, has_const = df_clean[independents].to_numpy(float), list(independents), False
+    else:
+        X, names, has_const = _design_matrix(df_clean, independents, add_constant)
     
     # 2) Ajustar modelo
-    model = sm.OLS(y, X).fit()
+    if panel != "pooled":
+        fit = _panel_fe(y, X, names, df_clean["hospital_id"].to_numpy(),
+                        df_clean["año"].to_numpy(), panel)
+        names = fit["names"]
+    elif regression == "simar_wilson":
+        fit = _simar_wilson(df_clean[input_cols].to_numpy(float), df_clean[output_cols].to_numpy(float),
+                            y, X, has_const, reps=bootstrap_reps,
+                            random_state=random_state, n_jobs=n_jobs, progress=progress)
+    elif regression != "ols":
+        fit = _bounded_regression(y, X, regression, upper=upper, has_const=has_const)
+    elif ols_backend == "statsmodels":
+        fit = _ols_statsmodels(y, X, names)
+    else:
+        fit = _ols_qr(y, X, has_const)
     
-    # 3) Tabla de coeficientes
-    coef_table = model.summary2().tables[1]                 # coef, std err, t, P>|t|
-    coef_table.index.name = "variable"
-    coef_table.reset_index(inplace=True)
+    # 3) Tabla de coeficientes (mismas columnas que summary2)
+    coef_table = pd.DataFrame({
+        "variable": names,
+        "Coef.": fit["coef"],
+        "Std.Err.": fit["std_err"],
+        "t": fit["t"],
+        "P>|t|": fit["p"],
+        "[0.025": fit["ci_low"],
+        "0.975]": fit["ci_high"]
+    })
     
     # 4) Variables "clave"  (|coef| grande & p<0.05)
-    sig = coef_table[coef_table["P>|t|"] < 0.05].copy()
-    sig["abs_coef"] = sig["Coef."].abs()
-    sig_sorted = sig.sort_values("abs_coef", ascending=False)
-    top_vars = sig_sorted["variable"].head(top_n).tolist()
+    sig = fit["p"] < 0.05
+    order = np.argsort(-np.abs(fit["coef"][sig]), kind="stable")
+    top_vars = [names[j] for j in np.flatnonzero(sig)[order[:top_n]]]
     
     # 5) Métricas de resumen
     meta = {
-        "r2":      model.rsquared,
-        "r2_adj":  model.rsquared_adj,
+        "r2":      fit["r2"],
+        "r2_adj":  fit["r2_adj"],
+        "aic":     fit["aic"],
+        "bic":     fit["bic"],
         "top_vars": top_vars,
         "method": efficiency_method,
         "dependent_variable": dependent_col,
+        "n_observations": fit.get("n_observations", len(df_clean)),
+        "ols_backend": ols_backend,
+        "regression": regression,
+        "panel": panel
+    }
+    if "diagnostics" in fit:
+        meta["diagnostics"] = fit["diagnostics"]
+    if regression != "ols":
+        meta.update(log_likelihood=fit["llf"], sigma=fit["sigma"],
+                    n_censored=fit["n_censored"], converged=fit["converged"])
+    if panel != "pooled":
+        meta.update(dropped_vars=fit["dropped"], n_entities=fit["n_entities"],
+                    n_periods=fit["n_periods"], cov_type="cluster")
+    if regression == "simar_wilson":
+        ids = df_clean["hospital_id"] if "hospital_id" in df_clean else df_clean.index
+        meta.update(bootstrap_reps=fit["bootstrap_reps"], mean_bias=fit["mean_bias"],
+                    bias_corrected=pd.Series(fit["bias_corrected"], index=ids))
+    return coef_table, meta
+
+
+SEARCH_METHODS = ("exhaustive", "stepwise")
+SEARCH_CRITERIA = ("aic", "bic", "r2_adj")
+
+SCORE_COLUMNS = ["r2", "r2_adj", "aic", "bic"]
+
+# 2^15 = 32 768 modelos; con más candidatos usar method="stepwise" o max_vars
+EXHAUSTIVE_MAX_CANDIDATES = 15
+
+
+def _subset_scorer(y: np.ndarray, X: np.ndarray, has_const: bool):
+    """
+    Prepara la matriz de Gram de los candidatos (estandarizados; centrados si
+    hay intercepto, que así queda implícito) y devuelve (root, expand).
+
+    Un nivel agrupa modelos del mismo tamaño m. Para cada modelo S y cada
+    columna j guarda la varianza residual r_j y la covarianza residual q_j
+    con y tras proyectar sobre S (Gram–Schmidt sobre la matriz de Gram), de
+    modo que el SSR de agregar j es SSR_S − q_j² / r_j y el estado del hijo
+    S ∪ {j} sale de una actualización de rango uno de O(m·p), sin
+    refactorizar. expand(level, allowed) extiende a la vez todos los modelos
+    del nivel con las columnas permitidas (máscara n_modelos × p) y devuelve
+    (nivel hijo, puntajes (n_hijos, 4) = R², R² ajustado, AIC, BIC con las
+    convenciones de _ols_qr, NaN sin grados de libertad). Los colineales
+    (r_j ≈ 0) se descartan.
+    """
+    n, p = X.shape
+    if has_const:
+        X, y = X - X.mean(axis=0), y - y.mean()
+    sd = X.std(axis=0)
+    X = X / np.where(sd > 0, sd, 1.0)
+    G, yy = X.T @ X, float(y @ y)
+    G_diag = np.diag(G)
+    k_const = int(has_const)
+    log_term = np.log(2 * np.pi) + 1 - np.log(n)
+
+    # W = L⁻¹ G[S, :] por modelo (filas de Gram–Schmidt), r y q por columna
+    root = {"subsets": np.zeros((1, 0), dtype=int), "W": np.zeros((1, 0, p)),
+            "r": G_diag[None, :].copy(), "q": (X.T @ y)[None, :], "ssr": np.array([yy])}
+
+    def expand(level, allowed):
+        r, q = level["r"], level["q"]
+        ok = allowed & (G_diag > 0) & (r > 1e-10 * G_diag)
+        s_idx, j_idx = np.nonzero(ok)
+        r_j, q_j = r[s_idx, j_idx], q[s_idx, j_idx]
+        ssr = level["ssr"][s_idx] - q_j ** 2 / r_j
+
+        m = level["subsets"].shape[1]
+        k = m + 1 + k_const
+        df_resid = n - k
+        scores = np.full((len(s_idx), 4), np.nan)
+        valid = ssr > 1e-12 * yy
+        if df_resid > 0 and valid.any():
+            sv = ssr[valid]
+            r2 = 1 - sv / yy
+            neg2llf = n * (np.log(sv) + log_term)
+            scores[valid] = np.column_stack([
+                r2, 1 - (n - k_const) / df_resid * (1 - r2),
+                neg2llf + 2 * k, neg2llf + np.log(n) * k])
+
+        # Actualización de rango uno de todos los hijos a la vez
+        d = np.sqrt(r_j)
+        W = level["W"][s_idx]
+        W_j = W[np.arange(len(s_idx)), :, j_idx]                 # (n_hijos, m)
+        w = (G[j_idx] - np.einsum("cm,cmp->cp", W_j, W)) / d[:, None]
+        child = {"subsets": np.column_stack([level["subsets"][s_idx], j_idx]),
+                 "W": np.concatenate([W, w[:, None, :]], axis=1),
+                 "r": r[s_idx] - w * w,
+                 "q": q[s_idx] - w * (q_j / d)[:, None],
+                 "ssr": ssr}
+        return child, scores
+
+    return root, expand
+
+
+def determinant_search(df: pd.DataFrame,
+                       dependent: str,
+                       candidates: List[str],
+                       efficiency_method: str = "DEA",
+                       input_cols: List[str] = None,
+                       output_cols: List[str] = None,
+                       method: str = "exhaustive",
+                       criterion: str = "aic",
+                       max_vars: int | None = None,
+                       top_n: int = 10,
+                       add_constant: bool = True
+                      ) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Búsqueda de modelos de determinantes: calcula la eficiencia una sola vez
+    (como determinant_analysis) y evalúa subconjuntos de `candidates`.
+
+      - 'exhaustive' : todos los subconjuntos de hasta max_vars variables
+                       (a lo más EXHAUSTIVE_MAX_CANDIDATES candidatos)
+      - 'stepwise'   : selección hacia adelante; en cada paso agrega la
+                       variable que más mejora el criterio y se detiene
+                       cuando ninguna lo mejora
+
+    Cada modelo extiende a su padre con una actualización de Cholesky sobre
+    la matriz de Gram precalculada (ver _subset_scorer), sin reajustar.
+
+    Devuelve
+    --------
+    models : top_n modelos ordenados por `criterion` ('aic', 'bic' o 'r2_adj')
+             con variables, n_vars, r2, r2_adj, aic y bic
+    meta   : nº de modelos evaluados, tabla de coeficientes del mejor modelo
+             (OLS por QR) y datos de la variable dependiente
+    """
+    if method not in SEARCH_METHODS:
+        raise ValueError(f"method debe ser uno de {SEARCH_METHODS}")
+    if criterion not in SEARCH_CRITERIA:
+        raise ValueError(f"criterion debe ser uno de {SEARCH_CRITERIA}")
+    if not candidates:
+        raise ValueError("Se necesita al menos una variable candidata")
+    if method == "exhaustive" and len(candidates) > EXHAUSTIVE_MAX_CANDIDATES:
+        raise ValueError(f"La búsqueda exhaustiva admite a lo más {EXHAUSTIVE_MAX_CANDIDATES} "
+                         f"candidatos; use method='stepwise'")
+
+    df_work, dependent_col, efficiency_method = _dependent_frame(
+        df, dependent, efficiency_method, input_cols, output_cols)
+    df_clean = df_work.dropna(subset=[dependent_col] + list(candidates))
+    y = df_clean[dependent_col].to_numpy(dtype=float)
+    X = df_clean[candidates].to_numpy(dtype=float)
+
+    root, expand = _subset_scorer(y, X, add_constant)
+    p = len(candidates)
+    max_vars = p if max_vars is None else min(max_vars, p)
+    col = SCORE_COLUMNS.index(criterion)
+    sign = -1.0 if criterion == "r2_adj" else 1.0      # menor es mejor
+    found_subsets, found_scores = [], []
+
+    level, best_key = root, np.inf
+    for m in range(max_vars):
+        subsets = level["subsets"]
+        if method == "exhaustive":
+            # Cada subconjunto una sola vez: solo columnas posteriores a la última
+            last = subsets[:, -1] if m else np.full(len(subsets), -1)
+            allowed = np.arange(p)[None, :] > last[:, None]
+        else:
+            allowed = np.ones((len(subsets), p), dtype=bool)
+            allowed[np.arange(len(subsets))[:, None], subsets] = False
+        level, scores = expand(level, allowed)
+        if not len(scores):
+            break
+        found_subsets.append(level["subsets"])
+        found_scores.append(scores)
+
+        if method == "stepwise":
+            # Selección hacia adelante: continuar solo con el mejor hijo si mejora
+            keys = sign * scores[:, col]
+            if not np.isfinite(keys).any() or np.nanmin(keys) >= best_key:
+                break
+            i = int(np.nanargmin(keys))
+            best_key = keys[i]
+            level = {name: arr[i:i + 1] for name, arr in level.items()}
+
+    scores = np.vstack(found_scores) if found_scores else np.zeros((0, 4))
+    sizes = np.repeat(np.arange(1, len(found_scores) + 1), [len(sc) for sc in found_scores])
+    keys = sign * scores[:, col]
+    finite = np.flatnonzero(np.isfinite(keys))
+    if not len(finite):
+        raise ValueError("Ningún modelo tiene grados de libertad suficientes")
+
+    top = finite[np.lexsort((sizes[finite], keys[finite]))[:top_n]]
+    offsets = np.cumsum([0] + [len(sc) for sc in found_scores])
+    models = pd.DataFrame(scores[top], columns=SCORE_COLUMNS)
+    models.insert(0, "n_vars", sizes[top])
+    models.insert(0, "variables", [
+        [candidates[j] for j in found_subsets[sizes[i] - 1][i - offsets[sizes[i] - 1]]]
+        for i in top])
+
+    # Tabla de coeficientes del mejor modelo en la escala original
+    best_vars = models.at[0, "variables"]
+    Xb, names, has_const = _design_matrix(df_clean, best_vars, add_constant)
+    fit = _ols_qr(y, Xb, has_const)
+    best_table = pd.DataFrame({"variable": names, "Coef.": fit["coef"],
+                               "Std.Err.": fit["std_err"], "t": fit["t"], "P>|t|": fit["p"]})
+
+    meta = {
+        "method": method,
+        "criterion": criterion,
+        "n_candidates": len(candidates),
+        "n_models_evaluated": int(len(finite)),
+        "best_coefficients": best_table,
+        "efficiency_method": efficiency_method,
+        "dependent_variable": dependent_col,
         "n_observations": len(df_clean)
     }
-    return coef_table, meta
\ No newline at end of file
+    return models, meta
@@ -0,0 +1,110 @@
+"""
+ETags de las respuestas de análisis.
+
+Una respuesta GET depende solo de la ruta, de sus parámetros y de los datos de
+hospitals, así que su ETag es la versión de datos (database/versioning.py) más
+un hash de la ruta y los parámetros normalizados: se toman los parámetros que
+declara el endpoint, con su valor por defecto si no vienen en la URL, de modo
+que /dea?year=2014 y /dea?year=2014&input_cols=<por defecto> comparten ETag.
+
+data_etag es una dependencia de ruta: FastAPI la resuelve antes que get_db y
+los parámetros del endpoint, así que un If-None-Match vigente se responde con
+304 sin abrir sesión ni calcular nada (la versión sale de la caché en memoria).
+Cache-Control permite que un proxy inverso local guarde las respuestas y las
+revalide con el ETag.
+
+La versión de datos sobrevive a los despliegues, así que el ETag incluye
+también la versión de la aplicación (BUILD_VERSION): un release que cambia el
+código de análisis invalida las respuestas guardadas por los clientes.
+"""
+import hashlib
+import inspect
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from fastapi import HTTPException, Request, Response
+from fastapi.params import Depends as DependsParam
+from pydantic.fields import FieldInfo
+from pydantic_core import PydanticUndefined
+
+from database.versioning import current_data_version
+
+# Segundos que un cliente o proxy puede reutilizar la respuesta sin revalidar
+# (0: siempre revalida con If-None-Match, lo que cuesta un 304)
+MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+CACHE_CONTROL = f"public, max-age={MAX_AGE}, must-revalidate"
+
+
+def _source_fingerprint() -> str:
+    """Hash del código del backend (sin tests): cambia con cada release que toca el código."""
+    root = Path(__file__).resolve().parent.parent
+    digest = hashlib.sha1()
+    for path in sorted(root.rglob("*.py")):
+        if "tests" not in path.relative_to(root).parts:
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+# APP_BUILD_VERSION (p. ej. el commit de la imagen) o, si no se define, el hash del código
+BUILD_VERSION = os.getenv("APP_BUILD_VERSION") or _source_fingerprint()
+
+
+@lru_cache(maxsize=None)
+def _query_defaults(endpoint: Callable) -> Tuple[Tuple[str, object], ...]:
+    """Parámetros de consulta del endpoint con su valor por defecto (se omiten dependencias y Request)."""
+    params = []
+    for name, p in inspect.signature(endpoint).parameters.items():
+        default = p.default
+        if isinstance(default, DependsParam) or p.annotation in (Request, Response):
+            continue
+        if isinstance(default, FieldInfo):
+            default = None if default.default is PydanticUndefined else default.default
+        elif default is inspect.Parameter.empty:
+            default = None
+        params.append((name, default))
+    return tuple(params)
+
+
+def _normalize(value) -> str:
+    if value is None:
+        return ""
+    text = ",".join(part.strip() for part in str(value).split(","))
+    return text.lower() if text.lower() in ("true", "false") else text
+
+
+def normalized_params(request: Request) -> List[Tuple[str, str]]:
+    """Parámetros efectivos de la petición (URL o valor por defecto), ordenados por nombre."""
+    endpoint = request.scope.get("endpoint")
+    if endpoint is None:
+        return sorted((k, _normalize(v)) for k, v in request.query_params.items())
+    path_params = request.path_params
+    return sorted((name, _normalize(request.query_params.get(name, default)))
+                  for name, default in _query_defaults(endpoint) if name not in path_params)
+
+
+def make_etag(request: Request, version: int) -> str:
+    """ETag fuerte: versión de datos + hash de la versión de la aplicación, la ruta y los parámetros normalizados."""
+    key = repr((BUILD_VERSION, request.url.path, normalized_params(request)))
+    return f'"v{version}-{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Comparación débil de If-None-Match (RFC 9110): lista de ETags, prefijo W/ o '*'."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def data_etag(request: Request, response: Response):
+    """
+    Dependencia de los GET de datos y análisis: agrega ETag y Cache-Control
+    y, si el cliente ya tiene la versión vigente, corta con 304.
+    """
+    etag = make_etag(request, current_data_version())
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
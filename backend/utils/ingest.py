@@ -0,0 +1,335 @@
+"""
+Ingesta masiva de datos anuales de hospitales (CSV o Parquet).
+
+Reemplaza el flujo de editar db/hospitals.csv y re-ejecutar init.sql (que
+vacía la tabla): el archivo se lee por bloques, cada bloque se valida con
+operaciones vectorizadas de pandas (obligatorios, tipos, finitos, enteros, no
+negativos, rangos, claves duplicadas) y se copia a una tabla temporal de
+staging (COPY en PostgreSQL). Los campos obligatorios son los de
+HospitalResponse: el archivo puede omitir columnas para actualizar registros
+existentes, pero no para insertar (hospital_id, año) nuevos. Si todo el
+archivo es válido se fusiona con hospitals por (hospital_id, año) con
+INSERT ... ON CONFLICT sobre el índice único —actualiza los existentes e
+inserta los nuevos— y se incrementa la versión de datos, todo en una
+transacción; con cualquier error no se modifica nada.
+
+Requiere el esquema de db/init.sql: varios años por hospital_id (la PK es
+id, no hospital_id) y el índice único (año, hospital_id) que usa ON CONFLICT.
+Sobre la tabla que crea Base.metadata.create_all desde el modelo (hospital_id
+como PK) se rechaza con IngestError.
+
+Uso por línea de comandos (desde backend/):
+
+    python -m utils.ingest datos_2024.csv [--format parquet] [--chunksize 5000] [--dry-run]
+"""
+import argparse
+import io
+import json
+import logging
+import sys
+from typing import Dict, Iterator, List
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Float, Integer, inspect, text
+from sqlalchemy.orm import Session
+
+from database import models, schemas
+from database.versioning import bump_data_version, get_data_version, remember, trigger_installed
+
+logger = logging.getLogger(__name__)
+
+INGEST_FORMATS = ("csv", "parquet")
+DEFAULT_CHUNKSIZE = 5000
+MAX_REPORTED_ERRORS = 100
+
+STAGING_TABLE = "hospitals_staging"
+KEY_COLUMNS = ["hospital_id", "año"]
+_KEY_JOIN = " AND ".join(f"h.{k} = s.{k}" for k in KEY_COLUMNS)
+# Campos obligatorios de HospitalResponse: un NULL en ellos rompe las lecturas de /hospitals
+REQUIRED_COLUMNS = [name for name, field in schemas.HospitalResponse.model_fields.items() if field.is_required()]
+
+_TABLE = models.Hospital.__table__
+HOSPITAL_COLUMNS = list(_TABLE.columns.keys())
+NUMERIC_COLUMNS = [c.name for c in _TABLE.columns if isinstance(c.type, (Integer, Float))]
+STRING_LENGTHS = {"hospital_name": 128, "hospital_alternative_name": 64, "region": 128}
+# Identificadores y códigos: deben ser enteros (los volúmenes pueden venir como 184208.0)
+INTEGER_COLUMNS = ["hospital_id", "region_id", "año", "complejidad"]
+# Recursos y producción: no negativos. grdxegresos queda fuera: la fuente usa
+# valores negativos como marca y DEA/SFA ya tratan esos hospitales como inválidos
+NON_NEGATIVE_COLUMNS = ["consultas", "bienesyservicios", "remuneraciones", "diascamadisponibles",
+                        "consultasurgencias", "examenes", "quirofanos", "indiceocupacional",
+                        "indicerotacion", "promediodiasestadia", "letalidad", "egresosfallecidos"]
+RANGES = {"hospital_id": (1, None), "año": (1900, 2100), "complejidad": (0, 3),
+          "latitud": (-90, 90), "longitud": (-180, 180)}
+
+
+class IngestError(ValueError):
+    """Archivo que no se puede ingerir (formato o columnas)."""
+
+
+# --- lectura por bloques ----------------------------------------
+def read_chunks(source, fmt: str = "csv", chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    """Bloques de a lo más chunksize filas; el CSV se lee como texto y los tipos se validan después."""
+    if fmt not in INGEST_FORMATS:
+        raise IngestError(f"Formato no soportado: {fmt}. Use uno de {list(INGEST_FORMATS)}")
+    if fmt == "csv":
+        try:
+            yield from pd.read_csv(source, chunksize=chunksize, dtype=str, skipinitialspace=True)
+        except pd.errors.EmptyDataError:
+            return
+        except pd.errors.ParserError as e:
+            raise IngestError(f"CSV inválido: {e}")
+        return
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise IngestError("La ingesta de Parquet requiere pyarrow (pip install pyarrow)")
+    try:
+        parquet = pq.ParquetFile(source)
+    except Exception as e:
+        raise IngestError(f"Parquet inválido: {e}")
+    for batch in parquet.iter_batches(batch_size=chunksize):
+        yield batch.to_pandas()
+
+
+# --- validación vectorizada --------------------------------------
+def check_schema(db: Session):
+    """IngestError si hospitals no admite la fusión por (hospital_id, año) (ver docstring del módulo)."""
+    inspector = inspect(db.connection())
+    if inspector.get_pk_constraint("hospitals").get("constrained_columns") == ["hospital_id"]:
+        raise IngestError("La ingesta requiere el esquema de db/init.sql: hospital_id es la PK de hospitals "
+                          "y no admite un registro por hospital y año")
+    unique_keys = [ix["column_names"] for ix in inspector.get_indexes("hospitals") if ix["unique"]]
+    unique_keys += [uc["column_names"] for uc in inspector.get_unique_constraints("hospitals")]
+    if not any(set(cols) == set(KEY_COLUMNS) for cols in unique_keys):
+        raise IngestError("La ingesta requiere el índice único idx_hospitals_año_hospital_id (ver db/init.sql)")
+
+
+
+def check_columns(columns: List[str]) -> List[str]:
+    """Columnas del archivo en el orden del modelo; IngestError si faltan claves o sobran columnas."""
+    unknown = [c for c in columns if c not in HOSPITAL_COLUMNS]
+    if unknown:
+        raise IngestError(f"Columnas desconocidas: {unknown}")
+    missing = [c for c in KEY_COLUMNS if c not in columns]
+    if missing:
+        raise IngestError(f"Faltan columnas clave: {missing}")
+    return [c for c in HOSPITAL_COLUMNS if c in columns]
+
+
+def validate_chunk(chunk: pd.DataFrame, offset: int, seen_keys: pd.Index):
+    """
+    Valida un bloque sin recorrer filas: cada regla es una máscara booleana
+    por columna. Devuelve (bloque tipado, errores, claves vistas actualizadas);
+    "fila" en los errores es el número de fila de datos en el archivo (desde 1).
+    """
+    chunk = chunk.reset_index(drop=True)
+    clean = pd.DataFrame(index=chunk.index)
+    masks = []                                   # (máscara, columna, mensaje)
+
+    for col in chunk.columns:
+        raw = chunk[col]
+        blank = raw.isna() | (raw.astype("string").str.strip() == "")
+        if col in REQUIRED_COLUMNS:
+            masks.append((blank, col, "es obligatorio"))
+        if col in NUMERIC_COLUMNS:
+            values = pd.to_numeric(raw, errors="coerce")
+            masks.append((~blank & values.isna(), col, "no es numérico"))
+            infinite = values.notna() & ~np.isfinite(values)
+            masks.append((infinite, col, "no es finito"))
+            fractional = values.notna() & ~infinite & (values % 1 != 0)
+            if col in INTEGER_COLUMNS:
+                masks.append((fractional, col, "no es entero"))
+            if col in NON_NEGATIVE_COLUMNS:
+                masks.append((values < 0, col, "no puede ser negativo"))
+            lo, hi = RANGES.get(col, (None, None))
+            if lo is not None:
+                masks.append((values < lo, col, f"menor que {lo}"))
+            if hi is not None:
+                masks.append((values > hi, col, f"mayor que {hi}"))
+            integral = col in INTEGER_COLUMNS and not (fractional.any() or infinite.any())
+            clean[col] = values.astype("Int64") if integral else values
+        else:
+            values = raw.astype("string").str.strip()
+            if col in STRING_LENGTHS:
+                masks.append((values.str.len() > STRING_LENGTHS[col], col,
+                              f"más de {STRING_LENGTHS[col]} caracteres"))
+            clean[col] = values
+
+    keys = pd.MultiIndex.from_frame(clean[KEY_COLUMNS].astype("float"))
+    masks.append((pd.Series(keys.duplicated() | keys.isin(seen_keys), index=chunk.index),
+                  "hospital_id", "(hospital_id, año) duplicado en el archivo"))
+
+    errors = []
+    for mask, col, msg in masks:
+        rows = np.flatnonzero(mask.fillna(False).to_numpy(dtype=bool))
+        errors.extend({"fila": int(offset + r + 1), "columna": col,
+                       "valor": None if pd.isna(chunk.at[r, col]) else str(chunk.at[r, col]), "error": msg}
+                      for r in rows[:MAX_REPORTED_ERRORS])
+    return clean, errors, seen_keys.append(keys) if len(seen_keys) else keys
+
+
+# --- staging y merge -----------------------------------------------
+def _create_staging(db: Session, columns: List[str]):
+    cols = ", ".join(columns)
+    db.execute(text(f"DROP TABLE IF EXISTS {STAGING_TABLE}"))
+    db.execute(text(f"CREATE TEMPORARY TABLE {STAGING_TABLE} AS SELECT {cols} FROM hospitals WHERE 1 = 0"))
+
+
+def _copy_chunk(db: Session, chunk: pd.DataFrame, columns: List[str]):
+    """Carga el bloque validado en staging: COPY FROM STDIN en PostgreSQL, executemany en otros motores."""
+    cols = ", ".join(columns)
+    if db.get_bind().dialect.name == "postgresql":
+        buf = io.StringIO()
+        chunk[columns].to_csv(buf, header=False, index=False)
+        buf.seek(0)
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {STAGING_TABLE} ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+        finally:
+            cursor.close()
+        return
+    params = ", ".join(f":p{i}" for i in range(len(columns)))
+    records = chunk[columns].astype(object).where(chunk[columns].notna(), None).to_numpy()
+    db.execute(text(f"INSERT INTO {STAGING_TABLE} ({cols}) VALUES ({params})"),
+               [{f"p{i}": v for i, v in enumerate(row)} for row in records])
+
+
+def _missing_required_errors(db: Session, columns: List[str], seen: pd.MultiIndex) -> List[Dict]:
+    """
+    Errores de las filas nuevas (sin (hospital_id, año) en hospitals) cuando el
+    archivo no trae todos los campos obligatorios: las actualizaciones parciales
+    de registros existentes se aceptan, las inserciones no.
+    """
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if not missing:
+        return []
+    keys = db.execute(text(
+        f"SELECT s.hospital_id, s.año FROM {STAGING_TABLE} AS s LEFT JOIN hospitals AS h ON {_KEY_JOIN} "
+        f"WHERE h.{KEY_COLUMNS[0]} IS NULL"
+    )).all()
+    if not keys:
+        return []
+    positions = np.sort(seen.get_indexer(pd.MultiIndex.from_tuples([(float(h), float(a)) for h, a in keys])))
+    return [{"fila": int(pos + 1), "columna": col, "valor": None, "error": "es obligatorio"}
+            for pos in positions for col in missing]
+
+
+def _merge(db: Session, columns: List[str]):
+    """
+    Upsert de staging en hospitals con INSERT ... ON CONFLICT sobre el índice
+    único (año, hospital_id), en una sola sentencia. En PostgreSQL dispara los
+    triggers de INSERT y de UPDATE; el de versión incrementa una sola vez por
+    transacción. Devuelve (actualizadas, insertadas).
+    """
+    total, existing = db.execute(text(
+        f"SELECT COUNT(*), COUNT(h.{KEY_COLUMNS[0]}) FROM {STAGING_TABLE} AS s "
+        f"LEFT JOIN hospitals AS h ON {_KEY_JOIN}"
+    )).one()
+    set_cols = [c for c in columns if c not in KEY_COLUMNS]
+    action = ("DO UPDATE SET " + ", ".join(f"{c} = excluded.{c}" for c in set_cols)) if set_cols else "DO NOTHING"
+    cols = ", ".join(columns)
+    # WHERE true: SQLite exige un WHERE en INSERT ... SELECT ... ON CONFLICT
+    db.execute(text(
+        f"INSERT INTO hospitals ({cols}) SELECT {cols} FROM {STAGING_TABLE} WHERE true "
+        f"ON CONFLICT ({', '.join(KEY_COLUMNS)}) {action}"
+    ))
+    updated = existing if set_cols else 0
+    return updated, total - existing
+
+
+def ingest_file(db: Session, source, fmt: str = "csv", chunksize: int = DEFAULT_CHUNKSIZE,
+                dry_run: bool = False) -> Dict:
+    """
+    Valida y fusiona el archivo en hospitals. Devuelve un resumen con filas,
+    actualizadas, insertadas, errores (los primeros MAX_REPORTED_ERRORS),
+    total_errores y version_datos. Con errores o dry_run no se escribe nada.
+    """
+    columns = None
+    rows = 0
+    errors: List[Dict] = []
+    n_errors = 0
+    seen = pd.MultiIndex.from_arrays([[], []])
+    try:
+        check_schema(db)
+        for chunk in read_chunks(source, fmt, chunksize):
+            if columns is None:
+                columns = check_columns(list(chunk.columns))
+                # También con dry_run: la validación de filas nuevas consulta staging
+                _create_staging(db, columns)
+            chunk = chunk[columns]
+            clean, chunk_errors, seen = validate_chunk(chunk, rows, seen)
+            rows += len(chunk)
+            n_errors += len(chunk_errors)
+            errors.extend(chunk_errors[:MAX_REPORTED_ERRORS - len(errors)])
+            # Tras el primer error solo se sigue validando, para informar todo de una vez
+            if not n_errors:
+                _copy_chunk(db, clean, columns)
+
+        if columns is not None and not n_errors:
+            missing_errors = _missing_required_errors(db, columns, seen)
+            n_errors += len(missing_errors)
+            errors.extend(missing_errors[:MAX_REPORTED_ERRORS - len(errors)])
+
+        summary = {"filas": rows, "actualizadas": 0, "insertadas": 0, "errores": errors,
+                   "total_errores": n_errors, "dry_run": dry_run}
+        if columns is None or n_errors or dry_run:
+            db.rollback()
+            summary["version_datos"] = get_data_version(db)
+            return summary
+
+        updated, inserted = _merge(db, columns)
+        db.execute(text(f"DROP TABLE IF EXISTS {STAGING_TABLE}"))
+        # Con el trigger de versión (PostgreSQL) el merge ya la incrementó, una
+        # vez por transacción; sin él se incrementa aquí. En ambos casos se informa el
+        # valor final confirmado.
+        if (updated or inserted) and not trigger_installed(db):
+            bump_data_version(db)
+        db.commit()
+        version = get_data_version(db)
+        remember(version)
+        summary.update(actualizadas=updated, insertadas=inserted, version_datos=version)
+        logger.info(f"Ingesta: {rows} filas, {updated} actualizadas, {inserted} insertadas, versión {version}")
+        return summary
+    except Exception:
+        db.rollback()
+        raise
+
+
+def main(argv: List[str] | None = None) -> int:
+    """CLI: ingiere un archivo y recalcula los resultados precalculados afectados."""
+    parser = argparse.ArgumentParser(description="Ingesta masiva de datos de hospitales (CSV/Parquet)")
+    parser.add_argument("archivo")
+    parser.add_argument("--format", choices=INGEST_FORMATS, default=None,
+                        help="Formato (por defecto, según la extensión)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Solo validar")
+    parser.add_argument("--no-recompute", action="store_true",
+                        help="No recalcular los resultados precalculados al terminar")
+    args = parser.parse_args(argv)
+
+    from database import database
+    from utils import precompute
+
+    fmt = args.format or ("parquet" if args.archivo.lower().endswith((".parquet", ".pq")) else "csv")
+    db = database.SessionLocal()
+    try:
+        with open(args.archivo, "rb") as f:
+            summary = ingest_file(db, f, fmt, args.chunksize, args.dry_run)
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        if summary["total_errores"]:
+            return 1
+        if not args.dry_run and not args.no_recompute and (summary["actualizadas"] or summary["insertadas"]):
+            print(json.dumps(precompute.recompute_all(db=db), ensure_ascii=False))
+        return 0
+    except IngestError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
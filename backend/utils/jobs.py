@@ -0,0 +1,116 @@
+"""
+Trabajos en segundo plano para análisis largos (p. ej. el doble bootstrap de
+Simar y Wilson).
+
+Cada trabajo corre en un hilo del proceso de la API; el cálculo pesado lo
+reparte la propia función en el pool de procesos (utils/pool.py). La función
+recibe un callback progress(fracción, etapa) y el estado se consulta por id.
+Los trabajos viven en memoria: se conservan los últimos JOBS_MAXSIZE y se
+pierden al reiniciar el servicio.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+JOBS_MAXSIZE = 100
+
+PENDIENTE, EN_CURSO, COMPLETADO, ERROR = "pendiente", "en_curso", "completado", "error"
+
+_LOCK = threading.Lock()
+_JOBS: "OrderedDict[str, Job]" = OrderedDict()
+_EXECUTOR: ThreadPoolExecutor | None = None
+
+
+class Job:
+    """Estado de un trabajo: avance (0..1), etapa, resultado o error."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = PENDIENTE
+        self.progress = 0.0
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    def report(self, fraction: float, stage: str | None = None):
+        """Callback de avance que reciben las funciones de análisis."""
+        self.progress = min(max(float(fraction), 0.0), 1.0)
+        if stage is not None:
+            self.stage = stage
+
+    def to_dict(self) -> Dict:
+        data = {
+            "job_id": self.id,
+            "tipo": self.kind,
+            "estado": self.status,
+            "progreso": round(self.progress, 4),
+            "etapa": self.stage,
+            "segundos": round((self.finished or time.time()) - self.created, 3)
+        }
+        if self.status == COMPLETADO:
+            data["resultado"] = self.result
+        elif self.status == ERROR:
+            data["error"] = self.error
+        return data
+
+
+def _executor() -> ThreadPoolExecutor:
+    """Hilos que ejecutan los trabajos (JOB_WORKERS, por defecto 1: se encolan)."""
+    global _EXECUTOR
+    with _LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=max(1, int(os.getenv("JOB_WORKERS", "1"))),
+                                           thread_name_prefix="job")
+        return _EXECUTOR
+
+
+def _run(job: Job, func: Callable, args, kwargs):
+    job.status = EN_CURSO
+    try:
+        job.result = func(*args, progress=job.report, **kwargs)
+        job.progress, job.status = 1.0, COMPLETADO
+    except Exception as e:
+        logger.error(f"Trabajo {job.kind} {job.id} falló: {e}")
+        job.error, job.status = str(e), ERROR
+    finally:
+        job.finished = time.time()
+
+
+def submit(kind: str, func: Callable, *args, **kwargs) -> Job:
+    """
+    Encola func(*args, progress=..., **kwargs) y devuelve el Job de inmediato.
+    Al superar JOBS_MAXSIZE se descartan los trabajos terminados más antiguos.
+    """
+    job = Job(kind)
+    with _LOCK:
+        _JOBS[job.id] = job
+        finished = [k for k, j in _JOBS.items() if j.status in (COMPLETADO, ERROR)]
+        for k in finished[:max(0, len(_JOBS) - JOBS_MAXSIZE)]:
+            del _JOBS[k]
+    _executor().submit(_run, job, func, args, kwargs)
+    return job
+
+
+def get(job_id: str) -> Job | None:
+    """Trabajo por id (None si no existe o ya fue descartado)."""
+    with _LOCK:
+        return _JOBS.get(job_id)
+
+
+def shutdown():
+    """Espera los trabajos en curso y libera los hilos (al apagar la aplicación)."""
+    global _EXECUTOR
+    with _LOCK:
+        executor, _EXECUTOR = _EXECUTOR, None
+    if executor is not None:
+        executor.shutdown(wait=True)
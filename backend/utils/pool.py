@@ -0,0 +1,205 @@
+"""
+Pool de procesos persistente para los cálculos paralelos (DEA, Malmquist, SFA).
+
+El pool (executor reutilizable de loky) se crea y precalienta al iniciar la
+aplicación, de modo que las peticiones no pagan el arranque de procesos ni la
+importación de numpy/scipy en los workers. Su tamaño sigue la cuota de CPU del
+contenedor (cgroups) y puede fijarse con WORKER_POOL_SIZE.
+
+Las matrices de referencia se publican una vez por petición en memoria
+compartida (archivos .npy en /dev/shm que los workers abren con mmap) y las
+tareas se agrupan en bloques de filas en vez de una por hospital.
+"""
+import logging
+import math
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+from joblib.externals.loky import get_reusable_executor
+
+logger = logging.getLogger(__name__)
+
+_LOCK = threading.Lock()
+_STARTED = False
+
+# Por debajo de este número de filas por tarea no compensa ir al pool
+MIN_CHUNK_ROWS = 8
+
+
+def _read_int(path: str) -> int | None:
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def cpu_quota() -> int:
+    """
+    CPUs disponibles para el proceso: cuota de cgroups v2 (cpu.max) o v1
+    (cfs_quota_us / cfs_period_us), acotada por la afinidad del proceso.
+    """
+    try:
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:
+        available = os.cpu_count() or 1
+
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            max_, period = f.read().split()
+        if max_ != "max":
+            quota = int(max_) / int(period)
+    except (OSError, ValueError):
+        q = _read_int("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        p = _read_int("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if q and p and q > 0:
+            quota = q / p
+
+    if quota is not None:
+        available = min(available, math.ceil(quota))
+    return max(1, available)
+
+
+def pool_size() -> int:
+    """Tamaño del pool: WORKER_POOL_SIZE o, por defecto, la cuota de CPU."""
+    env = os.getenv("WORKER_POOL_SIZE")
+    if env:
+        return max(1, int(env))
+    return cpu_quota()
+
+
+def get_executor():
+    """Executor persistente (se crea si aún no existe; los workers no expiran)."""
+    return get_reusable_executor(max_workers=pool_size(), timeout=None)
+
+
+def _warmup() -> int:
+    import utils.functions  # noqa: F401  importa numpy/scipy/pysfa en el worker
+    return os.getpid()
+
+
+def start_pool() -> int:
+    """Crea y precalienta el pool (una tarea por worker). Devuelve su tamaño."""
+    global _STARTED
+    n = pool_size()
+    with _LOCK:
+        if not _STARTED and n > 1:
+            executor = get_executor()
+            pids = {f.result() for f in [executor.submit(_warmup) for _ in range(n)]}
+            logger.info(f"Pool de workers listo: {n} procesos ({len(pids)} precalentados)")
+        _STARTED = True
+    return n
+
+
+def shutdown_pool():
+    """Detiene el pool (al apagar la aplicación)."""
+    global _STARTED
+    with _LOCK:
+        if _STARTED and pool_size() > 1:
+            get_executor().shutdown(wait=True)
+        _STARTED = False
+
+
+# --- memoria compartida -------------------------------------------
+class SharedArray:
+    """Referencia liviana (ruta + forma) a un arreglo publicado con shared_arrays."""
+    __slots__ = ("path", "shape")
+
+    def __init__(self, path: str, shape: Tuple[int, ...]):
+        self.path, self.shape = path, shape
+
+    def __len__(self):
+        return self.shape[0]
+
+
+# mmaps abiertos por este worker; solo de la publicación en curso (cada
+# shared_arrays usa una carpeta nueva, así que las anteriores ya no se reusan
+# y mantenerlas abiertas retendría páginas de /dev/shm ya borradas)
+_ATTACHED: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_ATTACHED_FOLDER: List[str | None] = [None]
+
+
+def load(ref) -> np.ndarray:
+    """Devuelve el arreglo de una SharedArray (mmap, cacheado por worker) o el propio arreglo."""
+    if not isinstance(ref, SharedArray):
+        return ref
+    folder = os.path.dirname(ref.path)
+    if folder != _ATTACHED_FOLDER[0]:
+        _ATTACHED.clear()
+        _ATTACHED_FOLDER[0] = folder
+    arr = _ATTACHED.get(ref.path)
+    if arr is None:
+        arr = np.load(ref.path, mmap_mode="r")
+        _ATTACHED[ref.path] = arr
+    return arr
+
+
+@contextmanager
+def shared_arrays(arrays: Dict[str, np.ndarray]):
+    """
+    Publica los arreglos en memoria compartida durante el bloque y entrega un
+    dict nombre → SharedArray para enviar a los workers en lugar de los datos.
+    """
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    folder = tempfile.mkdtemp(prefix="panel-eficiencia-", dir=base)
+    try:
+        refs = {}
+        for i, (name, arr) in enumerate(arrays.items()):
+            path = os.path.join(folder, f"{i}.npy")
+            np.save(path, np.ascontiguousarray(arr))
+            refs[name] = SharedArray(path, np.shape(arr))
+        yield refs
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+# --- ejecución en bloques ------------------------------------------
+def chunk_bounds(n_rows: int, n_workers: int, min_rows: int = MIN_CHUNK_ROWS) -> List[Tuple[int, int]]:
+    """Divide n_rows en bloques contiguos (~2 por worker, al menos min_rows filas)."""
+    if n_rows == 0:
+        return []
+    size = max(min_rows, math.ceil(n_rows / (2 * n_workers)))
+    return [(lo, min(lo + size, n_rows)) for lo in range(0, n_rows, size)]
+
+
+def run(func: Callable, args_list: Iterable[Sequence], n_jobs: int | None = None) -> list:
+    """
+    Ejecuta func(*args) para cada elemento de args_list en el pool persistente
+    y devuelve los resultados en orden. Con n_jobs=1 (o pool de 1) se ejecuta
+    en el proceso actual.
+    """
+    return list(imap(func, args_list, n_jobs))
+
+
+def imap(func: Callable, args_list: Iterable[Sequence], n_jobs: int | None = None) -> Iterator:
+    """
+    Como run(), pero entrega cada resultado (en orden) apenas está listo, para
+    reportar avance en trabajos largos. Mantiene a lo más effective_workers(n_jobs)
+    tareas en curso, así que n_jobs limita el paralelismo aunque el pool sea mayor.
+    """
+    args_list = list(args_list)
+    n = effective_workers(n_jobs)
+    if n == 1 or len(args_list) <= 1:
+        for args in args_list:
+            yield func(*args)
+        return
+    executor = get_executor()
+    pending = deque()
+    for args in args_list:
+        if len(pending) >= n:
+            yield pending.popleft().result()
+        pending.append(executor.submit(func, *args))
+    while pending:
+        yield pending.popleft().result()
+
+
+def effective_workers(n_jobs: int | None = None) -> int:
+    """Workers que usará run() para el n_jobs pedido."""
+    return pool_size() if n_jobs is None or n_jobs < 1 else min(n_jobs, pool_size())
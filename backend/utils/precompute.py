@@ -0,0 +1,233 @@
+"""
+Resultados de eficiencia precalculados (tablas efficiency_runs y efficiency_results).
+
+Los datos de hospitales cambian pocas veces al año, pero cada carga del panel
+recalculaba DEA y SFA en vivo. Este módulo calcula las especificaciones
+canónicas (las que usa el frontend por defecto) para cada año y guarda puntajes,
+percentiles y holguras; /dea y /sfa los leen cuando la especificación pedida
+coincide y los datos del año no cambiaron (misma huella), y si no calculan en
+vivo como antes.
+
+recompute_all() es el pipeline: recorre años × especificaciones, omite las que
+siguen vigentes y recalcula el resto. Corre como trabajo en segundo plano
+(utils/jobs.py) al iniciar la aplicación y en POST /efficiency-results/recompute.
+"""
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from database import models
+import utils.functions as utils
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_INPUTS = ["bienesyservicios", "remuneraciones", "diascamadisponibles"]
+
+# Especificaciones calculadas por el pipeline (coinciden con los valores por
+# defecto de /dea y /sfa)
+CANONICAL_SPECS: List[Dict] = [
+    {"method": "DEA", "input_cols": _DEFAULT_INPUTS, "output_cols": ["consultas"], "params": {}},
+    {"method": "SFA", "input_cols": _DEFAULT_INPUTS, "output_cols": ["consultas"], "params": {"n_starts": 1}},
+]
+
+SCORE_COLUMNS = {"DEA": "ET DEA", "SFA": "ET SFA"}
+ALGORITHM_VERSIONS = {"DEA": utils.DEA_ALGORITHM_VERSION, "SFA": utils.SFA_ALGORITHM_VERSION}
+
+
+def make_spec(method: str, input_cols: List[str], output_cols: List[str], **params) -> Dict:
+    """
+    Especificación normalizada de un cálculo de eficiencia. Incluye la versión
+    del algoritmo, de modo que un cambio de código que la incremente cambia
+    spec_hash y los resultados guardados dejan de usarse.
+    """
+    method = method.upper()
+    return {"method": method, "algorithm_version": ALGORITHM_VERSIONS[method],
+            "input_cols": list(input_cols), "output_cols": list(output_cols), "params": params}
+
+
+def spec_hash(spec: Dict) -> str:
+    """Hash estable de la especificación (el orden de inputs/outputs importa: define las holguras)."""
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def data_hash(df: pd.DataFrame, spec: Dict) -> str:
+    """Huella de los datos que usa el cálculo: hospital_id, inputs y outputs, ordenados por hospital."""
+    cols = ["hospital_id"] + spec["input_cols"] + spec["output_cols"]
+    values = df[cols].sort_values("hospital_id").to_numpy(dtype=float)
+    return hashlib.sha1(np.ascontiguousarray(values).tobytes()).hexdigest()
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"{type(obj).__name__} no es serializable")
+
+
+def compute(df: pd.DataFrame, spec: Dict):
+    """Ejecuta el cálculo en vivo de la especificación (lo mismo que /dea o /sfa)."""
+    if spec["method"] == "DEA":
+        return utils.calculate_dea_metrics(df, spec["input_cols"], spec["output_cols"],
+                                           include_slacks=True)
+    return utils.calculate_sfa_metrics(df, spec["input_cols"], spec["output_cols"],
+                                       n_jobs=-1, **spec["params"])
+
+
+def store(db: Session, year: int, spec: Dict, df_out: pd.DataFrame, metrics: Dict, fingerprint: str):
+    """Reemplaza los resultados guardados de (especificación, año) en una transacción."""
+    h = spec_hash(spec)
+    score_col = SCORE_COLUMNS[spec["method"]]
+    slack_cols = [f"slack_{c}" for c in spec["input_cols"] if f"slack_{c}" in df_out]
+
+    slacks = [None] * len(df_out)
+    if slack_cols:
+        values = df_out[slack_cols].to_numpy(float)
+        slacks = [None if np.isnan(row).all() else json.dumps(dict(zip(spec["input_cols"], row.tolist())))
+                  for row in values]
+
+    db.query(models.EfficiencyResult).filter(models.EfficiencyResult.spec_hash == h,
+                                             models.EfficiencyResult.año == year).delete()
+    db.query(models.EfficiencyRun).filter(models.EfficiencyRun.spec_hash == h,
+                                          models.EfficiencyRun.año == year).delete()
+    db.bulk_insert_mappings(models.EfficiencyResult, [
+        {"año": year, "method": spec["method"], "spec_hash": h, "hospital_id": int(hid),
+         "score": float(score), "percentil": int(pct), "slacks": sl}
+        for hid, score, pct, sl in zip(df_out["hospital_id"].to_numpy(), df_out[score_col].to_numpy(),
+                                       df_out["percentil"].to_numpy(), slacks)
+    ])
+    db.add(models.EfficiencyRun(spec_hash=h, año=year, method=spec["method"],
+                                spec=json.dumps(spec, sort_keys=True), data_hash=fingerprint,
+                                metrics=json.dumps(metrics, default=_json_default),
+                                computed_at=datetime.utcnow()))
+    db.commit()
+
+
+def load(db: Session, year: int, spec: Dict, df: pd.DataFrame):
+    """
+    Resultados guardados de (especificación, año) armados como el df_out del
+    cálculo en vivo (válidos primero, en el orden de df, luego inválidos con 0),
+    o None si no existen o los datos del año cambiaron desde el cálculo.
+    """
+    h = spec_hash(spec)
+    try:
+        run = db.query(models.EfficiencyRun).filter(models.EfficiencyRun.spec_hash == h,
+                                                    models.EfficiencyRun.año == year).first()
+        if run is None or run.data_hash != data_hash(df, spec):
+            return None
+        stored = pd.read_sql_query(
+            text("SELECT hospital_id, score, percentil FROM efficiency_results "
+                 "WHERE spec_hash = :h AND año = :year"),
+            db.connection(), params={"h": h, "year": year}
+        ).set_index("hospital_id")
+    except SQLAlchemyError as e:
+        # Sin las tablas (base antigua) o con la BD ocupada se calcula en vivo
+        db.rollback()
+        logger.warning(f"No se pudieron leer resultados precalculados: {e}")
+        return None
+    if stored.index.has_duplicates or not df["hospital_id"].isin(stored.index).all():
+        return None
+
+    score_col = SCORE_COLUMNS[spec["method"]]
+    outputs = spec["output_cols"] if spec["method"] == "DEA" else spec["output_cols"][:1]
+    mask = (df[spec["input_cols"]] > 0).all(axis=1) & (df[outputs] > 0).all(axis=1)
+    df_validos, df_invalidos = df[mask].copy(), df[~mask].copy()
+    row = stored.loc[df_validos["hospital_id"]]
+    df_validos[score_col] = row["score"].to_numpy()
+    df_validos["percentil"] = row["percentil"].to_numpy()
+    if len(df_invalidos) > 0:
+        df_invalidos[score_col] = 0.0
+        df_invalidos["percentil"] = 0
+    df_out = pd.concat([df_validos, df_invalidos], ignore_index=True)
+    return df_out, json.loads(run.metrics)
+
+
+def upgrade_schema(engine) -> bool:
+    """
+    Bases creadas con versiones anteriores de init.sql guardan score como REAL
+    (float4) y redondean los puntajes; en PostgreSQL se pasa a DOUBLE PRECISION.
+    """
+    if engine.dialect.name != "postgresql":
+        return False
+    try:
+        with engine.begin() as conn:
+            current = conn.execute(text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = 'efficiency_results' AND column_name = 'score'")).scalar()
+            if current == "real":
+                conn.execute(text("ALTER TABLE efficiency_results ALTER COLUMN score TYPE DOUBLE PRECISION"))
+                logger.info("efficiency_results.score migrado a DOUBLE PRECISION")
+                return True
+    except SQLAlchemyError as e:
+        logger.warning(f"No se pudo revisar el tipo de efficiency_results.score: {e}")
+    return False
+
+
+def _year_frame(db: Session, year: int, columns: List[str]) -> pd.DataFrame:
+    """hospital_id y las columnas pedidas de un año (SQL directo, columnas validadas contra el modelo)."""
+    valid = set(models.Hospital.__table__.columns.keys())
+    unknown = [c for c in columns if c not in valid]
+    if unknown:
+        raise ValueError(f"Columnas desconocidas en la especificación: {unknown}")
+    result = db.execute(text(f"SELECT hospital_id, {', '.join(columns)} FROM hospitals WHERE año = :year"),
+                        {"year": year})
+    df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+    df[columns] = df[columns].apply(pd.to_numeric, errors="coerce")
+    return df
+
+
+def recompute_all(db: Session | None = None, specs: List[Dict] | None = None,
+                  years: List[int] | None = None, force: bool = False,
+                  progress: Callable | None = None) -> Dict:
+    """
+    Pipeline de recálculo: para cada año con datos y cada especificación
+    canónica, recalcula y guarda solo si cambió la huella de los datos (o con
+    force=True). Sin db abre su propia sesión (uso en segundo plano).
+    """
+    from database import database
+
+    own_session = db is None
+    db = database.SessionLocal() if own_session else db
+    specs = CANONICAL_SPECS if specs is None else specs
+    summary = {"calculados": 0, "vigentes": 0, "errores": []}
+    try:
+        if years is None:
+            years = [r[0] for r in db.execute(text("SELECT DISTINCT año FROM hospitals ORDER BY año"))]
+        total = max(len(years) * len(specs), 1)
+        done = 0
+        for year in years:
+            for spec in specs:
+                spec = make_spec(spec["method"], spec["input_cols"], spec["output_cols"], **spec["params"])
+                try:
+                    df = _year_frame(db, year, spec["input_cols"] + spec["output_cols"])
+                    fingerprint = data_hash(df, spec)
+                    run = db.query(models.EfficiencyRun).filter(
+                        models.EfficiencyRun.spec_hash == spec_hash(spec),
+                        models.EfficiencyRun.año == year).first()
+                    if not force and run is not None and run.data_hash == fingerprint:
+                        summary["vigentes"] += 1
+                    else:
+                        df_out, metrics = compute(df, spec)
+                        store(db, year, spec, df_out, metrics, fingerprint)
+                        summary["calculados"] += 1
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"Recálculo {spec['method']} {year} falló: {e}")
+                    summary["errores"].append(f"{spec['method']} {year}: {e}")
+                done += 1
+                if progress is not None:
+                    progress(done / total, f"{spec['method']} {year}")
+        logger.info(f"Recálculo de eficiencias: {summary['calculados']} calculados, "
+                    f"{summary['vigentes']} vigentes, {len(summary['errores'])} errores")
+        return summary
+    finally:
+        if own_session:
+            db.close()
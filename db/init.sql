@@ -28,6 +28,38 @@ CREATE TABLE IF NOT EXISTS hospitals (
     region VARCHAR(128)
 );
 
+-- Resultados de eficiencia precalculados (los llena el backend en segundo plano;
+-- el backend también las crea al iniciar si no existen)
+CREATE TABLE IF NOT EXISTS efficiency_runs (
+    spec_hash VARCHAR(40),
+    año INTEGER,
+    method VARCHAR(8),
+    spec TEXT,
+    data_hash VARCHAR(40),
+    metrics TEXT,
+    computed_at TIMESTAMP,
+    PRIMARY KEY (spec_hash, año)
+);
+
+CREATE TABLE IF NOT EXISTS efficiency_results (
+    id SERIAL PRIMARY KEY,
+    año INTEGER,
+    method VARCHAR(8),
+    spec_hash VARCHAR(40),
+    hospital_id INTEGER,
+    score DOUBLE PRECISION,
+    percentil INTEGER,
+    slacks TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_efficiency_results_spec ON efficiency_results(spec_hash, año);
+
+-- Metadatos de la aplicación (p. ej. 'data_version', que incrementa la ingesta masiva)
+CREATE TABLE IF NOT EXISTS app_metadata (
+    key VARCHAR(64) PRIMARY KEY,
+    value INTEGER,
+    updated_at TIMESTAMP
+);
+
 -- Limpiar datos existentes
 TRUNCATE TABLE hospitals;
 
@@ -65,6 +97,36 @@ CREATE INDEX IF NOT EXISTS idx_hospitals_hospital_id ON hospitals(hospital_id);
 CREATE INDEX IF NOT EXISTS idx_hospitals_region_id ON hospitals(region_id);
 CREATE INDEX IF NOT EXISTS idx_hospitals_año ON hospitals(año);
 CREATE INDEX IF NOT EXISTS idx_hospitals_complejidad ON hospitals(complejidad);
+-- Un registro por hospital y año: clave de la paginación por cursor de
+-- /hospitals y de la ingesta masiva (se recrea por si existía sin UNIQUE)
+DROP INDEX IF EXISTS idx_hospitals_año_hospital_id;
+CREATE UNIQUE INDEX idx_hospitals_año_hospital_id ON hospitals(año, hospital_id);
+
+-- Versión de datos: cada transacción que modifica hospitals incrementa
+-- app_metadata.data_version una vez y la publica con NOTIFY (canal data_version).
+-- El backend instala el mismo trigger al iniciar (database/versioning.py).
+CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+DECLARE
+    v INTEGER;
+BEGIN
+    -- Una vez por transacción: INSERT ... ON CONFLICT DO UPDATE dispara los
+    -- triggers de INSERT y de UPDATE, y una ingesta no debe contar doble
+    IF current_setting('app.data_version_bumped', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    PERFORM set_config('app.data_version_bumped', 'on', true);
+    INSERT INTO app_metadata (key, value, updated_at) VALUES ('data_version', 1, now())
+    ON CONFLICT (key) DO UPDATE SET value = app_metadata.value + 1, updated_at = now()
+    RETURNING value INTO v;
+    PERFORM pg_notify('data_version', v::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS hospitals_data_version ON hospitals;
+CREATE TRIGGER hospitals_data_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON hospitals
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
 
 -- Mostrar estadísticas de carga
 SELECT 
@@ -44,6 +44,9 @@ import {
   Legend,
   ResponsiveContainer,
   Cell,
+  LineChart,
+  Line,
+  ReferenceLine,
   BarChart,
   Bar,
   PieChart,
@@ -90,6 +93,9 @@ const PcaClusterView = ({ onNavigate }) => {
   const [collapsed, setCollapsed] = useState(false); // Estados específicos de PCA + Clustering
   const [numComponents, setNumComponents] = useState(2);
   const [numClusters, setNumClusters] = useState(null); // null = auto-selección
+  const [criterion, setCriterion] = useState("silhouette"); // criterio para elegir k
+  const [curveKey, setCurveKey] = useState("silhouette"); // curva mostrada en el gráfico
+  const [algorithm, setAlgorithm] = useState("kmeans"); // K-means o Ward (árbol cacheado)
   // Estados para datos del backend
   const [pcaData, setPcaData] = useState(null);
   const [metrics, setMetrics] = useState({});
@@ -172,7 +178,9 @@ const PcaClusterView = ({ onNavigate }) => {
         state.inputcols,
         state.outputcols,
         numComponents,
-        numClusters || "auto"
+        numClusters || "auto",
+        criterion,
+        algorithm
       );
 
       // Actualizar estados locales con los datos recibidos
@@ -180,6 +188,7 @@ const PcaClusterView = ({ onNavigate }) => {
       setMetrics(data.metrics);
       setComponentsMatrix(data.components_matrix);
       setClusterSummary(data.cluster_summary);
+      setCurveKey(data.metrics?.criterion || "silhouette");
       actions.setResultadosPcaCluster(data);
 
       console.log("Datos PCA + Clustering recibidos:", data);
@@ -199,6 +208,19 @@ const PcaClusterView = ({ onNavigate }) => {
     2014, 2015, 2016, 2017, 2018, 2019, 2020, 2021, 2022, 2023,
   ];
 
+  // Criterios para elegir el número de clústeres (coinciden con el backend)
+  const criterionOptions = [
+    { value: "silhouette", label: "Silhouette (máx.)" },
+    { value: "calinski_harabasz", label: "Calinski–Harabasz (máx.)" },
+    { value: "davies_bouldin", label: "Davies–Bouldin (mín.)" },
+    { value: "gap", label: "Estadístico gap" },
+  ];
+  const algorithmOptions = [
+    { value: "kmeans", label: "K-means" },
+    { value: "ward", label: "Jerárquico (Ward)" },
+  ];
+  const kScores = metrics?.k_scores || [];
+
   // Colores para clusters
   const clusterColors = [
     "#1890ff",
@@ -728,6 +750,20 @@ const PcaClusterView = ({ onNavigate }) => {
                   placeholder="Auto"
                 />
               </div>{" "}
+              <Select
+                value={algorithm}
+                onChange={setAlgorithm}
+                options={algorithmOptions}
+                style={{ width: "100%", marginBottom: "16px" }}
+              />
+              {numClusters === null && (
+                <Select
+                  value={criterion}
+                  onChange={setCriterion}
+                  options={criterionOptions}
+                  style={{ width: "100%", marginBottom: "16px" }}
+                />
+              )}
               <div
                 style={{
                   display: "flex",
@@ -1712,6 +1748,66 @@ const PcaClusterView = ({ onNavigate }) => {
                 </div>
               </Col>
             </Row>
+            {/* Curvas de los criterios por k (solo con selección automática) */}
+            {kScores.length > 1 && (
+              <div
+                style={{
+                  background: "#fff",
+                  borderRadius: "8px",
+                  boxShadow: "0 2px 8px rgba(0,0,0,0.1)",
+                  marginTop: "24px",
+                  padding: "20px",
+                }}
+              >
+                <div
+                  style={{
+                    display: "flex",
+                    justifyContent: "space-between",
+                    alignItems: "center",
+                    marginBottom: "12px",
+                  }}
+                >
+                  <Title level={5} style={{ margin: 0 }}>
+                    Selección del número de clústeres
+                  </Title>
+                  <Radio.Group
+                    size="small"
+                    value={curveKey}
+                    onChange={(e) => setCurveKey(e.target.value)}
+                  >
+                    {[
+                      ...criterionOptions.filter(
+                        (opt) => kScores[0][opt.value] !== undefined
+                      ),
+                      { value: "inertia", label: "Inercia (codo)" },
+                    ].map((opt) => (
+                      <Radio.Button key={opt.value} value={opt.value}>
+                        {opt.label}
+                      </Radio.Button>
+                    ))}
+                  </Radio.Group>
+                </div>
+                <ResponsiveContainer width="100%" height={260}>
+                  <LineChart data={kScores}>
+                    <CartesianGrid strokeDasharray="3 3" />
+                    <XAxis dataKey="k" tick={{ fontSize: 12 }} />
+                    <YAxis tick={{ fontSize: 12 }} />
+                    <Tooltip formatter={(value) => formatNumber(value, 3)} />
+                    <ReferenceLine
+                      x={metrics.k_clusters}
+                      stroke="#fa8c16"
+                      strokeDasharray="4 4"
+                    />
+                    <Line
+                      type="monotone"
+                      dataKey={curveKey}
+                      stroke="#1890ff"
+                      dot={{ r: 3 }}
+                    />
+                  </LineChart>
+                </ResponsiveContainer>
+              </div>
+            )}
           </div>
         </Content>
       </Layout>
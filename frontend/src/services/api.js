@@ -118,7 +118,7 @@ class ApiService {
     }
   }
 
-  async fetchPcaClustering(method, year, inputCols, outputCols, nComponents, nClusters) {
+  async fetchPcaClustering(method, year, inputCols, outputCols, nComponents, nClusters, criterion = 'silhouette', algorithm = 'kmeans') {
     try {
       const params = new URLSearchParams({
         method,
@@ -128,6 +128,8 @@ class ApiService {
         n_components: nComponents.toString(),
         scale: 'true',
         random_state: '42',
+        criterion,
+        algorithm,
       });
 
       // Solo agregar k si no es "auto"